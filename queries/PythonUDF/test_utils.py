@@ -0,0 +1,104 @@
+import threading
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import pandas as pd
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeRegressor
+import utils
+from utils import PredictionCache
+
+# python -m pytest -q test_utils.py
+
+@pytest.fixture
+def model_path(tmp_path):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({f'x{i}': rng.normal(size=2000).astype(np.float32) for i in range(2)})
+    pipeline = Pipeline([('preprocessor', ColumnTransformer([('num', 'passthrough', list(data.columns))])),
+                         ('model', DecisionTreeRegressor(max_depth=8, random_state=0))])
+    model = convert_sklearn(pipeline.fit(data, data['x0'] * 2 - data['x1']),
+                            initial_types=[(name, FloatTensorType([None, 1])) for name in data.columns])
+    path = tmp_path / 'model.onnx'
+    onnx.save(model, str(path))
+    # tables are shared by model hash, every test starts from an empty one
+    utils._tables.clear()
+    yield str(path)
+    utils._tables.clear()
+
+def session(model_path: str) -> ort.InferenceSession:
+    return ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+
+def batch(x0, x1):
+    return {'x0': np.array(x0, dtype=np.float32).reshape((-1, 1)), 'x1': np.array(x1, dtype=np.float32).reshape((-1, 1))}
+
+def expected(model_path: str, infer_batch) -> np.ndarray:
+    return session(model_path).run(None, infer_batch)[0]
+
+def test_cached_output_equals_session_run(model_path):
+    cache = PredictionCache(session(model_path), model_path)
+    rng = np.random.default_rng(1)
+    infer_batch = batch(rng.integers(0, 5, 500) / 2, rng.integers(0, 5, 500) / 2)
+    np.testing.assert_array_equal(cache.run(infer_batch), expected(model_path, infer_batch))
+    # the second run is answered from the table
+    np.testing.assert_array_equal(cache.run(infer_batch), expected(model_path, infer_batch))
+    stats = cache.stats()
+    assert stats['misses'] == stats['entries'] == 25
+    assert stats['hits'] == 25
+
+def test_eviction_at_capacity(model_path):
+    cache = PredictionCache(session(model_path), model_path, capacity=3)
+    for x0 in range(6):
+        infer_batch = batch([x0, x0, -x0], [1, 1, 2])
+        np.testing.assert_array_equal(cache.run(infer_batch), expected(model_path, infer_batch))
+        assert len(cache.table) <= 3
+    # the least recently used keys went first, the misses of a batch are put in key order
+    assert list(cache.table.entries) == [(4.0, 1.0), (-5.0, 2.0), (5.0, 1.0)]
+    assert cache.table.get((0.0, 1.0)) is None
+
+def test_nan_keys(model_path):
+    cache = PredictionCache(session(model_path), model_path)
+    infer_batch = batch([np.nan, np.nan, 1, np.nan], [0.5, 0.5, 0.5, np.nan])
+    np.testing.assert_array_equal(cache.run(infer_batch), expected(model_path, infer_batch))
+    assert cache.stats()['distinct_rows'] == 3
+    assert cache.table.get((None, 0.5)) is not None
+    assert cache.table.get((None, None)) is not None
+    # a NaN of the next batch finds the key of the first
+    cache.run(batch([np.nan], [0.5]))
+    assert cache.stats()['hits'] == 1
+
+def test_row_and_distinct_hit_rates(model_path):
+    cache = PredictionCache(session(model_path), model_path)
+    cache.run(batch([1, 1, 2], [0, 0, 0]))
+    cache.run(batch([1, 1, 1, 3], [0, 0, 0, 0]))
+    stats = cache.stats()
+    assert (stats['rows'], stats['distinct_rows'], stats['hits'], stats['misses'], stats['row_hits']) == (7, 4, 1, 3, 3)
+    assert stats['row_hit_rate'] == pytest.approx(3 / 7)
+    assert stats['distinct_hit_rate'] == pytest.approx(1 / 4)
+    assert stats['dedup_rate'] == pytest.approx(3 / 7)
+
+def test_concurrent_runs(model_path):
+    # DuckDB calls the UDF from several threads at once, on a table that keeps evicting
+    cache = PredictionCache(session(model_path), model_path, capacity=8)
+    rng = np.random.default_rng(2)
+    batches = [batch(rng.integers(0, 6, 200), rng.integers(0, 6, 200)) for _ in range(32)]
+    results = [None] * len(batches)
+
+    def run(i: int):
+        results[i] = cache.run(batches[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for infer_batch, result in zip(batches, results):
+        np.testing.assert_array_equal(result, expected(model_path, infer_batch))
+    stats = cache.stats()
+    assert stats['rows'] == 200 * len(batches)
+    assert stats['hits'] + stats['misses'] == stats['distinct_rows']
+    assert stats['entries'] <= 8
@@ -0,0 +1,138 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+# model hash -> cached predictions, shared by every cache built on the same model file
+_tables: Dict[str, 'LRUTable'] = {}
+
+def model_hash(model_path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def canonical(values: np.ndarray) -> list:
+    # NaN != NaN, every NaN becomes the same None key
+    if values.dtype.kind == 'f':
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+class LRUTable:
+    def __init__(self, capacity: int):
+        self.capacity: int = capacity
+        self.entries: OrderedDict = OrderedDict()
+        # DuckDB calls the UDF from its worker threads, and ORT releases the GIL in between
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key, None)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+class PredictionCache:
+    """Memoize session.run on the feature tuple of every row.
+
+    Rows are deduplicated inside each batch with np.unique before anything is
+    looked up, so ORT only sees the distinct tuples that miss the table.
+    With decimals set, float features are rounded before hashing and rows
+    that collapse onto the same key share one prediction.
+    """
+
+    def __init__(self, session, model_path: str, capacity: int = 1 << 20, decimals: 'int | None' = None):
+        self.session = session
+        self.output_name: str = session.get_outputs()[0].name
+        self.decimals: 'int | None' = decimals
+        self.model_hash: str = model_hash(model_path)
+        if self.model_hash not in _tables:
+            _tables[self.model_hash] = LRUTable(capacity)
+        self.table: LRUTable = _tables[self.model_hash]
+
+        self.rows: int = 0
+        self.distinct_rows: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        # rows answered from the table, counting every row a hit key stands for
+        self.row_hits: int = 0
+        self.lock = threading.Lock()
+
+    def quantize(self, column: np.ndarray) -> np.ndarray:
+        if self.decimals is not None and column.dtype.kind == 'f':
+            return np.round(column, self.decimals)
+        return column
+
+    def run(self, infer_batch: Dict[str, np.ndarray]) -> np.ndarray:
+        names = list(infer_batch.keys())
+        columns = [self.quantize(infer_batch[name].reshape(-1)) for name in names]
+        n_rows = columns[0].shape[0]
+
+        # per-column codes first, so mixed numeric/string features dedupe as one int matrix
+        codes = np.empty((n_rows, len(columns)), dtype=np.int64)
+        uniques: List[np.ndarray] = []
+        for i, column in enumerate(columns):
+            unique, inverse = np.unique(column, return_inverse=True)
+            codes[:, i] = inverse.reshape(-1)
+            uniques.append(unique)
+        distinct, first, inverse = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        keys = list(zip(*[canonical(unique[distinct[:, i]]) for i, unique in enumerate(uniques)]))
+        values = [self.table.get(key) for key in keys]
+        missed = [i for i, value in enumerate(values) if value is None]
+
+        if missed:
+            rows = first[missed]
+            miss_batch = {name: infer_batch[name][rows] for name in names}
+            outputs = self.session.run([self.output_name], miss_batch)[0]
+            for i, output in zip(missed, outputs):
+                values[i] = output
+                self.table.put(keys[i], output)
+
+        hit = np.ones(len(keys), dtype=bool)
+        hit[missed] = False
+        row_hits = int(np.bincount(inverse, minlength=len(keys))[hit].sum())
+        with self.lock:
+            self.rows += n_rows
+            self.distinct_rows += len(keys)
+            self.misses += len(missed)
+            self.hits += len(keys) - len(missed)
+            self.row_hits += row_hits
+
+        return np.array(values)[inverse]
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                'rows': self.rows,
+                'distinct_rows': self.distinct_rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'row_hits': self.row_hits,
+                'row_hit_rate': self.row_hits / self.rows if self.rows else 0.0,
+                'distinct_hit_rate': self.hits / self.distinct_rows if self.distinct_rows else 0.0,
+                'dedup_rate': 1 - self.distinct_rows / self.rows if self.rows else 0.0,
+                'entries': len(self.table),
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"cache rows={stats['rows']} distinct={stats['distinct_rows']} hits={stats['hits']} "
+                f"misses={stats['misses']} row_hit_rate={stats['row_hit_rate']:.3f} "
+                f"distinct_hit_rate={stats['distinct_hit_rate']:.3f} "
+                f"dedup_rate={stats['dedup_rate']:.3f} entries={stats['entries']}")
@@ -5,6 +5,14 @@ import duckdb
 import numpy as np
 from duckdb.typing import BIGINT, FLOAT
 import re
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from utils import PredictionCache
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from bench_utils import setup
 
 times = 10
 thread_ort = 1
@@ -23,15 +31,22 @@ parser.add_argument(
     default="bike_sharing_demand_t100_d10_l742_n1483_20250321150638",
 )
 parser.add_argument("--scale", "-s", type=str, default="10G")
-parser.add_argument("--thread", "-t", type=int, default=4)
+# root of {workload}/model/{model}.onnx
+parser.add_argument("--models", type=str, default="/volumn/Retree_exp/workloads")
+# DuckDB threads, default 4 for rf and 1 for dt
+parser.add_argument("--thread", "-t", type=int, default=None)
+# memoize predictions per distinct feature tuple, 0 disables the cache
+parser.add_argument("--cache", "-c", type=int, default=0)
+parser.add_argument("--cache_decimals", "-cd", type=int, default=None)
+# pin DuckDB and ORT threads to these cores, e.g. 4-7; warns when they are not quiet
+parser.add_argument("--cpus", type=str, default=None)
 args = parser.parse_args()
 
 workload = args.workload
 model_name = args.model
 scale = args.scale
-thread_duckdb = args.thread
 
-model_path = f"/volumn/Retree_exp/workloads/{workload}/model/{model_name}.onnx"
+model_path = os.path.join(args.models, workload, "model", f"{model_name}.onnx")
 pattern = "t100"
 model_type = None
 predicates_path = None
@@ -41,13 +56,22 @@ if re.search(pattern, model_name):
 else:
     model_type = "dt"
     predicates_path = "predicates-dt.txt"
-    thread_duckdb = 1
-  
+thread_duckdb = args.thread if args.thread is not None else (4 if model_type == "rf" else 1)
+
+# before ORT and DuckDB start their threads, which inherit the affinity
+environment = setup(args.cpus)
+cpu_environment = f"\"{environment['cpus']}\",{environment['governor']}"
+
 op = ort.SessionOptions()
 op.intra_op_num_threads = thread_ort
 session = ort.InferenceSession(
     model_path, sess_options=op, providers=["CPUExecutionProvider"]
 )
+cache = (
+    PredictionCache(session, model_path, args.cache, args.cache_decimals)
+    if args.cache > 0
+    else None
+)
 
 type_map = {
     "bool": np.int64,
@@ -68,7 +92,10 @@ def predict(hour, atemp, humidity, windspeed, season, holiday, workingday, weath
             .reshape((-1, 1))
             for i, elem in enumerate(columns)
         }
-        outputs = session.run([session.get_outputs()[0].name], infer_batch)
+        if cache is not None:
+            outputs = [cache.run(infer_batch)]
+        else:
+            outputs = session.run([session.get_outputs()[0].name], infer_batch)
         return outputs[0].reshape(-1)
 
     return predict_wrap(
@@ -110,8 +137,11 @@ for predicate in predicates:
     timer.remove(min(timer))
     timer.remove(max(timer))
     average = sum(timer) / len(timer)
-    print(f"{workload},{model_name},{model_type},{predicate},{scale},{thread_duckdb},0,{average}")
+    print(f"{workload},{model_name},{model_type},{predicate},{scale},{thread_duckdb},0,{average},{cpu_environment}")
     with open(f"output.csv", "a", encoding="utf-8") as f:
-        f.write(f"{workload},{model_name},{model_type},{predicate},{scale},{thread_duckdb},0,{average}\n")
+        f.write(f"{workload},{model_name},{model_type},{predicate},{scale},{thread_duckdb},0,{average},{cpu_environment}\n")
     # only run one predicate
-    break
\ No newline at end of file
+    break
+
+if cache is not None:
+    print(cache.report())
@@ -1,5 +1,6 @@
 #include "duckdb.hpp"
 
+#include <algorithm>
 #include <chrono>
 #include <cstdio>
 #include <cstdlib>
@@ -8,6 +9,7 @@
 #include <fstream>
 #include <getopt.h>
 #include <iostream>
+#include <map>
 #include <memory>
 #include <numeric>
 #include <sstream>
@@ -15,6 +17,7 @@
 #include <string>
 #include <vector>
 #include <regex>
+#include <sched.h>
 
 std::string LOAD_PATH = "/volumn/Retree_exp/queries/Retree/common/";
 std::string SQL_PATH = "/volumn/Retree_exp/queries/Retree/workloads/";
@@ -26,17 +29,28 @@ struct Config
 	std::string model = "nyc-taxi-green-dec-2016_d11_l1491_n2981_20250112085333";
 	std::string model_type = "rf";
 	std::string scale = "1G";
-	std::string thread = "4";
+	// empty: 4 for rf, 1 for dt
+	std::string thread = "";
 	int times = 6;
 	int optimization_level = 3;
 	int debug = 0;
+	// sweep mode: one session over models x levels x threads x predicates
+	int sweep = 0;
+	std::string levels = "1,2,3,4,5,6,7";
+	// cores to pin to, e.g. 4-7; empty keeps the inherited affinity
+	std::string cpus = "";
+	// sweep models as "workload,model" lines; empty reads workload_models.csv
+	std::string models_file = "";
+	// where DuckDB spills and how much memory it may use first, e.g. 8GB; empty keeps its defaults
+	std::string temp_directory = "";
+	std::string memory_limit = "";
 };
 
 Config parse_args(int argc, char *argv[])
 {
 	Config config;
 	int opt;
-	while ((opt = getopt(argc, argv, "t:w:o:m:s:n:d:")) != -1)
+	while ((opt = getopt(argc, argv, "t:w:o:m:s:n:d:x:l:c:f:T:M:")) != -1)
 	{
 		switch (opt)
 		{
@@ -58,9 +72,28 @@ Config parse_args(int argc, char *argv[])
 		case 'd':
 			config.debug = atoi(optarg);
 			break;
+		case 'x':
+			config.sweep = atoi(optarg);
+			break;
+		case 'l':
+			config.levels = optarg;
+			break;
+		case 'c':
+			config.cpus = optarg;
+			break;
+		case 'f':
+			config.models_file = optarg;
+			break;
+		case 'T':
+			config.temp_directory = optarg;
+			break;
+		case 'M':
+			config.memory_limit = optarg;
+			break;
 		default:
 			std::cerr << "Usage: " << argv[0]
-					  << " [-w workloads] [-m model] [-s scale] [-t threads] [-o optimization_level] [-d debug]\n";
+					  << " [-w workloads] [-m model] [-s scale] [-t threads] [-o optimization_level] [-d debug]"
+					  << " [-x sweep] [-l levels] [-c cpus] [-f models_file] [-T temp_directory] [-M memory_limit]\n";
 			exit(EXIT_FAILURE);
 		}
 	}
@@ -105,53 +138,199 @@ std::string replacePlaceholder(std::string str, const std::string &from, const s
 	return str;
 }
 
-void run(const Config &config)
+std::vector<std::string> split(const std::string &str, char delimiter)
 {
-	std::string sql_path = SQL_PATH + config.workload + "/";
-	std::ofstream outputfile;
-	outputfile.open(sql_path + "output.csv", std::ios::app);
+	std::vector<std::string> items;
+	std::stringstream ss(str);
+	std::string item;
+	while (std::getline(ss, item, delimiter))
+	{
+		if (!item.empty())
+		{
+			items.push_back(item);
+		}
+	}
+	return items;
+}
 
-	duckdb::DBConfig db_config;
-	db_config.options.allow_unsigned_extensions = true;
-	db_config.options.allow_extensions_metadata_mismatch = true;
-	duckdb::DuckDB db(nullptr, &db_config);
-	duckdb::Connection con(db);
+// workload_models.csv: one "workload,model" per line
+std::vector<std::string> read_workload_models(const std::string &filename, const std::string &workload)
+{
+	std::ifstream file(filename);
+	if (!file.is_open())
+	{
+		throw std::runtime_error("Unable to open workload models file: " + filename);
+	}
+	std::vector<std::string> models;
+	std::string line;
+	while (std::getline(file, line))
+	{
+		auto items = split(line, ',');
+		if (items.size() >= 2 && items[0] == workload)
+		{
+			models.push_back(items[1]);
+		}
+	}
+	return models;
+}
 
-	con.Query("PRAGMA disable_verification;");
-	con.Query("set allow_extensions_metadata_mismatch=true;");
-	con.Query(read_file(LOAD_PATH + "load_inference_function.sql"));
+std::string get_model_type(const std::string &model)
+{
+	std::regex rf_pattern("t100");
+	return regex_search(model, rf_pattern) ? "rf" : "dt";
+}
 
-	switch (config.optimization_level)
+// 0-3,8 -> this process and the DuckDB threads it starts later run on cores 0, 1, 2, 3 and 8
+void pin_cpus(const std::string &cpus)
+{
+	cpu_set_t set;
+	CPU_ZERO(&set);
+	for (const auto &part : split(cpus, ','))
+	{
+		size_t dash = part.find('-');
+		int first = atoi(part.substr(0, dash).c_str());
+		int last = dash == std::string::npos ? first : atoi(part.substr(dash + 1).c_str());
+		for (int cpu = first; cpu <= last; cpu++)
+		{
+			CPU_SET(cpu, &set);
+		}
+	}
+	if (sched_setaffinity(0, sizeof(set), &set) != 0)
+	{
+		throw std::runtime_error("Unable to pin to cpus " + cpus + ": " + strerror(errno));
+	}
+}
+
+// the CPU set and frequency governor appended to every result, as bench_utils.py records them:
+// "0-3,8",performance
+std::string cpu_environment()
+{
+	cpu_set_t set;
+	CPU_ZERO(&set);
+	sched_getaffinity(0, sizeof(set), &set);
+	std::string cpus;
+	std::vector<std::string> governors;
+	for (int cpu = 0; cpu < CPU_SETSIZE; cpu++)
+	{
+		if (!CPU_ISSET(cpu, &set) || (cpu > 0 && CPU_ISSET(cpu - 1, &set)))
+		{
+			continue;
+		}
+		int last = cpu;
+		while (last + 1 < CPU_SETSIZE && CPU_ISSET(last + 1, &set))
+		{
+			last++;
+		}
+		cpus += (cpus.empty() ? "" : ",") + std::to_string(cpu) + (last > cpu ? "-" + std::to_string(last) : "");
+		for (int i = cpu; i <= last; i++)
+		{
+			std::ifstream file("/sys/devices/system/cpu/cpu" + std::to_string(i) + "/cpufreq/scaling_governor");
+			std::string governor;
+			if (!(file >> governor))
+			{
+				governor = "unknown";
+			}
+			if (std::find(governors.begin(), governors.end(), governor) == governors.end())
+			{
+				governors.push_back(governor);
+			}
+		}
+	}
+	std::sort(governors.begin(), governors.end());
+	std::string governor;
+	for (const auto &name : governors)
+	{
+		governor += (governor.empty() ? "" : "|") + name;
+	}
+	return "\"" + cpus + "\"," + governor;
+}
+
+// runs sql, exiting non-zero when it fails so a failed query is never timed as a result
+duckdb::unique_ptr<duckdb::MaterializedQueryResult> checked_query(duckdb::Connection &con, const std::string &sql)
+{
+	auto result = con.Query(sql);
+	if (result->HasError())
+	{
+		std::cerr << result->GetError() << "\n";
+		exit(EXIT_FAILURE);
+	}
+	return result;
+}
+
+void configure_memory(duckdb::Connection &con, const Config &config)
+{
+	if (!config.temp_directory.empty())
+	{
+		checked_query(con, "SET temp_directory = '" + config.temp_directory + "';");
+	}
+	if (!config.memory_limit.empty())
+	{
+		checked_query(con, "SET memory_limit = '" + config.memory_limit + "';");
+	}
+}
+
+// loading the data, timed on stderr so output.csv keeps its columns: load_time,<ms>
+void load_data(duckdb::Connection &con, const std::string &data)
+{
+	auto start = std::chrono::high_resolution_clock::now();
+	checked_query(con, data);
+	auto end = std::chrono::high_resolution_clock::now();
+	std::chrono::duration<double, std::milli> duration = end - start;
+	std::cerr << "load_time," << duration.count() << "\n";
+}
+
+// rule extensions loaded for each optimization level, in load order
+std::vector<std::string> level_rules(int optimization_level)
+{
+	switch (optimization_level)
 	{
 	case 1:
-		break;
+		return {};
 	case 2:
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		break;
+		return {"load_convert_rule.sql", "load_prune_rule.sql"};
 	case 3: // merge
 	case 5: // one boundary
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_merge_rule.sql"));
-		break;
+		return {"load_convert_rule.sql", "load_prune_rule.sql", "load_merge_rule.sql"};
 	case 4:
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_naive_merge_rule.sql"));
-		break;
+		return {"load_convert_rule.sql", "load_prune_rule.sql", "load_naive_merge_rule.sql"};
 	case 6:
-		con.Query(read_file(LOAD_PATH + "load_retree_rules_1.sql"));
-		break;
+		return {"load_retree_rules_1.sql"};
 	case 7:
-		con.Query(read_file(LOAD_PATH + "load_retree_rules_2.sql"));
-		break;
+		return {"load_retree_rules_2.sql"};
 	case 8: // clf2reg
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		break;
+		return {"load_convert_rule.sql"};
 	default:
-		break;
+		return {};
 	}
+}
+
+void load_rules(duckdb::Connection &con, int optimization_level)
+{
+	for (const auto &rule : level_rules(optimization_level))
+	{
+		checked_query(con, read_file(LOAD_PATH + rule));
+	}
+}
+
+void run(const Config &config)
+{
+	std::string sql_path = SQL_PATH + config.workload + "/";
+	std::ofstream outputfile;
+	outputfile.open(sql_path + "output.csv", std::ios::app);
+	std::string environment = cpu_environment();
+
+	duckdb::DBConfig db_config;
+	db_config.options.allow_unsigned_extensions = true;
+	db_config.options.allow_extensions_metadata_mismatch = true;
+	duckdb::DuckDB db(nullptr, &db_config);
+	duckdb::Connection con(db);
+
+	checked_query(con, "PRAGMA disable_verification;");
+	checked_query(con, "set allow_extensions_metadata_mismatch=true;");
+	configure_memory(con, config);
+	checked_query(con, read_file(LOAD_PATH + "load_inference_function.sql"));
+
+	load_rules(con, config.optimization_level);
 
 	std::vector<std::string> predicates;
 	if (config.model_type == "rf")
@@ -169,8 +348,8 @@ void run(const Config &config)
 	
 	std::string threads = replacePlaceholder("set threads = ?;", "?", config.thread);
 
-	con.Query(data);
-	con.Query(threads);
+	load_data(con, data);
+	checked_query(con, threads);
 	std::vector<double> records;
 	int count = config.times;
 	for (const auto &predicate : predicates)
@@ -188,7 +367,7 @@ void run(const Config &config)
 		while (count--)
 		{
 			auto start = std::chrono::high_resolution_clock::now();
-			con.Query(sql);
+			checked_query(con, sql);
 			auto end = std::chrono::high_resolution_clock::now();
 			std::chrono::duration<double, std::milli> duration = end - start;
 			records.push_back(duration.count());
@@ -200,9 +379,9 @@ void run(const Config &config)
 		double average = sum / (records.size() - 2);
 
 		outputfile << config.workload << "," << config.model << "," << config.model_type << "," << predicate << "," << config.scale << ","
-				   << config.thread << "," << config.optimization_level << "," << average << "\n";
+				   << config.thread << "," << config.optimization_level << "," << average << "," << environment << "\n";
 		std::cout << config.workload << "," << config.model << "," << config.model_type << "," << predicate << "," << config.scale << ","
-				  << config.thread << "," << config.optimization_level << "," << average << "\n";
+				  << config.thread << "," << config.optimization_level << "," << average << "," << environment << "\n";
 		// for test use
 		// if (config.optimization_level <= 3)
 		// 	break;
@@ -220,42 +399,13 @@ void debug(const Config &config)
 	duckdb::DuckDB db(nullptr, &db_config);
 	duckdb::Connection con(db);
 
-	con.Query("PRAGMA disable_verification;");
-	con.Query("set allow_extensions_metadata_mismatch=true;");
+	checked_query(con, "PRAGMA disable_verification;");
+	checked_query(con, "set allow_extensions_metadata_mismatch=true;");
+	configure_memory(con, config);
 
-	con.Query(read_file(LOAD_PATH + "load_inference_function.sql"));
+	checked_query(con, read_file(LOAD_PATH + "load_inference_function.sql"));
 
-	switch (config.optimization_level)
-	{
-	case 1:
-		break;
-	case 2:
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		break;
-	case 3: // merge
-	case 5: // one boundary
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_merge_rule.sql"));
-		break;
-	case 4:
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_prune_rule.sql"));
-		con.Query(read_file(LOAD_PATH + "load_naive_merge_rule.sql"));
-		break;
-	case 6:
-		con.Query(read_file(LOAD_PATH + "load_retree_rules_1.sql"));
-		break;
-	case 7:
-		con.Query(read_file(LOAD_PATH + "load_retree_rules_2.sql"));
-		break;
-	case 8: // clf2reg
-		con.Query(read_file(LOAD_PATH + "load_convert_rule.sql"));
-		break;
-	default:
-		break;
-	}
+	load_rules(con, config.optimization_level);
 
 	std::string sql_path = SQL_PATH + config.workload + "/";
 	std::vector<std::string> predicates;
@@ -270,11 +420,12 @@ void debug(const Config &config)
 
 	std::ofstream outputfile;
 	outputfile.open(sql_path + "output-debug.csv", std::ios::app);
+	std::string environment = cpu_environment();
 
 	std::string threads = replacePlaceholder("set threads = ?;", "?", config.thread);
-	con.Query(threads);
+	checked_query(con, threads);
 
-	auto result = con.Query(replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale));
+	auto result = checked_query(con, replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale));
 	outputfile << result->ToString() << "\n";
 	for (const auto &predicate : predicates)
 	{
@@ -283,36 +434,161 @@ void debug(const Config &config)
 		sql = replacePlaceholder(sql, "?", predicate);
 
 		auto start = std::chrono::high_resolution_clock::now();
-		auto result = con.Query(sql);
+		auto result = checked_query(con, sql);
 		outputfile << result->ToString() << "\n";
 		auto end = std::chrono::high_resolution_clock::now();
 		std::chrono::duration<double, std::milli> duration = end - start;
 		auto average = duration.count();
 
 		outputfile << config.workload << "," << config.model << "," << config.model_type << "," << predicate << "," << config.scale << ","
-				   << config.thread << "," << config.optimization_level << "," << average << "\n";
+				   << config.thread << "," << config.optimization_level << "," << average << "," << environment << "\n";
 		std::cout << config.workload << "," << config.model << "," << config.model_type << "," << predicate << "," << config.scale << ","
-				  << config.thread << "," << config.optimization_level << "," << average << "\n";
+				  << config.thread << "," << config.optimization_level << "," << average << "," << environment << "\n";
 
 		break;
 	}
 	outputfile.close();
 }
 
+// Keep one database for the whole matrix: data is loaded once and the rule
+// extensions of every requested level are loaded once up front. The optimizer
+// extensions registered by each rule file are recorded and swapped in per level.
+void sweep(const Config &config)
+{
+	std::string sql_path = SQL_PATH + config.workload + "/";
+	std::ofstream outputfile;
+	outputfile.open(sql_path + "output.csv", std::ios::app);
+	std::string environment = cpu_environment();
+
+	std::vector<std::string> models = read_workload_models(
+		config.models_file.empty() ? SQL_PATH + "workload_models.csv" : config.models_file, config.workload);
+	if (models.empty())
+	{
+		models.push_back(config.model);
+	}
+	std::vector<int> levels;
+	for (const auto &level : split(config.levels, ','))
+	{
+		levels.push_back(atoi(level.c_str()));
+	}
+	std::vector<std::string> threads = split(config.thread, ',');
+
+	duckdb::DBConfig db_config;
+	db_config.options.allow_unsigned_extensions = true;
+	db_config.options.allow_extensions_metadata_mismatch = true;
+	duckdb::DuckDB db(nullptr, &db_config);
+	duckdb::Connection con(db);
+
+	checked_query(con, "PRAGMA disable_verification;");
+	checked_query(con, "set allow_extensions_metadata_mismatch=true;");
+	configure_memory(con, config);
+	checked_query(con, read_file(LOAD_PATH + "load_inference_function.sql"));
+
+	auto &optimizer_extensions = duckdb::DBConfig::GetConfig(*db.instance).optimizer_extensions;
+	std::map<std::string, std::vector<duckdb::OptimizerExtension>> rule_extensions;
+	for (int level : levels)
+	{
+		for (const auto &rule : level_rules(level))
+		{
+			if (rule_extensions.count(rule))
+			{
+				continue;
+			}
+			size_t loaded = optimizer_extensions.size();
+			checked_query(con, read_file(LOAD_PATH + rule));
+			rule_extensions[rule].assign(optimizer_extensions.begin() + loaded, optimizer_extensions.end());
+			optimizer_extensions.erase(optimizer_extensions.begin() + loaded, optimizer_extensions.end());
+		}
+	}
+	const std::vector<duckdb::OptimizerExtension> base_extensions = optimizer_extensions;
+
+	std::string data = replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale);
+	data = replacePlaceholder(data, "?", config.scale);
+	data = replacePlaceholder(data, "?", config.scale);
+	load_data(con, data);
+
+	std::vector<double> records;
+	for (int level : levels)
+	{
+		optimizer_extensions = base_extensions;
+		for (const auto &rule : level_rules(level))
+		{
+			const auto &extensions = rule_extensions[rule];
+			optimizer_extensions.insert(optimizer_extensions.end(), extensions.begin(), extensions.end());
+		}
+
+		for (const auto &thread : threads)
+		{
+			checked_query(con, replacePlaceholder("set threads = ?;", "?", thread));
+
+			for (const auto &model : models)
+			{
+				std::string model_type = get_model_type(model);
+				std::vector<std::string> predicates = read_predicates(
+					sql_path + (model_type == "rf" ? "predicates.txt" : "predicates-dt.txt"));
+
+				for (const auto &predicate : predicates)
+				{
+					std::string sql = read_file(sql_path + "query.sql");
+					if (level == 1)
+					{
+						sql = replacePlaceholder(sql, "predict", "forge");
+					}
+					sql = replacePlaceholder(sql, "?", model);
+					sql = replacePlaceholder(sql, "?", predicate);
+
+					records.clear();
+					int count = config.times;
+					while (count--)
+					{
+						auto start = std::chrono::high_resolution_clock::now();
+						checked_query(con, sql);
+						auto end = std::chrono::high_resolution_clock::now();
+						std::chrono::duration<double, std::milli> duration = end - start;
+						records.push_back(duration.count());
+					}
+
+					auto maxminvals =
+						*std::max_element(records.begin(), records.end()) + *std::min_element(records.begin(), records.end());
+					double sum = std::accumulate(records.begin(), records.end(), 0.0) - maxminvals;
+					double average = sum / (records.size() - 2);
+
+					outputfile << config.workload << "," << model << "," << model_type << "," << predicate << "," << config.scale << ","
+							   << thread << "," << level << "," << average << "," << environment << "\n";
+					std::cout << config.workload << "," << model << "," << model_type << "," << predicate << "," << config.scale << ","
+							  << thread << "," << level << "," << average << "," << environment << "\n";
+					if (level <= 1)
+						break;
+				}
+			}
+		}
+	}
+	outputfile.close();
+}
+
 int main(int argc, char *argv[])
 {
 	Config config = parse_args(argc, argv);
+	if (!config.cpus.empty())
+	{
+		pin_cpus(config.cpus);
+	}
 
-	std::regex rf_pattern("t100");
-	if (regex_search(config.model, rf_pattern))
+	if (config.sweep)
 	{
-		config.model_type = "rf";
-		config.thread = "4";
+		// threads and model types come from the sweep matrix, not the model name
+		if (config.thread.empty())
+		{
+			config.thread = "4";
+		}
+		sweep(config);
+		return 0;
 	}
-	else
+
+	config.model_type = get_model_type(config.model);
+	if (config.thread.empty())
 	{
-		config.model_type = "dt";
-		config.thread = "1";
+		config.thread = config.model_type == "rf" ? "4" : "1";
 	}
 
 	config.debug == 0 ? run(config) : debug(config);
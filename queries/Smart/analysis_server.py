@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from gen_dt_predicates import box_rows, derive_predicates, model_type_of, write_predicates
+from onnx_mmap import MappedModel
+from selectivity import Histograms, load_histograms
+from sql_rewrite import format_number, rewrite_workload
+from sql_utils import RetreeDuckDB, write_query
+from utils import derive_feature_intervals, get_feature_names, get_onehot_features, model_attributes, prune_model
+
+# A long-lived analysis server keeping parsed models and histograms warm across the
+# gen_dt_predicates.py / sql_rewrite.py steps of many workloads and thresholds.
+# Requests and responses are JSON lines over a Unix socket, answered as they finish
+# (match them by id):
+#
+#   {"id": 1, "method": "derive_predicates", "params": {"workload": "walmart_sales", "model": "<model>", "threshold": 25000}}
+#   {"id": 1, "result": {"predicates": [["Dept", 41.5, -Infinity], ...], "categorical": [...], "boxes": null}}
+#   {"id": 2, "error": "FileNotFoundError: ..."}
+#
+#   derive_predicates  workload, model, threshold[, boxes=4, write=false]
+#                      write appends the block to workloads/{w}/predicates*.csv as gen_dt_predicates.py does
+#   rewrite            workload, model[, threshold, query, output, min_pruning=0.05]
+#                      the rewritten SQL, also written to workloads/{w}/{output} when given
+#   prune_model        workload, model, threshold[, output]
+#                      the model without the branches the derived intervals decide, written to output
+#                      (default model/{model}-pruned-{threshold}.onnx next to the model)
+#
+# Requests run in a pool of worker processes, each keeping the models and histograms it
+# has opened (reopened when the file changes). Requests writing files of a workload run
+# alone on it; rewrites, which read its predicates*.csv, wait for them and run alongside
+# each other; everything else runs concurrently. Paths are relative to queries/Smart, as
+# for the scripts.
+#
+#   python analysis_server.py serve -s /tmp/retree-analysis.sock -j 4
+#   python analysis_server.py call -s /tmp/retree-analysis.sock -r requests.jsonl
+
+MODELS_PATH = '/volumn/Retree_exp/workloads'
+
+_models: Dict[str, Tuple[Tuple[int, int], MappedModel]] = {}
+_histograms: Dict[str, Tuple['Tuple[int, int] | None', 'Histograms | None']] = {}
+
+def file_key(path: str) -> 'Tuple[int, int] | None':
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def model_path(workload: str, model: str) -> str:
+    return f'{MODELS_PATH}/{workload}/model/{model}.onnx'
+
+def cached_model(workload: str, model: str) -> MappedModel:
+    path = model_path(workload, model)
+    key = file_key(path)
+    if key is None:
+        raise FileNotFoundError(path)
+    if path not in _models or _models[path][0] != key:
+        _models[path] = (key, MappedModel(path))
+    return _models[path][1]
+
+def cached_histograms(workload: str) -> 'Histograms | None':
+    path = f'workloads/{workload}/histograms.json'
+    key = file_key(path)
+    if path not in _histograms or _histograms[path][0] != key:
+        _histograms[path] = (key, load_histograms(path))
+    return _histograms[path][1]
+
+def derive(workload: str, model: str, threshold: float, boxes: int = 4, write: bool = False) -> dict:
+    attributes = cached_model(workload, model)
+    predicates, categorical_filters, derived_boxes = derive_predicates(
+        attributes, model_type_of(workload), threshold, boxes, cached_histograms(workload))
+    if write:
+        write_predicates(workload, threshold, attributes, predicates, categorical_filters, derived_boxes)
+    feature_names = get_feature_names(attributes.model)
+    onehot_features = get_onehot_features(attributes.model)
+    return {
+        'predicates': [[feature_names[p.feature_id], p.lvalue, p.rvalue] for p in predicates],
+        'categorical': [list(row) for row in categorical_filters],
+        'boxes': ([[list(row) for row in box_rows(box, feature_names, onehot_features)] for box in derived_boxes]
+                  if derived_boxes is not None else None),
+    }
+
+def rewrite(workload: str, model: str, threshold: 'float | None' = None, query: 'str | None' = None,
+            output: 'str | None' = None, min_pruning: float = 0.05) -> dict:
+    prefix, rewritten, summary = rewrite_workload(workload, cached_model(workload, model).model, threshold, query,
+                                                  histograms=cached_histograms(workload), min_pruning=min_pruning)
+    if output is not None:
+        write_query(os.path.join(f'workloads/{workload}/', output), prefix, rewritten)
+    return {'sql': prefix + rewritten.sql(dialect=RetreeDuckDB, pretty=True) + ';', 'summary': summary}
+
+def prune(workload: str, model: str, threshold: float, output: 'str | None' = None) -> dict:
+    attributes = cached_model(workload, model)
+    intervals = derive_feature_intervals(attributes, threshold)
+    if intervals is None:
+        raise ValueError(f'no input satisfies the predicate at threshold {threshold}')
+    pruned = prune_model(attributes, intervals)
+    output = output or model_path(workload, f'{model}-pruned-{format_number(float(threshold))}')
+    with open(output, 'wb') as f:
+        f.write(pruned.SerializeToString())
+    return {'output': output, 'nodes': len(attributes.array('nodes_modes')),
+            'pruned_nodes': len(model_attributes(pruned).array('nodes_modes'))}
+
+METHODS: Dict[str, Callable[..., dict]] = {'derive_predicates': derive, 'rewrite': rewrite, 'prune_model': prune}
+
+def writes(method: str, params: dict) -> bool:
+    return (method == 'derive_predicates' and params.get('write', False)) or \
+        (method == 'rewrite' and params.get('output') is not None) or method == 'prune_model'
+
+def reads(method: str, params: dict) -> bool:
+    # rewrite_workload reads the predicates*.csv that derive_predicates with write appends to
+    return method == 'rewrite'
+
+class WorkloadLock:
+    # shared by the requests reading the files of a workload, exclusive for the ones writing
+    # them; waiting writers go before new readers
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    @contextlib.asynccontextmanager
+    async def shared(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.writing and not self.waiting_writers)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.readers -= 1
+                self.condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        async with self.condition:
+            self.waiting_writers += 1
+            try:
+                await self.condition.wait_for(lambda: not self.writing and not self.readers)
+            finally:
+                self.waiting_writers -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+def init_worker(models_path: str):
+    global MODELS_PATH
+    MODELS_PATH = models_path
+
+def call(method: str, params: dict) -> dict:
+    return METHODS[method](**params)
+
+async def serve(socket_path: str, jobs: int, models_path: str):
+    loop = asyncio.get_running_loop()
+    workload_locks: Dict[str, WorkloadLock] = {}
+
+    async def answer(request: dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        response = {'id': request.get('id')}
+        try:
+            if 'invalid' in request:
+                raise ValueError(f"not a JSON request: {request['invalid']}")
+            method, params = request.get('method'), request.get('params', {})
+            if method not in METHODS:
+                raise KeyError(f'unknown method {method}')
+            lock = workload_locks.setdefault(params.get('workload'), WorkloadLock())
+            if writes(method, params):
+                held = lock.exclusive()
+            elif reads(method, params):
+                held = lock.shared()
+            else:
+                held = contextlib.nullcontext()
+            async with held:
+                response['result'] = await loop.run_in_executor(pool, call, method, params)
+        except Exception as e:
+            response['error'] = f'{type(e).__name__}: {e}'
+        async with write_lock:
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    async def connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        pending = set()
+        while line := await reader.readline():
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                request = {'invalid': str(e)}
+            task = asyncio.create_task(answer(request, writer, write_lock))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+        writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # workers start while the loop runs, not forked from it
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(jobs, mp_context=context, initializer=init_worker, initargs=(models_path,)) as pool:
+        server = await asyncio.start_unix_server(connection, path=socket_path, limit=1 << 24)
+        print(f'serving on {socket_path} with {jobs} workers', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+async def request(socket_path: str, requests: List[dict]) -> List[dict]:
+    # sends every request at once, the responses in request order
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=1 << 24)
+    for i, req in enumerate(requests):
+        req.setdefault('id', i)
+        writer.write(json.dumps(req).encode('utf-8') + b'\n')
+    await writer.drain()
+    writer.write_eof()
+    responses = {}
+    while line := await reader.readline():
+        response = json.loads(line)
+        responses[response['id']] = response
+    writer.close()
+    return [responses.get(req['id'], {'id': req['id'], 'error': 'no response'}) for req in requests]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['serve', 'call'])
+    parser.add_argument('--requests', '-r', type=str, default='-', help='JSON lines of requests for call, - for stdin')
+    parser.add_argument('--socket', '-s', type=str, default='/tmp/retree-analysis.sock')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--models', type=str, default=MODELS_PATH, help='root of workloads/{w}/model/{m}.onnx')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.socket, args.jobs, args.models))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with (open(args.requests, 'r', encoding='utf-8') if args.requests != '-' else sys.stdin) as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        for response in asyncio.run(request(args.socket, requests)):
+            print(json.dumps(response))
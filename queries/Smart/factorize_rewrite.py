@@ -0,0 +1,143 @@
+import argparse
+import os
+from typing import Dict, List, Tuple
+
+from sqlglot import exp
+from sql_utils import (RetreeDuckDB, conjuncts, find_predict, predict_arguments, predict_condition,
+                       read_query, read_schema, source_tables, uncommented, write_query)
+
+# When every predict argument comes from dimension tables joined to a single
+# fact table on keys, the model only has to run once per distinct combination
+# of the dimension features reachable from the fact table:
+#
+#   WITH predict_keys AS (SELECT DISTINCT <fact keys> FROM <fact>),
+#        predict_features AS MATERIALIZED (SELECT DISTINCT <arg_i> AS feature_i FROM predict_keys, <dims>
+#                                          WHERE <key joins>),
+#        predict_lookup AS MATERIALIZED (SELECT *, predict(feature_0, ...) AS prediction FROM predict_features)
+#   SELECT ... FROM <fact>, <dims>
+#   WHERE ... AND EXISTS (SELECT 1 FROM predict_lookup WHERE predict_lookup.prediction = ?
+#                         AND predict_lookup.feature_i IS NOT DISTINCT FROM <arg_i>)
+#
+#   python factorize_rewrite.py -w flights
+
+def column_owner(column: exp.Column, tables: Dict[str, str], schema: Dict[str, Dict[str, str]]) -> 'str | None':
+    if column.table:
+        return column.table if column.table in tables else None
+    owners = [alias for alias, name in tables.items() if column.name in schema.get(name, {})]
+    return owners[0] if len(owners) == 1 else None
+
+def qualify(expression: exp.Expression, tables: Dict[str, str], schema: Dict[str, Dict[str, str]]) -> exp.Expression:
+    expression = expression.copy()
+    for column in expression.find_all(exp.Column):
+        if not column.table:
+            column.set('table', exp.to_identifier(column_owner(column, tables, schema)))
+    return expression
+
+def owners_of(expression: exp.Expression, tables: Dict[str, str], schema: Dict[str, Dict[str, str]]) -> 'set | None':
+    owners = set()
+    for column in expression.find_all(exp.Column):
+        owner = column_owner(column, tables, schema)
+        if owner is None:
+            return None
+        owners.add(owner)
+    return owners
+
+def factorize(query: exp.Expression, schema: Dict[str, Dict[str, str]]) -> exp.Expression:
+    predict = find_predict(query)
+    condition = predict_condition(predict)
+    select = predict.find_ancestor(exp.Select)
+    if select.args.get('where') is None or condition.find_ancestor(exp.Select) is not select:
+        raise ValueError('predict is not a WHERE conjunct')
+
+    sources = source_tables(select)
+    if sources is None:
+        raise ValueError('predict is evaluated over a subquery or an outer join')
+    tables = {source.alias_or_name: source.name for source in sources}
+    unknown = [name for name in tables.values() if name not in schema]
+    if unknown:
+        raise ValueError(f'not base tables of load_data.sql: {unknown}')
+
+    dims = set()
+    for arg in predict_arguments(predict):
+        owners = owners_of(arg, tables, schema)
+        if owners is None:
+            raise ValueError(f'cannot resolve the table of {arg.sql(dialect=RetreeDuckDB)}')
+        dims |= owners
+    facts = set(tables) - dims
+    if len(facts) != 1:
+        raise ValueError(f'expected exactly one fact table, found {sorted(facts)}')
+    fact = facts.pop()
+
+    conditions = conjuncts(select.args['where'].this)
+    for join in select.args.get('joins') or []:
+        conditions += conjuncts(join.args.get('on'))
+    conditions = [c for c in conditions if c is not condition]
+
+    # fact key -> dimension columns it joins to
+    keys: List[Tuple[str, exp.Column]] = []
+    dim_conditions = []
+    for c in conditions:
+        owners = owners_of(c, tables, schema)
+        if isinstance(c, exp.EQ) and isinstance(c.left, exp.Column) and isinstance(c.right, exp.Column):
+            left, right = column_owner(c.left, tables, schema), column_owner(c.right, tables, schema)
+            if left == fact and right in dims:
+                keys.append((c.left.name, qualify(c.right, tables, schema)))
+                continue
+            if right == fact and left in dims:
+                keys.append((c.right.name, qualify(c.left, tables, schema)))
+                continue
+        if owners is not None and owners and owners <= dims:
+            dim_conditions.append(qualify(c, tables, schema))
+    joined = {dim_column.table for _, dim_column in keys}
+    if joined != dims:
+        raise ValueError(f'dimension tables without a key join to {fact}: {sorted(dims - joined)}')
+
+    key_columns = list(dict.fromkeys(name for name, _ in keys))
+    keys_sql = f"SELECT DISTINCT {', '.join(f'{fact}.{k}' for k in key_columns)} FROM {tables[fact]} AS {fact}"
+
+    arguments = [qualify(uncommented(arg), tables, schema).sql(dialect=RetreeDuckDB) for arg in predict_arguments(predict)]
+    features_from = ', '.join(['predict_keys'] + [f'{tables[dim]} AS {dim}' for dim in sorted(dims)])
+    features_where = [f'predict_keys.{name} = {dim_column.sql(dialect=RetreeDuckDB)}' for name, dim_column in keys]
+    features_where += [c.sql(dialect=RetreeDuckDB) for c in dim_conditions]
+    features_sql = (f"SELECT DISTINCT {', '.join(f'{arg} AS feature_{i}' for i, arg in enumerate(arguments))} "
+                    f"FROM {features_from} WHERE {' AND '.join(features_where)}")
+
+    # predict over the feature columns, the model path argument stays
+    lookup_predict = predict.copy()
+    path = list(lookup_predict.expressions)[:len(lookup_predict.expressions) - len(arguments)]
+    lookup_predict.set('expressions', path + [exp.column(f'feature_{i}', 'predict_features') for i in range(len(arguments))])
+    lookup_sql = f"SELECT *, {lookup_predict.sql(dialect=RetreeDuckDB)} AS prediction FROM predict_features"
+
+    # the predict condition on the stored prediction; NULL features are a valid model input, match them too
+    lookup_condition = condition.copy()
+    find_predict(lookup_condition).replace(exp.column('prediction', 'predict_lookup'))
+    semi_join = [lookup_condition.sql(dialect=RetreeDuckDB)]
+    semi_join += [f'predict_lookup.feature_{i} IS NOT DISTINCT FROM {arg}' for i, arg in enumerate(arguments)]
+    remaining = conditions + [exp.condition(f"EXISTS (SELECT 1 FROM predict_lookup WHERE {' AND '.join(semi_join)})", dialect=RetreeDuckDB)]
+    select.set('where', exp.Where(this=exp.and_(*remaining)))
+    select.set('joins', [exp.Join(this=join.this) for join in select.args.get('joins') or []])
+
+    query = query.with_('predict_keys', as_=keys_sql, dialect=RetreeDuckDB, copy=False)
+    # both materialized and predict projected rather than filtered, otherwise DuckDB pushes the
+    # predict filter below the DISTINCT and runs it per fact key again
+    query = query.with_('predict_features', as_=features_sql, materialized=True, dialect=RetreeDuckDB, copy=False)
+    query = query.with_('predict_lookup', as_=lookup_sql, materialized=True, dialect=RetreeDuckDB, copy=False)
+    return query
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', '-w', type=str)
+    parser.add_argument('--query', '-q', type=str, default='query.sql')
+    parser.add_argument('--output', '-o', type=str, default='query-factorized.sql')
+    args = parser.parse_args()
+
+    workload_path = f'workloads/{args.workload}/'
+    prefix, query = read_query(os.path.join(workload_path, args.query))
+    schema = read_schema(os.path.join(workload_path, 'load_data.sql'))
+    try:
+        query = factorize(query, schema)
+    except ValueError as e:
+        print(f'{args.workload}: not factorizable, {e}')
+    else:
+        write_query(os.path.join(workload_path, args.output), prefix, query)
+        print(f'{args.workload}: predict evaluated per distinct dimension feature tuple')
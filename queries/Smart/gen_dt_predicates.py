@@ -1,8 +1,12 @@
-import onnx
-import pandas as pd
-from typing import List
+import numpy as np
+from typing import Dict, List, Tuple
 import argparse
-from utils import Node, model2tree
+import csv
+import os
+from onnx_mmap import MappedModel
+from selectivity import load_histograms
+from utils import (Node, derive_boxes, derive_feature_intervals, fold_onehot_interval, get_feature_names, get_onehot_features,
+                   get_tree_intervals, model2tree, model_attributes)
 
 # 1. 选择率越小，效果越好 vs 选择率越极端（越大或越小），效果越好
 # 2. 扩展的纯 SQL vs SQL + ONNX
@@ -22,38 +26,9 @@ class Predicate:
         self.lvalue: float | None = lvalue
         self.rvalue: float | None = rvalue
 
-def get_attribute(model, attr_name):
-    i = 0
-    while 1:
-        attributes = model.graph.node[i].attribute
-        for attr in attributes:
-            if attr.name == attr_name:
-                return attr
-        i += 1        
-
 def get_feature_ids(model):
-    input_nodes_featureids = get_attribute(model, 'nodes_featureids').ints
-    return list(set(input_nodes_featureids))
-
-def get_feature_names(model) -> List:
-    feature_names = []
-    for input in model.graph.input:
-        feature = input.name
-        feature_encoded = []
-        for node in model.graph.node:
-            if node.op_type == 'OneHotEncoder' and node.input[0] == feature:
-                    for attr in node.attribute:
-                        if attr.name == "cats_strings":
-                            encoded_list = [item.decode('utf-8') for item in attr.strings]
-                            feature_encoded.extend(encoded_list)
-                        elif attr.name == "cats_int64s":
-                            encoded_list = [f"{feature}_{item}" for item in attr.ints]
-                            feature_encoded.extend(encoded_list)
-        if len(feature_encoded):
-            feature_names.extend(feature_encoded)
-        else:
-            feature_names.append(feature)
-    return feature_names
+    input_nodes_featureids = model_attributes(model).array('nodes_featureids')
+    return np.unique(input_nodes_featureids).tolist()
 
 def simplify_predicates_disjunction(predicates) -> 'Predicate | None':
     min_value = float('inf')
@@ -122,47 +97,147 @@ def generate_predicates(input_model, root:'Node', f) -> 'List[Predicate | None]'
         # break
     return predicates    
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--workload', '-w', type=str)
-parser.add_argument('--model', '-m', type=str)
-parser.add_argument('--threshold', '-t', type=float)
-args = parser.parse_args()
-
-workload = args.workload
-model_name = args.model
-threshold = args.threshold
-
-model_type = 'reg'
-if workload == "flights" or  workload == "tpcai-uc08" or workload == 'wine_quality':
-    model_type = 'clf'
-
-func = lambda x: x > threshold if model_type == 'reg' else x == threshold
-model_path = None
-
-if model_type == "reg": 
-    model_path = f'/volumn/Retree_exp/workloads/{workload}/model/{model_name}.onnx'
-if model_type == 'clf':
-    model_path = f'/volumn/Retree_exp/workloads/{workload}/model/{model_name}_reg.onnx'
-
-model = onnx.load(model_path)
-feature_names = get_feature_names(model)
-print(f"{workload}: {len(feature_names)}")
-
-root = model2tree(model, None, 0, None, None, None)
-root.parent = None
-
-predicates = generate_predicates(model, root, func)
-effective_predicates = []
-for p in predicates:
-    if p is not None:
-        if p.lvalue == float('inf') and p.rvalue == float('-inf'):
+def fold_onehot_predicates(predicates: 'List[Predicate]', onehot_features: 'Dict[int, Tuple[str, str | int]]') -> 'List[Tuple[str, str, str | int]]':
+    # a one-hot column is 0 or 1, keep the categories whose indicator value the interval allows
+    filters = []
+    for p in predicates:
+        column, category = onehot_features[p.feature_id]
+        op = fold_onehot_interval(p.lvalue, p.rvalue)
+        if op is not None:
+            filters.append((column, op, category))
+    return filters
+
+def box_rows(box: 'Dict[int, Tuple[float, float]]', feature_names: List[str],
+             onehot_features: 'Dict[int, Tuple[str, str | int]]') -> 'List[Tuple[str, str, float | str | int]]':
+    # column,op(<= / >= / in / not in),value rows of one box
+    box_predicates = [Predicate(feature_id, lvalue, rvalue) for feature_id, (lvalue, rvalue) in box.items()]
+    rows = fold_onehot_predicates([p for p in box_predicates if p.feature_id in onehot_features], onehot_features)
+    for p in box_predicates:
+        if p.feature_id in onehot_features:
             continue
-        effective_predicates.append(p)
-
-with open(f"workloads/{workload}/predicates.csv", "a", encoding="utf-8") as f:
-    if len(effective_predicates):
-        for p in effective_predicates:
-            # feature_name,lvalue(<),rvalue(>),predicate
-            f.write(f'{feature_names[p.feature_id]},{p.lvalue},{p.rvalue},{threshold}\n')
+        if p.rvalue != float('-inf'):
+            rows.append((feature_names[p.feature_id], '>=', p.rvalue))
+        if p.lvalue != float('inf'):
+            rows.append((feature_names[p.feature_id], '<=', p.lvalue))
+    return rows
+
+def model_type_of(workload: str) -> str:
+    return 'clf' if workload in ('flights', 'tpcai-uc08', 'wine_quality') else 'reg'
+
+def derive_predicates(attributes, model_type: str, threshold: float, max_boxes: int, histograms=None) \
+        -> 'Tuple[List[Predicate], List[Tuple[str, str, str | int]], List[Dict[int, Tuple[float, float]]] | None]':
+    # range predicates on the numerical features, IN / NOT IN filters on the one-hot inputs and,
+    # for single trees, up to max_boxes boxes of the qualifying leaves (None when there are none)
+    func = lambda x: x > threshold if model_type == 'reg' else x == threshold
+    model = attributes.model
+    feature_names = get_feature_names(model)
+    onehot_features = get_onehot_features(model)
+
+    if model_type == 'reg' and len(get_tree_intervals(attributes)) == 1:
+        root = model2tree(attributes, None, 0, None, None, None)
+        root.parent = None
+        predicates = generate_predicates(attributes, root, func)
     else:
-        f.write(f'None,inf,-inf,{threshold}\n')
+        # class votes and forest sums are bounded over all trees
+        intervals = derive_feature_intervals(attributes, threshold)
+        if intervals is None:
+            print(f"no input satisfies predict {'>' if model_type == 'reg' else '='} {threshold}")
+            intervals = {}
+        predicates = [Predicate(feature_id, lvalue, rvalue) for feature_id, (lvalue, rvalue) in intervals.items()]
+    effective_predicates = []
+    for p in predicates:
+        if p is not None:
+            if p.lvalue == float('inf') and p.rvalue == float('-inf'):
+                continue
+            effective_predicates.append(p)
+
+    # one-hot columns don't exist in SQL, they become IN / NOT IN filters on the original column
+    categorical_filters = fold_onehot_predicates([p for p in effective_predicates if p.feature_id in onehot_features], onehot_features)
+    effective_predicates = [p for p in effective_predicates if p.feature_id not in onehot_features]
+
+    # a single tree keeps the union of its qualifying leaves, up to max_boxes boxes of it are
+    # written next to the hull and ORed by sql_rewrite.py
+    estimate = None
+    if histograms is not None:
+        estimate = lambda box: histograms.box_fraction(box_rows(box, feature_names, onehot_features))
+    boxes = derive_boxes(attributes, threshold, max_boxes, estimate)
+    if boxes is None or len(boxes) <= 1 or not all(boxes):
+        boxes = None
+    return effective_predicates, categorical_filters, boxes
+
+def drop_block(path: str, threshold: float):
+    # the rows of an earlier run at threshold, so writing a block twice replaces it
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    kept = [row for row in rows if row and (row[-1] == 'predicate' or float(row[-1]) != threshold)]
+    if len(kept) != len(rows):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(kept)
+
+def write_predicates(workload: str, threshold: float, attributes, predicates: 'List[Predicate]',
+                     categorical_filters: 'List[Tuple[str, str, str | int]]', boxes: 'List[Dict[int, Tuple[float, float]]] | None',
+                     predicates_file: str = 'predicates.csv', categorical_file: str = 'predicates-cat.csv',
+                     boxes_file: str = 'predicates-dnf.csv'):
+    # writes the block of threshold to the files in workloads/{workload}/, replacing an earlier one
+    feature_names = get_feature_names(attributes.model)
+    onehot_features = get_onehot_features(attributes.model)
+    predicates_path = f"workloads/{workload}/{predicates_file}"
+    categorical_path = f"workloads/{workload}/{categorical_file}"
+    boxes_path = f"workloads/{workload}/{boxes_file}"
+    for path in (predicates_path, categorical_path, boxes_path):
+        drop_block(path, threshold)
+
+    write_header = not os.path.exists(categorical_path)
+    with open(categorical_path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(['column', 'op', 'value', 'predicate'])
+        for column, op, category in categorical_filters:
+            writer.writerow([column, op, category, threshold])
+
+    with open(predicates_path, "a", encoding="utf-8") as f:
+        if len(predicates):
+            for p in predicates:
+                # feature_name,lvalue(<),rvalue(>),predicate
+                f.write(f'{feature_names[p.feature_id]},{p.lvalue},{p.rvalue},{threshold}\n')
+        else:
+            f.write(f'None,inf,-inf,{threshold}\n')
+
+    if boxes is not None:
+        write_header = not os.path.exists(boxes_path)
+        with open(boxes_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(['box', 'column', 'op', 'value', 'predicate'])
+            for box_id, box in enumerate(boxes):
+                for column, op, value in box_rows(box, feature_names, onehot_features):
+                    writer.writerow([box_id, column, op, value, threshold])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', '-w', type=str)
+    parser.add_argument('--model', '-m', type=str)
+    parser.add_argument('--threshold', '-t', type=float)
+    parser.add_argument('--boxes', '-k', type=int, default=4)
+    # output files in workloads/{w}/, as sql_rewrite.py reads them
+    parser.add_argument('--predicates', '-p', type=str, default='predicates.csv')
+    parser.add_argument('--categorical', '-c', type=str, default='predicates-cat.csv')
+    parser.add_argument('--boxes_file', '-b', type=str, default='predicates-dnf.csv')
+    parser.add_argument('--models', type=str, default='/volumn/Retree_exp/workloads', help='root of workloads/{w}/model/{m}.onnx')
+    args = parser.parse_args()
+
+    workload = args.workload
+    # classifiers are analysed as TreeEnsembleClassifier, no clf2reg conversion
+    model_path = os.path.join(args.models, workload, 'model', f'{args.model}.onnx')
+
+    # the ensemble lists are decoded from the mapped file, the graph keeps inputs and encoders
+    attributes = MappedModel(model_path)
+    print(f"{workload}: {len(get_feature_names(attributes.model))}")
+    histograms = load_histograms(f"workloads/{workload}/histograms.json")
+    predicates, categorical_filters, boxes = derive_predicates(attributes, model_type_of(workload), args.threshold, args.boxes, histograms)
+    write_predicates(workload, args.threshold, attributes, predicates, categorical_filters, boxes,
+                     args.predicates, args.categorical, args.boxes_file)
+    if boxes is not None:
+        print(f"{workload}: {len(boxes)} boxes")
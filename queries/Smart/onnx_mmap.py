@@ -0,0 +1,229 @@
+import mmap
+import os
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import onnx
+from utils import TREE_ENSEMBLE_FIELDS, ModelAttributes
+
+# Tree-ensemble ONNX files opened without parsing the forest into Python objects.
+# The file is memory-mapped and the model is parsed with the TREE_ENSEMBLE_FIELDS
+# attributes of its TreeEnsemble* nodes left out (the nodes_* / target_* / class_*
+# lists), those are decoded from the mapped bytes into NumPy arrays on first use.
+# Every other node, one-hot encoders included, is parsed as is. The decoded
+# arrays are saved once next to the model,
+#
+#   {model}.onnx.arrays/{mtime_ns}-{size}/{attribute}.npy
+#
+# and later opens memory-map them read-only, so benchmark processes opening the
+# same model share the pages instead of each decoding its own copy.
+
+# NodeProto and AttributeProto field numbers, wire types of the repeated fields
+OP_TYPE_FIELD = 4
+ATTRIBUTE_FIELD = 5
+NAME_FIELD = 1
+FLOATS_FIELD = 7
+INTS_FIELD = 8
+STRINGS_FIELD = 9
+
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+def read_varint(buffer, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def message_fields(buffer, start: int, end: int) -> Iterator[Tuple[int, int, int, int, int]]:
+    # (field number, wire type, key start, value start, value end) of every field of a message
+    pos = start
+    while pos < end:
+        key_start = pos
+        key, pos = read_varint(buffer, pos)
+        number, wire = key >> 3, key & 7
+        if wire == VARINT:
+            _, value_end = read_varint(buffer, pos)
+        elif wire == FIXED64:
+            value_end = pos + 8
+        elif wire == LENGTH_DELIMITED:
+            length, pos = read_varint(buffer, pos)
+            value_end = pos + length
+        elif wire == FIXED32:
+            value_end = pos + 4
+        else:
+            raise ValueError(f'unsupported wire type {wire} at byte {key_start}')
+        yield number, wire, key_start, pos, value_end
+        pos = value_end
+
+def decode_varints(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # int64 values of the varints data[starts[i]:ends[i] + 1]
+    if not len(starts):
+        return np.empty(0, dtype=np.int64)
+    lengths = ends - starts + 1
+    firsts = np.cumsum(lengths) - lengths
+    offsets = np.arange(int(lengths.sum())) - np.repeat(firsts, lengths)
+    value_bytes = data[np.repeat(starts, lengths) + offsets]
+    groups = (value_bytes & 0x7f).astype(np.uint64) << (7 * offsets).astype(np.uint64)
+    return np.add.reduceat(groups, firsts).view(np.int64)
+
+def unpacked_floats(data: np.ndarray, pos: int, key: int) -> Tuple[np.ndarray, int]:
+    # the run of single-byte-key fixed32 fields starting at pos, and the position after it
+    keys = data[pos::5]
+    n = len(keys) if np.all(keys == key) else int(np.argmax(keys != key))
+    n = min(n, (len(data) - pos) // 5)
+    values = np.lib.stride_tricks.as_strided(data[pos + 1:], shape=(n, 4), strides=(5, 1))
+    return values.copy().view('<f4').reshape(n), pos + 5 * n
+
+def unpacked_varints(data: np.ndarray, pos: int, key: int) -> Tuple[np.ndarray, int]:
+    # the run of single-byte-key varint fields starting at pos, and the position after it
+    terminators = pos + np.flatnonzero(data[pos:] < 0x80)
+    keys, ends = terminators[0::2], terminators[1::2]
+    n = min(len(keys), len(ends))
+    valid = data[keys[:n]] == key
+    valid[1:] &= keys[1:n] == ends[:n - 1] + 1
+    n = n if valid.all() else int(np.argmin(valid))
+    return decode_varints(data, keys[:n] + 1, ends[:n]), (int(ends[n - 1]) + 1 if n else pos)
+
+def decode_attribute(buffer, start: int, end: int) -> np.ndarray:
+    # the values of the repeated field of an attribute, runs of one field decoded at once
+    data = np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start)
+    pieces: List[np.ndarray] = []
+    pos = 0
+    while pos < len(data):
+        key, _ = read_varint(buffer, start + pos)
+        number, wire = key >> 3, key & 7
+        if number == FLOATS_FIELD and wire == FIXED32:
+            values, pos = unpacked_floats(data, pos, key)
+            pieces.append(values)
+            continue
+        if number == INTS_FIELD and wire == VARINT:
+            values, pos = unpacked_varints(data, pos, key)
+            pieces.append(values)
+            continue
+        if number == STRINGS_FIELD:
+            # no packed form, protobuf's own parser beats walking the fields one by one
+            return np.array(list(onnx.AttributeProto.FromString(data.tobytes()).strings))
+        _, _, _, value_start, value_end = next(message_fields(buffer, start + pos, end))
+        value_start, value_end = value_start - start, value_end - start
+        if number == FLOATS_FIELD and wire == LENGTH_DELIMITED:
+            pieces.append(data[value_start:value_end].copy().view('<f4'))
+        elif number == INTS_FIELD and wire == LENGTH_DELIMITED:
+            ends = value_start + np.flatnonzero(data[value_start:value_end] < 0x80)
+            pieces.append(decode_varints(data, np.append(value_start, ends[:-1] + 1), ends))
+        pos = value_end
+    if not pieces:
+        raise TypeError('attribute has no repeated field')
+    return np.concatenate(pieces)
+
+class MappedModel(ModelAttributes):
+    """A tree-ensemble model read from a memory-mapped ONNX file.
+
+    model holds everything but the ensemble lists of the TreeEnsemble* nodes, which
+    array() decodes from the file (or loads from the array cache) on first use.
+    """
+
+    def __init__(self, path: str, cache: bool = True):
+        self.path: str = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        stat = os.stat(path)
+        self.cache_path: 'str | None' = f'{path}.arrays/{stat.st_mtime_ns}-{stat.st_size}' if cache else None
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        self.model: onnx.ModelProto = onnx.ModelProto.FromString(self.strip_model())
+        self.attributes: Dict[str, onnx.AttributeProto] = {}
+        for node in self.model.graph.node:
+            for attr in node.attribute:
+                self.attributes.setdefault(attr.name, attr)
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def strip_model(self) -> bytes:
+        # ModelProto.graph (7) -> GraphProto.node (1) -> NodeProto.attribute (5)
+        return self.strip(0, len(self.buffer), {7: lambda start, end: self.strip(start, end, {1: self.strip_node})})
+
+    def strip_node(self, start: int, end: int) -> 'bytes | None':
+        # op_type is read first, fields may come in any order
+        op_type = next((self.buffer[value_start:value_end].decode('utf-8')
+                        for number, _, _, value_start, value_end in message_fields(self.buffer, start, end)
+                        if number == OP_TYPE_FIELD), '')
+        if not op_type.startswith('TreeEnsemble'):
+            return None
+        return self.strip(start, end, {ATTRIBUTE_FIELD: self.strip_attribute})
+
+    def strip_attribute(self, start: int, end: int) -> 'bytes | None':
+        name = next((self.buffer[value_start:value_end].decode('utf-8')
+                     for number, _, _, value_start, value_end in message_fields(self.buffer, start, end)
+                     if number == NAME_FIELD), None)
+        if name not in TREE_ENSEMBLE_FIELDS:
+            return None
+        # the first ensemble carrying a name wins, as with get_attribute
+        self.ranges.setdefault(name, (start, end))
+        return b''
+
+    def strip(self, start: int, end: int, children: dict) -> bytes:
+        # the message bytes with children[field](value start, value end) in place of the
+        # field value: None keeps it, b'' drops the field
+        out = bytearray()
+        for number, wire, key_start, value_start, value_end in message_fields(self.buffer, start, end):
+            value = children[number](value_start, value_end) if number in children and wire == LENGTH_DELIMITED else None
+            if value is None:
+                out += self.buffer[key_start:value_end]
+            elif value:
+                out += encode_varint(number << 3 | wire) + encode_varint(len(value)) + value
+        return bytes(out)
+
+    def __contains__(self, attr_name: str) -> bool:
+        return attr_name in self.attributes or attr_name in self.ranges
+
+    def __getitem__(self, attr_name: str) -> onnx.AttributeProto:
+        if attr_name not in self.attributes and attr_name in self.ranges:
+            start, end = self.ranges[attr_name]
+            self.attributes[attr_name] = onnx.AttributeProto.FromString(self.buffer[start:end])
+        return super().__getitem__(attr_name)
+
+    def array(self, attr_name: str) -> np.ndarray:
+        if attr_name in self.arrays or attr_name not in self.ranges:
+            return super().array(attr_name)
+        cached = os.path.join(self.cache_path, f'{attr_name}.npy') if self.cache_path is not None else None
+        if cached is not None and os.path.exists(cached):
+            values = np.load(cached, mmap_mode='r')
+        else:
+            values = decode_attribute(self.buffer, *self.ranges[attr_name])
+            values.flags.writeable = False
+            if cached is not None:
+                self.save(cached, values)
+        if values.dtype.kind == 'S':
+            # cached as fixed-width bytes, returned as the bytes objects ModelAttributes gives
+            values = values.astype(object)
+        self.arrays[attr_name] = values
+        return values
+
+    def save(self, cached: str, values: np.ndarray):
+        # written aside and renamed, readers never see a partial file
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            partial = f'{cached}.{os.getpid()}'
+            with open(partial, 'wb') as f:
+                np.save(f, values)
+            os.replace(partial, cached)
+        except OSError:
+            pass
+
+def load_model(path: str) -> onnx.ModelProto:
+    # the graph of a model without the large ensemble attributes, for inputs and encoders
+    return MappedModel(path, cache=False).model
@@ -27,17 +27,21 @@ struct Config
     std::string model = "nyc-taxi-green-dec-2016_d11_l1491_n2981_20250112085333";
     std::string model_type = "rf";
     std::string scale = "1G";
-    std::string thread = "4";
+    // DuckDB threads, empty for the default of the model type (4 for rf, 1 for dt)
+    std::string thread = "";
     int times = 10;
     int optimization_level = 3;
     int debug = 0;
+    // where DuckDB spills and how much memory it may use first, e.g. 8GB; empty keeps its defaults
+    std::string temp_directory = "";
+    std::string memory_limit = "";
 };
 
 Config parse_args(int argc, char *argv[])
 {
     Config config;
     int opt;
-    while ((opt = getopt(argc, argv, "t:w:o:m:s:n:d:")) != -1)
+    while ((opt = getopt(argc, argv, "t:w:o:m:s:n:d:T:M:")) != -1)
     {
         switch (opt)
         {
@@ -59,9 +63,16 @@ Config parse_args(int argc, char *argv[])
         case 'd':
             config.debug = atoi(optarg);
             break;
+        case 'T':
+            config.temp_directory = optarg;
+            break;
+        case 'M':
+            config.memory_limit = optarg;
+            break;
         default:
             std::cerr << "Usage: " << argv[0]
-                      << " [-w workloads] [-m model] [-s scale] [-t threads] [-o optimization_level] [-d debug]\n";
+                      << " [-w workloads] [-m model] [-s scale] [-t threads] [-o optimization_level] [-d debug]"
+                          << " [-T temp_directory] [-M memory_limit]\n";
             exit(EXIT_FAILURE);
         }
     }
@@ -106,6 +117,40 @@ std::string replacePlaceholder(std::string str, const std::string &from, const s
     return str;
 }
 
+// runs sql, exiting non-zero when it fails so a failed query is never timed as a result
+duckdb::unique_ptr<duckdb::MaterializedQueryResult> checked_query(duckdb::Connection &con, const std::string &sql)
+{
+    auto result = con.Query(sql);
+    if (result->HasError())
+    {
+        std::cerr << result->GetError() << "\n";
+        exit(EXIT_FAILURE);
+    }
+    return result;
+}
+
+void configure_memory(duckdb::Connection &con, const Config &config)
+{
+    if (!config.temp_directory.empty())
+    {
+        checked_query(con, "SET temp_directory = '" + config.temp_directory + "';");
+    }
+    if (!config.memory_limit.empty())
+    {
+        checked_query(con, "SET memory_limit = '" + config.memory_limit + "';");
+    }
+}
+
+// loading the data, timed on stderr so output.csv keeps its columns: load_time,<ms>
+void load_data(duckdb::Connection &con, const std::string &data)
+{
+    auto start = std::chrono::high_resolution_clock::now();
+    checked_query(con, data);
+    auto end = std::chrono::high_resolution_clock::now();
+    std::chrono::duration<double, std::milli> duration = end - start;
+    std::cerr << "load_time," << duration.count() << "\n";
+}
+
 void run(const Config &config)
 {
     std::string sql_path = SQL_PATH + config.workload + "/";
@@ -118,15 +163,16 @@ void run(const Config &config)
     duckdb::DuckDB db(nullptr, &db_config);
     duckdb::Connection con(db);
 
-    con.Query("PRAGMA disable_verification;");
-    con.Query("set allow_extensions_metadata_mismatch=true;");
-    con.Query(read_file(LOAD_PATH + "load_inference_function.sql"));
+    checked_query(con, "PRAGMA disable_verification;");
+    checked_query(con, "set allow_extensions_metadata_mismatch=true;");
+    configure_memory(con, config);
+    checked_query(con, read_file(LOAD_PATH + "load_inference_function.sql"));
 
     std::string data = replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale);
     std::string threads = replacePlaceholder("set threads = ?;", "?", config.thread);
 
-    con.Query(data);
-    con.Query(threads);
+    load_data(con, data);
+    checked_query(con, threads);
     std::vector<double> records;
     int count = config.times;
 
@@ -138,7 +184,7 @@ void run(const Config &config)
     while (count--)
     {
         auto start = std::chrono::high_resolution_clock::now();
-        con.Query(sql);
+        checked_query(con, sql);
         auto end = std::chrono::high_resolution_clock::now();
         std::chrono::duration<double, std::milli> duration = end - start;
         records.push_back(duration.count());
@@ -165,9 +211,10 @@ void debug(const Config &config)
     duckdb::DuckDB db(nullptr, &db_config);
     duckdb::Connection con(db);
 
-    con.Query("PRAGMA disable_verification;");
-    con.Query("set allow_extensions_metadata_mismatch=true;");
-    con.Query(read_file(LOAD_PATH + "load_inference_function.sql"));
+    checked_query(con, "PRAGMA disable_verification;");
+    checked_query(con, "set allow_extensions_metadata_mismatch=true;");
+    configure_memory(con, config);
+    checked_query(con, read_file(LOAD_PATH + "load_inference_function.sql"));
 
     std::string sql_path = SQL_PATH + config.workload + "/";
 
@@ -175,16 +222,16 @@ void debug(const Config &config)
     outputfile.open(sql_path + "output-debug.csv", std::ios::app);
 
     std::string threads = replacePlaceholder("set threads = ?;", "?", config.thread);
-    con.Query(threads);
+    checked_query(con, threads);
 
-    auto result = con.Query(replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale));
+    auto result = checked_query(con, replacePlaceholder(read_file(sql_path + "load_data.sql"), "?", config.scale));
     outputfile << result->ToString() << "\n";
 
     std::string sql = read_file(sql_path + "query.sql");
     sql = replacePlaceholder(sql, "?", config.model);
 
     auto start = std::chrono::high_resolution_clock::now();
-    result = con.Query(sql);
+    result = checked_query(con, sql);
     outputfile << result->ToString() << "\n";
     auto end = std::chrono::high_resolution_clock::now();
     std::chrono::duration<double, std::milli> duration = end - start;
@@ -204,15 +251,10 @@ int main(int argc, char *argv[])
     Config config = parse_args(argc, argv);
 
     std::regex rf_pattern("t100");
-    if (regex_search(config.model, rf_pattern))
-    {
-        config.model_type = "rf";
-        config.thread = "4";
-    }
-    else
+    config.model_type = regex_search(config.model, rf_pattern) ? "rf" : "dt";
+    if (config.thread.empty())
     {
-        config.model_type = "dt";
-        config.thread = "1";
+        config.thread = config.model_type == "rf" ? "4" : "1";
     }
 
     config.debug == 0 ? run(config) : debug(config);
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import onnx
+
+# Histograms of the predict inputs over the rows predict sees, built once per
+# workload from a DuckDB sample and stored as workloads/{w}/histograms.json:
+#
+#   {"rows": n, "columns": {"<model input>": {"nulls": f, "values": [...], "fractions": [...]}
+#                                           | {"nulls": f, "bounds": [...]}}}
+#
+# Columns with few distinct values keep exact frequencies, the others equi-depth
+# bucket bounds. Estimates assume independent features. duckdb and sqlglot are
+# only imported to build histograms, gen_dt_predicates and sql_rewrite only read them.
+#
+#   python selectivity.py -w walmart_sales -m <model> -s 1
+
+BUCKETS = 64
+MAX_VALUES = 256
+
+class Histograms:
+    def __init__(self, stats: dict):
+        self.rows: int = stats['rows']
+        self.columns: Dict[str, dict] = stats['columns']
+
+    def cdf(self, column: str, value: float, inclusive: bool = True) -> float:
+        # fraction of the non-null rows <= value (< value when not inclusive)
+        histogram = self.columns[column]
+        if 'values' in histogram:
+            values = np.array(histogram['values'], dtype=float)
+            fractions = np.array(histogram['fractions'])
+            kept = values <= value if inclusive else values < value
+            return float(fractions[kept].sum())
+        bounds = np.array(histogram['bounds'])
+        n_buckets = len(bounds) - 1
+        i = int(np.searchsorted(bounds, value, side='right' if inclusive else 'left'))
+        if i == 0:
+            return 0.0
+        if i > n_buckets:
+            return 1.0 - histogram['nulls']
+        width = bounds[i] - bounds[i - 1]
+        inside = (value - bounds[i - 1]) / width if width > 0 else 1.0
+        return (i - 1 + inside) / n_buckets * (1.0 - histogram['nulls'])
+
+    def range_fraction(self, column: str, lvalue: 'float | None', rvalue: 'float | None') -> float:
+        # rvalue <= column <= lvalue
+        if column not in self.columns:
+            return 1.0
+        high = self.cdf(column, lvalue) if lvalue is not None else 1.0 - self.columns[column]['nulls']
+        low = self.cdf(column, rvalue, inclusive=False) if rvalue is not None else 0.0
+        return max(high - low, 0.0)
+
+    def category_fraction(self, column: str, allowed: 'set | None', excluded: set) -> float:
+        # IN (allowed - excluded), or NOT IN excluded OR NULL when allowed is None
+        histogram = self.columns.get(column)
+        if histogram is None or 'values' not in histogram:
+            return 1.0
+        frequencies = {category_key(value): fraction for value, fraction in zip(histogram['values'], histogram['fractions'])}
+        if allowed is not None:
+            return sum(frequencies.get(category_key(value), 0.0) for value in allowed - excluded)
+        return 1.0 - sum(frequencies.get(category_key(value), 0.0) for value in excluded)
+
+    def box_fraction(self, box: List[Tuple[str, str, str]]) -> float:
+        # rows of predicates-dnf.csv: column,op(<= / >= / in / not in),value
+        ranges: Dict[str, List['float | None']] = {}
+        categories: Dict[str, Tuple['set | None', set]] = {}
+        for column, op, value in box:
+            if op in ('<=', '>='):
+                bounds = ranges.setdefault(column, [None, None])
+                bounds[0 if op == '<=' else 1] = float(value)
+            else:
+                allowed, excluded = categories.get(column, (None, set()))
+                if op == 'in':
+                    allowed = {str(value)} if allowed is None else allowed & {str(value)}
+                else:
+                    excluded = excluded | {str(value)}
+                categories[column] = (allowed, excluded)
+        fraction = 1.0
+        for column, (lvalue, rvalue) in ranges.items():
+            fraction *= self.range_fraction(column, lvalue, rvalue)
+        for column, (allowed, excluded) in categories.items():
+            fraction *= self.category_fraction(column, allowed, excluded)
+        return float(fraction)
+
+    def boxes_fraction(self, boxes: List[List[Tuple[str, str, str]]]) -> float:
+        # the boxes of a tree cover disjoint subtrees
+        return min(sum(self.box_fraction(box) for box in boxes), 1.0)
+
+def category_key(value) -> str:
+    # csv values and json values of the same category compare equal, 2 == 2.0
+    try:
+        return repr(float(value))
+    except ValueError:
+        return str(value)
+
+def hull_rows(predicates: List[Tuple[str, 'float | None', 'float | None']]) -> List[Tuple[str, str, float]]:
+    # the per-feature hull of predicates.csv as one box
+    rows = []
+    for feature, lvalue, rvalue in predicates:
+        if lvalue is not None:
+            rows.append((feature, '<=', lvalue))
+        if rvalue is not None:
+            rows.append((feature, '>=', rvalue))
+    return rows
+
+def load_histograms(path: str) -> 'Histograms | None':
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return Histograms(json.load(f))
+
+def column_histogram(values: np.ndarray) -> dict:
+    nulls = np.array([value is None or (isinstance(value, float) and np.isnan(value)) for value in values], dtype=bool)
+    present = values[~nulls]
+    histogram = {'nulls': float(nulls.mean()) if len(values) else 0.0}
+    if not len(present):
+        histogram.update(values=[], fractions=[])
+        return histogram
+    numeric = all(isinstance(value, (int, float, np.integer, np.floating, bool, np.bool_)) for value in present[:1000])
+    distinct, counts = np.unique(present.astype(float) if numeric else present.astype(str), return_counts=True)
+    if len(distinct) <= MAX_VALUES or not numeric:
+        order = np.argsort(-counts)[:MAX_VALUES]
+        histogram.update(values=distinct[order].tolist(), fractions=(counts[order] / len(values)).tolist())
+    else:
+        histogram['bounds'] = np.quantile(present.astype(float), np.linspace(0, 1, BUCKETS + 1)).tolist()
+    return histogram
+
+def feature_query(query: 'exp.Expression', model: onnx.ModelProto, sample: int) -> str:
+    # the predict select projecting the model inputs, without the predict condition
+    from sqlglot import exp
+    from sql_utils import RetreeDuckDB, conjuncts, feature_arguments, find_predict, uncommented
+
+    predict = find_predict(query)
+    arguments = feature_arguments(model, predict)
+    features = predict.find_ancestor(exp.Select).copy()
+    features.set('expressions', [exp.alias_(uncommented(arg), name, quoted=True) for name, arg in arguments.items()])
+    where = features.args.get('where')
+    if where is not None:
+        remaining = [c for c in conjuncts(where.this) if not any(f.name.lower() == 'predict' for f in c.find_all(exp.Anonymous))]
+        features.set('where', exp.Where(this=exp.and_(*remaining)) if remaining else None)
+    if query.args.get('with') is not None and features.args.get('with') is None:
+        features.set('with', query.args['with'].copy())
+    return f'SELECT * FROM ({features.sql(dialect=RetreeDuckDB)}) USING SAMPLE {sample} ROWS'
+
+def build_histograms(load_sql: str, query: 'exp.Expression', model: onnx.ModelProto, sample: int) -> dict:
+    import duckdb
+
+    con = duckdb.connect()
+    con.execute(load_sql)
+    df = con.execute(feature_query(query, model, sample)).fetchdf()
+    return {'rows': len(df), 'columns': {name: column_histogram(df[name].to_numpy(dtype=object)) for name in df.columns}}
+
+def predict_fraction(path: str, threshold: float) -> 'float | None':
+    # model/{m}.txt from the training script: 100 percentiles for regressors, "label: pct%" lines for classifiers
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if lines and ':' in lines[0]:
+        distribution = {float(label): float(pct.rstrip('%')) / 100 for label, pct in (line.split(':') for line in lines)}
+        return distribution.get(threshold, 0.0)
+    percentiles = np.array([float(line) for line in lines])
+    return float(1 - np.interp(threshold, percentiles, np.arange(1, len(percentiles) + 1) / len(percentiles)))
+
+if __name__ == '__main__':
+    from onnx_mmap import load_model
+    from sql_utils import read_query
+    from sql_rewrite import read_boxes, read_categorical, read_predicates, template_path
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', '-w', type=str)
+    parser.add_argument('--model', '-m', type=str)
+    parser.add_argument('--scale', '-s', type=str, default='1')
+    parser.add_argument('--sample', type=int, default=100000)
+    parser.add_argument('--query', '-q', type=str, default=None)
+    parser.add_argument('--models', type=str, default='/volumn/Retree_exp/workloads', help='root of workloads/{w}/model/{m}.onnx')
+    args = parser.parse_args()
+
+    workload_path = f'workloads/{args.workload}/'
+    histograms_path = os.path.join(workload_path, 'histograms.json')
+    model_path = os.path.join(args.models, args.workload, 'model')
+    model = load_model(os.path.join(model_path, f'{args.model}.onnx'))
+    if not os.path.exists(histograms_path):
+        with open(os.path.join(workload_path, 'load_data.sql'), 'r', encoding='utf-8') as f:
+            load_sql = f.read().replace('?', args.scale)
+        _, query = read_query(args.query or template_path(args.workload))
+        with open(histograms_path, 'w', encoding='utf-8') as f:
+            json.dump(build_histograms(load_sql, query, model, args.sample), f)
+    histograms = load_histograms(histograms_path)
+
+    # one row per derived threshold, for stratifying the benchmark matrix
+    predicates_path = os.path.join(workload_path, 'predicates.csv')
+    with open(predicates_path, 'r', encoding='utf-8') as f:
+        thresholds = list(dict.fromkeys(float(line.rsplit(',', 1)[1]) for line in f if line.strip() and not line.startswith('feature_name')))
+    with open(os.path.join(workload_path, 'selectivity.csv'), 'w', encoding='utf-8') as f:
+        f.write('predicate,predict,hull,boxes\n')
+        for threshold in thresholds:
+            _, predicates = read_predicates(predicates_path, threshold)
+            hull_box = hull_rows(predicates) + read_categorical(os.path.join(workload_path, 'predicates-cat.csv'), threshold)
+            boxes = read_boxes(os.path.join(workload_path, 'predicates-dnf.csv'), threshold)
+            predict = predict_fraction(os.path.join(model_path, f'{args.model}.txt'), threshold)
+            hull_fraction = histograms.box_fraction(hull_box)
+            boxes_fraction = histograms.boxes_fraction(boxes) if boxes else hull_fraction
+            f.write(f"{threshold},{'' if predict is None else round(predict, 6)},{round(hull_fraction, 6)},{round(boxes_fraction, 6)}\n")
+    print(f'{args.workload}: {histograms.rows} sampled rows, {len(thresholds)} thresholds')
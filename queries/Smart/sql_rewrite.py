@@ -0,0 +1,452 @@
+import argparse
+import csv
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+import onnx
+from sqlglot import exp
+from sql_utils import (RetreeDuckDB, conjuncts, cte_selects, feature_arguments, find_predict, inner_joins_only, join_sources,
+                       predict_condition, projections, read_query, read_schema, uncommented, write_query)
+from onnx_mmap import load_model
+from selectivity import Histograms, hull_rows, load_histograms
+from utils import get_onehot_categories
+
+# Rewrite the predict query of a workload with the range predicates derived by
+# gen_dt_predicates.py. Every predicate is pushed through CTE and subquery
+# projections down to the lowest select producing its columns; when that
+# select joins several sources, the table is replaced by a filtered scan
+#
+#   sales s  ->  (SELECT * FROM sales AS s WHERE <predicates on s>) AS s
+#
+# otherwise the predicates are added to its WHERE. Casts, EXTRACT(YEAR ...) and
+# CASE over literals are inverted so the filter lands on the stored column:
+#
+#   CAST(EXTRACT(YEAR FROM s.Date) AS FLOAT) >= 2011.5  ->  s.Date >= CAST('2012-01-01' AS DATE)
+#   CASE WHEN st.Type = 'A' THEN 1 WHEN st.Type = 'B' THEN 2 ... END <= 1.5  ->  st.Type IN ('A')
+#
+# The inverted filters may keep a few more rows than the range (float32 rounding of
+# the casts), never fewer.
+#
+# For single trees predicates-dnf.csv holds up to K boxes covering the qualifying
+# leaves. Every box is pushed down and inverted as the hull predicates are; when
+# all of them land on the same table or select their conjunctions are ORed there
+# as one condition next to the per-feature hull, otherwise where predict is.
+
+NUMERIC_TYPE = re.compile(r'INT|FLOAT|DOUBLE|DECIMAL|NUMERIC|REAL', re.IGNORECASE)
+
+def template_path(workload: str) -> str:
+    # workloads without a ReTree query keep their template next to load_data.sql
+    path = f'workloads/{workload}/query-template.sql'
+    if os.path.exists(path):
+        return path
+    return f'../Retree/workloads/{workload}/query.sql'
+
+def format_number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def read_predicates(path: str, threshold: 'float | None') -> Tuple[float, List[Tuple[str, 'float | None', 'float | None']]]:
+    # feature_name,lvalue(<=),rvalue(>=),predicate; gen_dt_predicates.py appends one block per threshold
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = [row for row in csv.reader(f) if row and row[0] != 'feature_name']
+    if threshold is None:
+        threshold = float(rows[0][3])
+    predicates = []
+    for feature, lvalue, rvalue, predicate in rows:
+        if float(predicate) != threshold or feature == 'None':
+            continue
+        lvalue, rvalue = float(lvalue), float(rvalue)
+        predicates.append((feature, None if lvalue == float('inf') else lvalue, None if rvalue == float('-inf') else rvalue))
+    return threshold, predicates
+
+def read_categorical(path: str, threshold: float) -> List[Tuple[str, str, str]]:
+    # column,op(in / not in),value,predicate written by gen_dt_predicates.py for one-hot inputs
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = [row for row in csv.reader(f) if row and row[0] != 'column']
+    return [(column, op, value) for column, op, value, predicate in rows if float(predicate) == threshold]
+
+def read_boxes(path: str, threshold: float) -> List[List[Tuple[str, str, str]]]:
+    # box,column,op(<= / >= / in / not in),value,predicate written by gen_dt_predicates.py for single trees
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = [row for row in csv.reader(f) if row and row[0] != 'box']
+    boxes: Dict[str, List[Tuple[str, str, str]]] = {}
+    for box, column, op, value, predicate in rows:
+        if float(predicate) == threshold:
+            boxes.setdefault(box, []).append((column, op, value))
+    return list(boxes.values())
+
+def category_literals(model: onnx.ModelProto, categorical: List[Tuple[str, str, str]]) -> Dict[str, Tuple[List[set], set]]:
+    # column -> (categories each IN row allows, categories excluded by NOT IN rows)
+    columns = {}
+    for column, op, value in categorical:
+        numeric = any(isinstance(category, int) for category in get_onehot_categories(model, column))
+        literal = exp.Literal.number(int(value)) if numeric else exp.Literal.string(value)
+        allowed, excluded = columns.setdefault(column, ([], set()))
+        if op == 'in':
+            allowed.append({literal})
+        else:
+            excluded.add(literal)
+    return columns
+
+def categorical_conditions(expression: exp.Expression, allowed: List[set], excluded: set) -> List[exp.Expression]:
+    expression = uncommented(expression)
+    if allowed:
+        # an input takes one category, several IN rows intersect
+        values = set.intersection(*allowed) - excluded
+        if not values:
+            return [exp.false()]
+        return [exp.In(this=expression, expressions=sorted(values, key=lambda literal: literal.sql()))]
+    # unknown categories and NULL encode to all zeros and pass NOT IN
+    not_in = exp.not_(exp.In(this=expression.copy(), expressions=sorted(excluded, key=lambda literal: literal.sql())))
+    return [exp.paren(exp.or_(not_in, exp.Is(this=expression.copy(), expression=exp.null()), copy=False), copy=False)]
+
+Box = Tuple[List[Tuple[str, 'float | None', 'float | None']], Dict[str, Tuple[List[set], set]]]
+
+def box_conditions(model: onnx.ModelProto, boxes: List[List[Tuple[str, str, str]]],
+                   arguments: Dict[str, exp.Expression]) -> 'List[Box] | None':
+    # per box its range predicates and category literals, as rewrite takes the hull's; None when
+    # a box cannot be expressed over the predict arguments or there is no second box to OR
+    disjuncts = []
+    for box in boxes:
+        if any(column not in arguments for column, _, _ in box):
+            return None
+        bounds: Dict[str, List['float | None']] = {}
+        for column, op, value in box:
+            if op == '>=':
+                bounds.setdefault(column, [None, None])[1] = float(value)
+            elif op == '<=':
+                bounds.setdefault(column, [None, None])[0] = float(value)
+        categorical = [(column, op, value) for column, op, value in box if op in ('in', 'not in')]
+        if not bounds and not categorical:
+            return None
+        disjuncts.append(([(column, lvalue, rvalue) for column, (lvalue, rvalue) in bounds.items()],
+                          category_literals(model, categorical)))
+    return disjuncts if len(disjuncts) > 1 else None
+
+def paying_filters(histograms: Histograms, predicates: List[Tuple[str, 'float | None', 'float | None']],
+                   categorical: List[Tuple[str, str, str]], boxes: List[List[Tuple[str, str, str]]],
+                   min_pruning: float) -> Tuple[list, list, list]:
+    # drop the filters estimated to remove less than min_pruning of the rows they are evaluated on
+    predicates = [(feature, lvalue, rvalue) for feature, lvalue, rvalue in predicates
+                  if histograms.range_fraction(feature, lvalue, rvalue) <= 1 - min_pruning]
+    columns = {column for column, _, _ in categorical}
+    kept = {column for column in columns
+            if histograms.box_fraction([row for row in categorical if row[0] == column]) <= 1 - min_pruning}
+    categorical = [row for row in categorical if row[0] in kept]
+    if boxes:
+        hull = histograms.box_fraction(hull_rows(predicates) + categorical)
+        if histograms.boxes_fraction(boxes) > hull * (1 - min_pruning):
+            boxes = []
+    return predicates, categorical, boxes
+
+def output_names(source: exp.Expression, ctes: Dict[str, exp.Expression], schema: Dict[str, Dict[str, str]]) -> 'set | None':
+    select = None
+    if isinstance(source, exp.Table):
+        name = source.name.lower()
+        if name not in ctes:
+            return set(schema[name]) if name in schema else None
+        select = ctes[name]
+    elif isinstance(source, exp.Subquery):
+        select = source.this
+    if not isinstance(select, exp.Select):
+        return None
+    outputs, star = projections(select)
+    return None if star else set(outputs)
+
+def column_source(column: exp.Column, sources: Dict[str, exp.Expression],
+                  ctes: Dict[str, exp.Expression], schema: Dict[str, Dict[str, str]]) -> 'str | None':
+    if column.table:
+        return column.table.lower() if column.table.lower() in sources else None
+    if len(sources) == 1:
+        return next(iter(sources))
+    owners = []
+    for alias, source in sources.items():
+        names = output_names(source, ctes, schema)
+        if names is None:
+            return None
+        if column.name.lower() in names:
+            owners.append(alias)
+    return owners[0] if len(owners) == 1 else None
+
+def push_down(select: exp.Select, expression: exp.Expression, ctes: Dict[str, exp.Expression],
+              schema: Dict[str, Dict[str, str]], cte_uses: Counter) -> Tuple[exp.Select, 'exp.Table | None', exp.Expression]:
+    # (select, base table owning the expression or None, expression rewritten over that select's sources)
+    while inner_joins_only(select):
+        sources = {source.alias_or_name.lower(): source for source in join_sources(select)}
+        owners = {column_source(column, sources, ctes, schema) for column in expression.find_all(exp.Column)}
+        if len(owners) != 1 or None in owners:
+            break
+        source = sources[owners.pop()]
+
+        if isinstance(source, exp.Table) and source.name.lower() not in ctes:
+            return select, source, expression
+        if isinstance(source, exp.Table):
+            # a filter inside a CTE would also apply to its other references
+            if cte_uses[source.name.lower()] > 1:
+                break
+            inner = ctes[source.name.lower()]
+        elif isinstance(source, exp.Subquery):
+            inner = source.this
+        else:
+            break
+        if not isinstance(inner, exp.Select) or any(inner.args.get(arg) for arg in ('group', 'having', 'distinct', 'limit', 'qualify')):
+            break
+
+        outputs, star = projections(inner)
+        if any(column.name.lower() not in outputs and not star for column in expression.find_all(exp.Column)):
+            break
+        inner_expression = expression.transform(
+            lambda node: (outputs[node.name.lower()].copy() if node.name.lower() in outputs else exp.column(node.name))
+            if isinstance(node, exp.Column) else node)
+        if inner_expression.find(exp.AggFunc, exp.Window):
+            break
+        select, expression = inner, inner_expression
+    return select, None, expression
+
+def range_conditions(expression: exp.Expression, lvalue: 'float | None', rvalue: 'float | None') -> List[exp.Expression]:
+    conditions = []
+    if rvalue is not None:
+        conditions.append(exp.GTE(this=expression.copy(), expression=exp.Literal.number(format_number(rvalue))))
+    if lvalue is not None:
+        conditions.append(exp.LTE(this=expression.copy(), expression=exp.Literal.number(format_number(lvalue))))
+    return conditions
+
+def number(node: 'exp.Expression | None') -> 'float | None':
+    # numeric literal of a CASE branch, None for NULL
+    if node is None or isinstance(node, exp.Null):
+        return None
+    if isinstance(node, exp.Neg):
+        return -number(node.this)
+    if isinstance(node, exp.Literal) and not node.is_string:
+        return float(node.this)
+    raise ValueError(f'not a number: {node.sql(dialect=RetreeDuckDB)}')
+
+def is_numeric(expression: exp.Expression, types: Dict[str, str]) -> bool:
+    if isinstance(expression, exp.Column):
+        return bool(NUMERIC_TYPE.search(types.get(expression.name.lower(), '')))
+    if isinstance(expression, exp.Cast):
+        return expression.to.is_type(*exp.DataType.INTEGER_TYPES, exp.DataType.Type.FLOAT, exp.DataType.Type.DOUBLE, exp.DataType.Type.DECIMAL)
+    return isinstance(expression, (exp.Extract, exp.Year, exp.Case))
+
+def strip_cast(expression: exp.Expression, lvalue: 'float | None', rvalue: 'float | None',
+               types: Dict[str, str]) -> Tuple[exp.Expression, 'float | None', 'float | None']:
+    # numeric casts are monotonic, widen the bounds by what the cast may round away
+    while isinstance(expression, exp.Cast) and is_numeric(expression.this, types):
+        if expression.to.is_type(*exp.DataType.INTEGER_TYPES):
+            rvalue = None if rvalue is None else math.ceil(rvalue) - 0.5
+            lvalue = None if lvalue is None else math.floor(lvalue) + 0.5
+        elif expression.to.is_type(exp.DataType.Type.FLOAT, exp.DataType.Type.DOUBLE):
+            rvalue = None if rvalue is None else float(np.nextafter(np.float32(rvalue), np.float32(-np.inf)))
+            lvalue = None if lvalue is None else float(np.nextafter(np.float32(lvalue), np.float32(np.inf)))
+        else:
+            break
+        expression = expression.this
+    return expression, lvalue, rvalue
+
+def year_conditions(column: exp.Expression, lvalue: 'float | None', rvalue: 'float | None') -> List[exp.Expression]:
+    conditions = []
+    if rvalue is not None:
+        start = exp.cast(exp.Literal.string(f'{math.ceil(rvalue):04d}-01-01'), 'DATE')
+        conditions.append(exp.GTE(this=column.copy(), expression=start))
+    if lvalue is not None:
+        end = exp.cast(exp.Literal.string(f'{math.floor(lvalue) + 1:04d}-01-01'), 'DATE')
+        conditions.append(exp.LT(this=column.copy(), expression=end))
+    return conditions
+
+def case_conditions(case: exp.Case, lvalue: 'float | None', rvalue: 'float | None') -> 'List[exp.Expression] | None':
+    # CASE WHEN c = 'A' THEN 1 WHEN c IN ('B', 'C') THEN 2 ELSE 0 END -> c IN / NOT IN (...)
+    def selected(value: 'float | None') -> bool:
+        return value is not None and (rvalue is None or value >= rvalue) and (lvalue is None or value <= lvalue)
+
+    ifs = case.args.get('ifs') or []
+    try:
+        values = [number(if_.args.get('true')) for if_ in ifs]
+        default = number(case.args.get('default'))
+    except ValueError:
+        return None
+
+    branches = []
+    for if_ in ifs:
+        condition = if_.this
+        if case.this is not None:
+            branches.append((case.this, [condition]))
+        elif isinstance(condition, exp.EQ) and isinstance(condition.expression, exp.Literal):
+            branches.append((condition.this, [condition.expression]))
+        elif isinstance(condition, exp.In) and condition.expressions and all(isinstance(e, exp.Literal) for e in condition.expressions):
+            branches.append((condition.this, list(condition.expressions)))
+        elif len(ifs) == 1:
+            # CASE WHEN <boolean> THEN x ELSE y END
+            if selected(values[0]) and selected(default):
+                return []
+            if selected(values[0]):
+                return [condition.copy()]
+            if selected(default):
+                return [exp.not_(exp.func('COALESCE', condition.copy(), exp.false()))]
+            return [exp.false()]
+        else:
+            return None
+
+    column = branches[0][0]
+    if any(branch_column != column for branch_column, _ in branches):
+        return None
+    kept, dropped, seen = [], [], set()
+    for (_, literals), value in zip(branches, values):
+        for literal in literals:
+            # the first matching branch wins
+            if literal.sql() in seen:
+                continue
+            seen.add(literal.sql())
+            (kept if selected(value) else dropped).append(literal.copy())
+
+    if selected(default):
+        if not dropped:
+            return []
+        not_in = exp.not_(exp.In(this=column.copy(), expressions=dropped))
+        return [exp.paren(exp.or_(not_in, exp.Is(this=column.copy(), expression=exp.null()), copy=False), copy=False)]
+    if not kept:
+        return [exp.false()]
+    return [exp.In(this=column.copy(), expressions=kept)]
+
+def invert(expression: exp.Expression, lvalue: 'float | None', rvalue: 'float | None',
+           types: Dict[str, str]) -> List[exp.Expression]:
+    # filters on the stored columns implied by rvalue <= expression <= lvalue
+    expression = uncommented(expression)
+    inner, inner_lvalue, inner_rvalue = strip_cast(expression, lvalue, rvalue, types)
+    if isinstance(inner, exp.Extract) and inner.this.name.upper() == 'YEAR':
+        return year_conditions(inner.expression, inner_lvalue, inner_rvalue)
+    if isinstance(inner, exp.Year):
+        return year_conditions(inner.this, inner_lvalue, inner_rvalue)
+    if isinstance(inner, exp.Case):
+        conditions = case_conditions(inner, inner_lvalue, inner_rvalue)
+        if conditions is not None:
+            return conditions
+    if isinstance(inner, exp.Column):
+        return range_conditions(inner, inner_lvalue, inner_rvalue)
+    return range_conditions(expression, lvalue, rvalue)
+
+def filter_table(table: exp.Table, conditions: List[exp.Expression]):
+    scan = exp.select('*').from_(table.copy()).where(exp.and_(*conditions, copy=False), copy=False)
+    table.replace(exp.Subquery(this=scan, alias=exp.TableAlias(this=exp.to_identifier(table.alias_or_name))))
+
+def filter_select(select: exp.Select, conditions: List[exp.Expression]):
+    where = select.args.get('where')
+    conditions = conditions + (conjuncts(where.this) if where is not None else [])
+    select.set('where', exp.Where(this=exp.and_(*conditions, copy=False)))
+
+def rewrite(query: exp.Expression, arguments: Dict[str, exp.Expression], threshold: float,
+            predicates: List[Tuple[str, 'float | None', 'float | None']], schema: Dict[str, Dict[str, str]],
+            categories: 'Dict[str, Tuple[List[set], set]] | None' = None,
+            boxes: 'List[Box] | None' = None) -> exp.Expression:
+    predict = find_predict(query)
+    for placeholder in predict_condition(predict).find_all(exp.Placeholder):
+        placeholder.replace(exp.Literal.number(format_number(threshold)))
+
+    ctes = cte_selects(query)
+    cte_uses = Counter(table.name.lower() for table in query.find_all(exp.Table) if table.name.lower() in ctes)
+    home = predict.find_ancestor(exp.Select)
+
+    def place(feature: str, bounds: tuple, categorical: bool) -> Tuple[exp.Expression, List[exp.Expression]]:
+        # (table or select to filter, conditions on the stored columns) of one feature's bounds
+        select, table, expression = push_down(home, arguments[feature], ctes, schema, cte_uses)
+        types = schema.get(table.name.lower(), {}) if table is not None else {}
+        if categorical:
+            conditions = categorical_conditions(expression, *bounds)
+        else:
+            conditions = invert(expression, *bounds, types)
+        if table is not None and len(join_sources(select)) > 1:
+            return table, conditions
+        return select, conditions
+
+    targets: Dict[int, Tuple[exp.Expression, List[exp.Expression]]] = {}
+    filters = [(feature, (lvalue, rvalue), False) for feature, lvalue, rvalue in predicates]
+    filters += [(column, category, True) for column, category in (categories or {}).items()]
+    for feature, bounds, categorical in filters:
+        if feature not in arguments:
+            print(f'{feature}: not a predict argument, skipped')
+            continue
+        target, conditions = place(feature, bounds, categorical)
+        if conditions:
+            targets.setdefault(id(target), (target, []))[1].extend(conditions)
+
+    if boxes is not None:
+        # the hull filters above stay, they may reach tables the disjunction spanning them cannot
+        placed = [[place(feature, (lvalue, rvalue), False) for feature, lvalue, rvalue in ranges] +
+                  [place(column, category, True) for column, category in box_categories.items()]
+                  for ranges, box_categories in boxes]
+        if len({id(target) for box in placed for target, _ in box}) == 1:
+            target = placed[0][0][0]
+        else:
+            # the boxes span several sources, OR them where predict is, inverted over its arguments
+            target = home
+            placed = [[(home, invert(arguments[feature], lvalue, rvalue, {})) for feature, lvalue, rvalue in ranges] +
+                      [(home, categorical_conditions(arguments[column], *category)) for column, category in box_categories.items()]
+                      for ranges, box_categories in boxes]
+        disjuncts = [[condition for _, conditions in box for condition in conditions] for box in placed]
+        # a box without conditions keeps every row, and so does the disjunction
+        if all(disjuncts):
+            disjunction = exp.or_(*[exp.paren(exp.and_(*conditions, copy=False), copy=False) if len(conditions) > 1 else conditions[0]
+                                    for conditions in disjuncts], copy=False)
+            targets.setdefault(id(target), (target, []))[1].append(exp.paren(disjunction, copy=False))
+
+    for target, conditions in targets.values():
+        if isinstance(target, exp.Table):
+            filter_table(target, conditions)
+    for target, conditions in targets.values():
+        if isinstance(target, exp.Select):
+            filter_select(target, conditions)
+    return query
+
+def rewrite_workload(workload: str, model: onnx.ModelProto, threshold: 'float | None' = None, query_path: 'str | None' = None,
+                     predicates_file: str = 'predicates.csv', categorical_file: str = 'predicates-cat.csv',
+                     boxes_file: str = 'predicates-dnf.csv', histograms: 'Histograms | None' = None,
+                     min_pruning: float = 0.05) -> Tuple[str, exp.Expression, str]:
+    # the query of workload rewritten with its derived predicates at threshold (the first one
+    # of predicates_file when None): explain prefix, query and a one-line summary
+    workload_path = f'workloads/{workload}/'
+    prefix, query = read_query(query_path or template_path(workload))
+    schema = {table.lower(): {column.lower(): type for column, type in columns.items()}
+              for table, columns in read_schema(os.path.join(workload_path, 'load_data.sql')).items()}
+    threshold, predicates = read_predicates(os.path.join(workload_path, predicates_file), threshold)
+
+    categorical = read_categorical(os.path.join(workload_path, categorical_file), threshold)
+    arguments = feature_arguments(model, find_predict(query))
+
+    boxes = read_boxes(os.path.join(workload_path, boxes_file), threshold)
+    if histograms is not None:
+        predicates, categorical, boxes = paying_filters(histograms, predicates, categorical, boxes, min_pruning)
+    disjunction = box_conditions(model, boxes, arguments)
+
+    query = rewrite(query, arguments, threshold, predicates, schema, category_literals(model, categorical), disjunction)
+    summary = (f'{workload}: {len(predicates)} range, {len(categorical)} categorical predicates, '
+               f'{len(boxes) if disjunction is not None else 0} boxes, threshold {format_number(threshold)}')
+    return prefix, query, summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', '-w', type=str)
+    parser.add_argument('--model', '-m', type=str)
+    parser.add_argument('--threshold', '-t', type=float, default=None)
+    parser.add_argument('--query', '-q', type=str, default=None)
+    parser.add_argument('--predicates', '-p', type=str, default='predicates.csv')
+    parser.add_argument('--categorical', '-c', type=str, default='predicates-cat.csv')
+    parser.add_argument('--boxes', '-b', type=str, default='predicates-dnf.csv')
+    parser.add_argument('--histograms', type=str, default='histograms.json')
+    parser.add_argument('--min_pruning', type=float, default=0.05)
+    parser.add_argument('--models', type=str, default='/volumn/Retree_exp/workloads', help='root of workloads/{w}/model/{m}.onnx')
+    parser.add_argument('--output', '-o', type=str, default='query.sql')
+    args = parser.parse_args()
+
+    workload_path = f'workloads/{args.workload}/'
+    model = load_model(os.path.join(args.models, args.workload, 'model', f'{args.model}.onnx'))
+    histograms = load_histograms(os.path.join(workload_path, args.histograms))
+    prefix, query, summary = rewrite_workload(args.workload, model, args.threshold, args.query, args.predicates, args.categorical,
+                                              args.boxes, histograms, args.min_pruning)
+    write_query(os.path.join(workload_path, args.output), prefix, query)
+    print(summary)
@@ -0,0 +1,139 @@
+import re
+from typing import Dict, List, Tuple
+
+import onnx
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.duckdb import DuckDB
+
+class RetreeDuckDB(DuckDB):
+    # sqlglot knows a 3-argument PREDICT (ML.PREDICT), ours is the inference UDF
+    class Parser(DuckDB.Parser):
+        FUNCTIONS = {name: func for name, func in DuckDB.Parser.FUNCTIONS.items() if name != 'PREDICT'}
+
+EXPLAIN_PATTERN = re.compile(r'^\s*EXPLAIN\s+ANALYZE\s+', re.IGNORECASE)
+
+def read_query(path: str) -> Tuple[str, exp.Expression]:
+    with open(path, 'r', encoding='utf-8') as f:
+        sql = f.read()
+    match = EXPLAIN_PATTERN.match(sql)
+    prefix = 'EXPLAIN ANALYZE\n' if match else ''
+    if match:
+        sql = sql[match.end():]
+    return prefix, sqlglot.parse_one(sql, dialect=RetreeDuckDB)
+
+def write_query(path: str, prefix: str, query: exp.Expression):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(prefix + query.sql(dialect=RetreeDuckDB, pretty=True) + ';')
+
+# tpch-q9 attaches a dbgen database instead of loading csv files
+TPCH_SCHEMA: Dict[str, Dict[str, str]] = {
+    'part': {'p_partkey': 'BIGINT', 'p_name': 'VARCHAR', 'p_mfgr': 'VARCHAR', 'p_brand': 'VARCHAR', 'p_type': 'VARCHAR',
+             'p_size': 'INTEGER', 'p_container': 'VARCHAR', 'p_retailprice': 'DECIMAL', 'p_comment': 'VARCHAR'},
+    'supplier': {'s_suppkey': 'BIGINT', 's_name': 'VARCHAR', 's_address': 'VARCHAR', 's_nationkey': 'INTEGER',
+                 's_phone': 'VARCHAR', 's_acctbal': 'DECIMAL', 's_comment': 'VARCHAR'},
+    'partsupp': {'ps_partkey': 'BIGINT', 'ps_suppkey': 'BIGINT', 'ps_availqty': 'BIGINT', 'ps_supplycost': 'DECIMAL',
+                 'ps_comment': 'VARCHAR'},
+    'customer': {'c_custkey': 'BIGINT', 'c_name': 'VARCHAR', 'c_address': 'VARCHAR', 'c_nationkey': 'INTEGER',
+                 'c_phone': 'VARCHAR', 'c_acctbal': 'DECIMAL', 'c_mktsegment': 'VARCHAR', 'c_comment': 'VARCHAR'},
+    'orders': {'o_orderkey': 'BIGINT', 'o_custkey': 'BIGINT', 'o_orderstatus': 'VARCHAR', 'o_totalprice': 'DECIMAL',
+               'o_orderdate': 'DATE', 'o_orderpriority': 'VARCHAR', 'o_clerk': 'VARCHAR', 'o_shippriority': 'INTEGER',
+               'o_comment': 'VARCHAR'},
+    'lineitem': {'l_orderkey': 'BIGINT', 'l_partkey': 'BIGINT', 'l_suppkey': 'BIGINT', 'l_linenumber': 'BIGINT',
+                 'l_quantity': 'DECIMAL', 'l_extendedprice': 'DECIMAL', 'l_discount': 'DECIMAL', 'l_tax': 'DECIMAL',
+                 'l_returnflag': 'VARCHAR', 'l_linestatus': 'VARCHAR', 'l_shipdate': 'DATE', 'l_commitdate': 'DATE',
+                 'l_receiptdate': 'DATE', 'l_shipinstruct': 'VARCHAR', 'l_shipmode': 'VARCHAR', 'l_comment': 'VARCHAR'},
+    'nation': {'n_nationkey': 'INTEGER', 'n_name': 'VARCHAR', 'n_regionkey': 'INTEGER', 'n_comment': 'VARCHAR'},
+    'region': {'r_regionkey': 'INTEGER', 'r_name': 'VARCHAR', 'r_comment': 'VARCHAR'},
+}
+
+def read_schema(path: str) -> Dict[str, Dict[str, str]]:
+    # CREATE TABLE t AS SELECT * FROM read_csv(..., columns={'c': 'TYPE', ...})
+    with open(path, 'r', encoding='utf-8') as f:
+        sql = f.read()
+    schema = {}
+    for table, columns in re.findall(r'CREATE\s+TABLE\s+(\w+)\s+AS.*?columns\s*=\s*\{(.*?)\}', sql, re.IGNORECASE | re.DOTALL):
+        schema[table] = {name: type for name, type in re.findall(r"'(\w+)'\s*:\s*'(\w+)'", columns)}
+    if re.search(r"ATTACH\s+'[^']*tpch[^']*'", sql, re.IGNORECASE):
+        schema.update(TPCH_SCHEMA)
+    return schema
+
+def find_predict(query: exp.Expression) -> exp.Anonymous:
+    for func in query.find_all(exp.Anonymous):
+        if func.name.lower() == 'predict':
+            return func
+    raise ValueError('query has no predict(...) call')
+
+def predict_arguments(predict: exp.Anonymous) -> List[exp.Expression]:
+    # the first argument is the model path
+    args = list(predict.expressions)
+    if args and isinstance(args[0], exp.Literal) and args[0].is_string:
+        args = args[1:]
+    return args
+
+def predict_condition(predict: exp.Anonymous) -> exp.Expression:
+    # the comparison the predict call takes part in, e.g. predict(...) > ?
+    node = predict
+    while not isinstance(node.parent, (exp.Where, exp.And)):
+        node = node.parent
+    return node
+
+def feature_arguments(model: onnx.ModelProto, predict: exp.Anonymous) -> Dict[str, exp.Expression]:
+    # model inputs are fed by the predict arguments in order
+    inputs = [input.name for input in model.graph.input]
+    args = predict_arguments(predict)
+    if len(inputs) != len(args):
+        raise ValueError(f'model has {len(inputs)} inputs, predict has {len(args)} arguments')
+    return dict(zip(inputs, args))
+
+def uncommented(expression: exp.Expression) -> exp.Expression:
+    # the template comments out unused predict arguments, keep them out of the pushed predicates
+    expression = expression.copy()
+    for node in expression.walk():
+        node.comments = None
+    return expression
+
+def conjuncts(condition: 'exp.Expression | None') -> List[exp.Expression]:
+    if condition is None:
+        return []
+    if isinstance(condition, exp.Paren):
+        return conjuncts(condition.this)
+    if isinstance(condition, exp.And):
+        return conjuncts(condition.left) + conjuncts(condition.right)
+    return [condition]
+
+def join_sources(select: exp.Select) -> List[exp.Expression]:
+    sources = []
+    from_ = select.args.get('from_') or select.args.get('from')
+    if from_ is not None:
+        sources.append(from_.this)
+    sources += [join.this for join in select.args.get('joins') or []]
+    return sources
+
+def inner_joins_only(select: exp.Select) -> bool:
+    return all(not join.side and join.kind in ('', 'INNER', 'CROSS') for join in select.args.get('joins') or [])
+
+def source_tables(select: exp.Select) -> 'List[exp.Table] | None':
+    # base tables of a select, None when a source is a subquery or an outer join
+    sources = join_sources(select)
+    if not inner_joins_only(select) or not all(isinstance(source, exp.Table) for source in sources):
+        return None
+    return sources
+
+def cte_selects(query: exp.Expression) -> Dict[str, exp.Expression]:
+    return {cte.alias_or_name.lower(): cte.this for cte in query.find_all(exp.CTE)}
+
+def projections(select: exp.Select) -> Tuple[Dict[str, exp.Expression], bool]:
+    # output name -> defining expression, and whether a * passes the source columns through
+    outputs, star = {}, False
+    for projection in select.expressions:
+        if isinstance(projection, exp.Star) or (isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star)):
+            star = True
+        elif isinstance(projection, exp.Alias):
+            outputs[projection.alias.lower()] = projection.this
+        else:
+            outputs[projection.alias_or_name.lower()] = projection
+    return outputs, star
+
+def table_name(table: exp.Table) -> str:
+    return table.alias_or_name
@@ -0,0 +1,75 @@
+import duckdb
+import numpy as np
+import pytest
+import sqlglot
+from factorize_rewrite import factorize
+from sql_utils import RetreeDuckDB
+
+# python -m pytest -q test_factorize_rewrite.py
+
+SCHEMA = {
+    'sales': {'id': 'INTEGER', 'cust_k': 'INTEGER', 'prod_k': 'INTEGER', 'amount': 'DOUBLE'},
+    'customer': {'c_k': 'INTEGER', 'age': 'DOUBLE', 'region': 'VARCHAR'},
+    'product': {'p_k': 'INTEGER', 'price': 'DOUBLE'},
+}
+
+@pytest.fixture(scope='module')
+def con():
+    rng = np.random.default_rng(0)
+    con = duckdb.connect()
+    # NULL keys on both sides of the joins, NULL features on joined rows
+    customers = ', '.join(f"({k}, {'NULL' if k % 7 == 0 else rng.integers(18, 30)}, '{'NE'[k % 2]}')" for k in range(1, 40))
+    con.sql(f"CREATE TABLE customer AS SELECT * FROM (VALUES {customers}, (NULL, 25, 'N')) AS t(c_k, age, region)")
+    products = ', '.join(f"({k}, {'NULL' if k == 3 else rng.integers(1, 5)})" for k in range(1, 10))
+    con.sql(f"CREATE TABLE product AS SELECT * FROM (VALUES {products}, (NULL, 2)) AS t(p_k, price)")
+    sales = ', '.join(f"({i}, {'NULL' if i % 11 == 0 else rng.integers(1, 45)}, {'NULL' if i % 13 == 0 else rng.integers(1, 12)}, "
+                      f"{round(float(rng.uniform(0, 100)), 2)})" for i in range(3000))
+    con.sql(f"CREATE TABLE sales AS SELECT * FROM (VALUES {sales}) AS t(id, cust_k, prod_k, amount)")
+
+    def predict(path, age, price):
+        # NULL features are a model input like any other
+        if age is None or price is None:
+            return 2
+        return int(age * 7 + price * 3) % 3
+    con.create_function('predict', predict, [con.type('VARCHAR'), con.type('DOUBLE'), con.type('DOUBLE')], con.type('BIGINT'),
+                        null_handling='special')
+    return con
+
+QUERIES = [
+    """SELECT s.id, s.amount, c.region FROM sales AS s, customer AS c, product AS p
+       WHERE s.cust_k = c.c_k AND s.prod_k = p.p_k AND c.region = 'N' AND predict('model.onnx', c.age, p.price) = ?""",
+    """SELECT s.id, p.price FROM sales AS s JOIN customer AS c ON s.cust_k = c.c_k JOIN product AS p ON p.p_k = s.prod_k
+       WHERE s.amount > 20 AND predict('model.onnx', age, price) = ?""",
+    # the other conditions of the predict conjunct stay with the lookup
+    """SELECT s.id FROM sales AS s, customer AS c
+       WHERE s.cust_k = c.c_k AND (c.region = 'N' OR predict('model.onnx', c.age, c.age) = ?)""",
+]
+
+@pytest.mark.parametrize('sql', QUERIES)
+@pytest.mark.parametrize('label', [0, 1, 2])
+def test_factorize_keeps_results(con, sql, label):
+    query = sqlglot.parse_one(sql.replace('?', str(label)), dialect=RetreeDuckDB)
+    factorized = factorize(query.copy(), SCHEMA).sql(dialect=RetreeDuckDB)
+    assert 'predict_lookup' in factorized
+    expected = con.sql(f"{query.sql(dialect=RetreeDuckDB)} ORDER BY ALL").fetchall()
+    assert expected
+    assert con.sql(f"{factorized} ORDER BY ALL").fetchall() == expected
+
+@pytest.mark.parametrize('sql, error', [
+    # an outer join keeps fact rows without a dimension row
+    ("""SELECT s.id FROM sales AS s LEFT JOIN customer AS c ON s.cust_k = c.c_k
+        WHERE predict('model.onnx', c.age, c.age) = ?""", 'outer join'),
+    ("""SELECT s.id FROM sales AS s, (SELECT * FROM customer) AS c
+        WHERE s.cust_k = c.c_k AND predict('model.onnx', c.age, c.age) = ?""", 'subquery'),
+    # a fact column among the features, no table is left to be the fact table
+    ("""SELECT s.id FROM sales AS s, customer AS c
+        WHERE s.cust_k = c.c_k AND predict('model.onnx', c.age, s.amount) = ?""", 'exactly one fact table'),
+    ("""SELECT s.id FROM sales AS s, customer AS c, product AS p
+        WHERE s.cust_k = c.c_k AND predict('model.onnx', c.age, p.price) = ?""", 'without a key join'),
+    # a joined table without features is a second fact table
+    ("""SELECT count(*) FROM sales AS s JOIN customer AS c ON s.cust_k = c.c_k JOIN product AS p ON s.prod_k = p.p_k
+        WHERE predict('model.onnx', c.age, c.age) = ?""", 'exactly one fact table'),
+])
+def test_factorize_rejects(sql, error):
+    with pytest.raises(ValueError, match=error):
+        factorize(sqlglot.parse_one(sql, dialect=RetreeDuckDB), SCHEMA)
@@ -0,0 +1,98 @@
+import numpy as np
+import onnx
+import pytest
+from onnx import helper
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from onnx_mmap import MappedModel, decode_attribute, load_model
+from utils import TREE_ENSEMBLE_FIELDS, get_feature_names, get_onehot_categories, model_attributes
+
+# python -m pytest -q test_onnx_mmap.py
+
+def decoded(attribute: onnx.AttributeProto) -> np.ndarray:
+    data = attribute.SerializeToString()
+    return decode_attribute(data, 0, len(data))
+
+def encode(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+@pytest.mark.parametrize('values', [
+    [0, 1, 127, 128, 300, 1 << 40, -1, -(1 << 40)],
+    list(range(5000)),
+])
+def test_decode_ints(values):
+    attribute = helper.make_attribute('ints', values)
+    # packed, as protobuf writes it, and one field per value, as older writers did
+    unpacked = onnx.AttributeProto(name='ints', type=onnx.AttributeProto.INTS).SerializeToString()
+    for value in values:
+        unpacked += bytes([8 << 3]) + encode(value)
+    np.testing.assert_array_equal(decoded(attribute), values)
+    np.testing.assert_array_equal(decode_attribute(unpacked, 0, len(unpacked)), values)
+
+def test_decode_empty():
+    with pytest.raises(TypeError):
+        decoded(onnx.AttributeProto(name='ints', type=onnx.AttributeProto.INTS))
+
+def test_decode_floats_and_strings():
+    floats = np.random.default_rng(0).normal(size=1000).astype(np.float32)
+    np.testing.assert_array_equal(decoded(helper.make_attribute('floats', floats.tolist())), floats)
+    unpacked = onnx.AttributeProto(name='floats', type=onnx.AttributeProto.FLOATS).SerializeToString()
+    for value in floats[:10]:
+        unpacked += bytes([7 << 3 | 5]) + value.tobytes()
+    np.testing.assert_array_equal(decode_attribute(unpacked, 0, len(unpacked)), floats[:10])
+    strings = [b'LEAF', b'BRANCH_LEQ', b'', b'\xc3\xa9']
+    assert decoded(helper.make_attribute('strings', strings)).tolist() == strings
+
+@pytest.fixture(scope='module', params=['reg', 'clf'])
+def model_path(request, tmp_path_factory):
+    # a forest behind a one-hot encoder with more categories than fit in a small attribute
+    rng = np.random.default_rng(1)
+    n = 3000
+    X = np.column_stack([rng.normal(size=n), rng.integers(0, 600, n).astype(str)]).astype(object)
+    X[:, 0] = X[:, 0].astype(float)
+    y = X[:, 0].astype(float) + (X[:, 1] < '3')
+    estimator = (RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0) if request.param == 'reg'
+                 else RandomForestClassifier(n_estimators=5, max_depth=6, random_state=0))
+    y = y if request.param == 'reg' else (y > 0.5).astype(int)
+    pipeline = Pipeline([
+        ('preprocessor', ColumnTransformer([('num', 'passthrough', [0]), ('cat', OneHotEncoder(handle_unknown='ignore'), [1])])),
+        ('model', estimator),
+    ]).fit(X, y)
+    model = convert_sklearn(pipeline, initial_types=[('x', FloatTensorType([None, 1])), ('c', StringTensorType([None, 1]))])
+    path = tmp_path_factory.mktemp(request.param) / 'model.onnx'
+    onnx.save_model(model, str(path))
+    return str(path)
+
+def test_mapped_model_matches_onnx_load(model_path):
+    expected = model_attributes(onnx.load(model_path))
+    for cache in (False, True, True):
+        # without cache, writing the cache, reading it back
+        mapped = MappedModel(model_path, cache=cache)
+        assert set(mapped.ranges) <= set(TREE_ENSEMBLE_FIELDS)
+        assert set(mapped.attributes) | set(mapped.ranges) == set(expected.attributes)
+        for name in expected.attributes:
+            assert name in mapped
+            assert mapped[name] == expected[name], name
+            if name in mapped.ranges:
+                values = mapped.array(name)
+                assert values.dtype == expected.array(name).dtype, name
+                np.testing.assert_array_equal(values, expected.array(name), err_msg=name)
+
+def test_encoders_kept(model_path):
+    model, expected = load_model(model_path), onnx.load(model_path)
+    assert len(get_onehot_categories(model, 'c')) > 500
+    assert get_onehot_categories(model, 'c') == get_onehot_categories(expected, 'c')
+    assert get_feature_names(model) == get_feature_names(expected)
+    for node, expected_node in zip(model.graph.node, expected.graph.node):
+        if not node.op_type.startswith('TreeEnsemble'):
+            assert node == expected_node
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from selectivity import BUCKETS, Histograms, column_histogram, predict_fraction
+
+# python -m pytest -q test_selectivity.py
+
+N = 50000
+
+@pytest.fixture(scope='module')
+def data():
+    # independent columns, the estimator's assumption
+    rng = np.random.default_rng(0)
+    return {
+        'price': rng.lognormal(3, 1, N),
+        'store': rng.integers(1, 20, N).astype(float),
+        'type': rng.choice(['A', 'B', 'C'], N, p=[0.5, 0.3, 0.2]).astype(object),
+    }
+
+@pytest.fixture(scope='module')
+def histograms(data):
+    return Histograms({'rows': N, 'columns': {name: column_histogram(values.astype(object)) for name, values in data.items()}})
+
+def brute_force(data, box) -> np.ndarray:
+    kept = np.ones(N, dtype=bool)
+    for column, op, value in box:
+        values = data[column]
+        if op == '<=':
+            kept &= values <= float(value)
+        elif op == '>=':
+            kept &= values >= float(value)
+        elif op == 'in':
+            kept &= values == value
+        else:
+            kept &= values != value
+    return kept
+
+BOXES = [
+    [('price', '<=', 20.0)],
+    [('price', '>=', 10.0), ('price', '<=', 40.0)],
+    [('store', '<=', 5.0), ('type', 'in', 'B')],
+    [('store', '>=', 12.0), ('type', 'not in', 'A'), ('price', '>=', 30.0)],
+    [('type', 'not in', 'A'), ('type', 'not in', 'C')],
+]
+
+def test_histogram_kinds(histograms):
+    assert 'bounds' in histograms.columns['price'] and len(histograms.columns['price']['bounds']) == BUCKETS + 1
+    assert 'values' in histograms.columns['store'] and 'values' in histograms.columns['type']
+
+@pytest.mark.parametrize('box', BOXES)
+def test_box_fraction(data, histograms, box):
+    # exact columns are within sampling noise of independence, bucketed ones within a bucket
+    assert histograms.box_fraction(box) == pytest.approx(brute_force(data, box).mean(), abs=1.5 / BUCKETS)
+
+def test_exact_columns(data, histograms):
+    box = [('store', '>=', 3.0), ('store', '<=', 7.0)]
+    assert histograms.box_fraction(box) == pytest.approx(brute_force(data, box).mean(), abs=1e-12)
+    box = [('type', 'in', 'C')]
+    assert histograms.box_fraction(box) == pytest.approx(brute_force(data, box).mean(), abs=1e-12)
+
+def test_boxes_fraction(data, histograms):
+    # disjoint boxes add up, overlapping ones are capped at 1
+    boxes = [[('price', '<=', 15.0)], [('price', '>=', 15.0001), ('price', '<=', 60.0)]]
+    union = brute_force(data, boxes[0]) | brute_force(data, boxes[1])
+    assert histograms.boxes_fraction(boxes) == pytest.approx(union.mean(), abs=2 / BUCKETS)
+    assert histograms.boxes_fraction([[('store', '>=', 0.0)], [('store', '>=', 0.0)]]) == 1.0
+
+def test_unknown_column(histograms):
+    assert histograms.box_fraction([('missing', '<=', 1.0)]) == 1.0
+
+def test_predict_fraction(tmp_path):
+    percentiles = tmp_path / 'reg.txt'
+    percentiles.write_text('\n'.join(str(float(i)) for i in range(1, 101)))
+    assert predict_fraction(str(percentiles), 25.0) == pytest.approx(0.75)
+    distribution = tmp_path / 'clf.txt'
+    distribution.write_text('0: 80.0%\n1: 20.0%\n')
+    assert predict_fraction(str(distribution), 1.0) == pytest.approx(0.2)
+    assert predict_fraction(str(distribution), 2.0) == 0.0
+    assert predict_fraction(str(tmp_path / 'none.txt'), 1.0) is None
@@ -0,0 +1,88 @@
+import inspect
+
+import duckdb
+import numpy as np
+import pytest
+import sqlglot
+from sql_rewrite import rewrite
+from sql_utils import RetreeDuckDB, find_predict, predict_arguments
+
+# python -m pytest -q test_sql_rewrite.py
+
+FEATURES = ['year', 'type', 'qty', 'price']
+
+QUERY = """
+WITH j AS (SELECT s.d AS d, s.qty AS qty, s.price AS price, st.type AS type FROM sales AS s JOIN stores AS st ON s.k = st.k)
+SELECT d, qty, price, type FROM j
+WHERE predict(CAST(EXTRACT(YEAR FROM d) AS FLOAT),
+              CASE WHEN type = 'A' THEN 1 WHEN type IN ('B', 'C') THEN 2 ELSE 3 END,
+              CAST(qty AS FLOAT), CAST(price AS INTEGER)) > ?
+"""
+
+SCHEMA = {
+    'sales': {'k': 'INTEGER', 'd': 'DATE', 'qty': 'INTEGER', 'price': 'DOUBLE'},
+    'stores': {'k': 'INTEGER', 'type': 'VARCHAR'},
+}
+
+@pytest.fixture(scope='module')
+def con():
+    rng = np.random.default_rng(0)
+    con = duckdb.connect()
+    con.sql("CREATE TABLE stores AS SELECT * FROM (VALUES (1, 'A'), (2, 'B'), (3, 'C'), (4, 'D'), (5, NULL)) AS t(k, type)")
+    n = 2000
+    days = rng.integers(0, 6 * 365, n)
+    qty = rng.integers(0, 10, n)
+    price = np.round(rng.uniform(0, 5, n), 2)
+    rows = ', '.join(f"({rng.integers(1, 6)}, DATE '2009-01-01' + {day}, {q}, {p})" for day, q, p in zip(days, qty, price))
+    con.sql(f"CREATE TABLE sales AS SELECT * FROM (VALUES {rows}, (1, NULL, 3, 2.5), (2, DATE '2012-06-01', 3, NULL)) AS t(k, d, qty, price)")
+    return con
+
+def register(con, predicates):
+    # predict keeps the rows whose arguments are all inside rvalue < x <= lvalue, the derived predicates hold
+    bounds = {FEATURES.index(feature): (lvalue, rvalue) for feature, lvalue, rvalue in predicates}
+
+    def predict(*args):
+        inside = all((rvalue is None or args[i] > rvalue) and (lvalue is None or args[i] <= lvalue) for i, (lvalue, rvalue) in bounds.items())
+        return 1.0 if inside else 0.0
+    predict.__signature__ = inspect.Signature([inspect.Parameter(f"x{i}", inspect.Parameter.POSITIONAL_ONLY) for i in range(len(FEATURES))])
+    try:
+        con.remove_function('predict')
+    except duckdb.InvalidInputException:
+        pass
+    con.create_function('predict', predict, [con.type('DOUBLE')] * len(FEATURES), con.type('DOUBLE'))
+
+def rewritten(predicates):
+    query = sqlglot.parse_one(QUERY, dialect=RetreeDuckDB)
+    arguments = dict(zip(FEATURES, predict_arguments(find_predict(query))))
+    original = rewrite(query.copy(), arguments, 0.5, [], SCHEMA)
+    return original.sql(dialect=RetreeDuckDB), rewrite(query, arguments, 0.5, predicates, SCHEMA).sql(dialect=RetreeDuckDB)
+
+@pytest.mark.parametrize('predicates, pushed', [
+    # EXTRACT(YEAR ...) becomes a date range on the stored column
+    ([('year', 2013.5, 2010.5)], ["s.d >= CAST('2011-01-01' AS DATE)", "s.d < CAST('2014-01-01' AS DATE)"]),
+    ([('year', None, 2011.0)], ["s.d >= CAST('2011-01-01' AS DATE)"]),
+    # CASE over literals becomes IN / NOT IN, NULL falls to the ELSE branch
+    ([('type', 1.5, None)], ["st.type IN ('A')"]),
+    ([('type', None, 1.5)], ["NOT st.type IN ('A') OR st.type IS NULL"]),
+    ([('type', 2.5, 1.5)], ["st.type IN ('B', 'C')"]),
+    # numeric casts are stripped, widened by what they round
+    ([('qty', 5.0, 2.0)], ['s.qty >= 1.9999998807907104', 's.qty <= 5.000000476837158']),
+    ([('price', 3.0, 1.0)], ['s.price >= 0.5', 's.price <= 3.5']),
+    ([('year', 2012.5, None), ('type', 2.5, 1.5), ('price', 2.0, None)],
+     ["s.d < CAST('2013-01-01' AS DATE)", "st.type IN ('B', 'C')", 's.price <= 2.5']),
+])
+def test_rewrite_keeps_results(con, predicates, pushed):
+    register(con, predicates)
+    original, query = rewritten(predicates)
+    for condition in pushed:
+        assert condition in query
+    expected = con.sql(f"{original} ORDER BY ALL").fetchall()
+    assert expected
+    assert con.sql(f"{query} ORDER BY ALL").fetchall() == expected
+
+def test_rewrite_filters_stored_columns(con):
+    # the filters land on the joined tables, where DuckDB can push them into the scans
+    register(con, [('year', 2013.5, 2010.5), ('type', 1.5, None)])
+    _, query = rewritten([('year', 2013.5, 2010.5), ('type', 1.5, None)])
+    assert "(SELECT * FROM sales AS s WHERE s.d >= CAST('2011-01-01' AS DATE)" in query
+    assert "(SELECT * FROM stores AS st WHERE st.type IN ('A')) AS st" in query
@@ -0,0 +1,143 @@
+import numpy as np
+import onnx
+import onnxruntime as ort
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+from gen_dt_predicates import box_rows
+from tree_model import replace_attributes
+from utils import derive_boxes, derive_feature_intervals, model_attributes, predicate_pruning, prune_model
+
+# python -m pytest -q test_utils.py
+
+def predict(model: onnx.ModelProto, X: np.ndarray) -> np.ndarray:
+    return ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider']).run(None, {'input': X})[0]
+
+@pytest.mark.parametrize('estimator, threshold', [
+    (DecisionTreeRegressor(max_depth=8, random_state=0), 2.0),
+    (RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0), 1.5),
+    (RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0), 1),
+])
+def test_prune_model(estimator, threshold):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, 4)).astype(np.float32)
+    y = X[:, 0] * 3 + X[:, 1]
+    y = (y > 1).astype(int) if isinstance(estimator, RandomForestClassifier) else y
+    model = convert_sklearn(estimator.fit(X, y), initial_types=[('input', FloatTensorType([None, 4]))])
+    # the classifier keeps every input, its intervals come from the data instead
+    intervals = derive_feature_intervals(model, threshold) or {0: (float('inf'), 0.25), 1: (0.5, float('-inf'))}
+    pruned = prune_model(model, intervals)
+    onnx.checker.check_model(pruned)
+
+    inside = np.ones(len(X), dtype=bool)
+    for feature_id, (lvalue, rvalue) in intervals.items():
+        inside &= (X[:, feature_id] > rvalue) & (X[:, feature_id] <= lvalue)
+    assert inside.any()
+    np.testing.assert_array_equal(predict(pruned, X[inside]), predict(model, X[inside]))
+    assert len(model_attributes(pruned).array('nodes_modes')) < len(model_attributes(model).array('nodes_modes'))
+
+def test_prune_model_no_intervals():
+    X = np.random.default_rng(1).normal(size=(500, 2)).astype(np.float32)
+    model = convert_sklearn(DecisionTreeRegressor(max_depth=4).fit(X, X[:, 0]), initial_types=[('input', FloatTensorType([None, 2]))])
+    pruned = prune_model(model, {})
+    for field in ('nodes_modes', 'nodes_values', 'nodes_truenodeids', 'target_nodeids', 'target_weights'):
+        np.testing.assert_array_equal(model_attributes(pruned).array(field), model_attributes(model).array(field))
+
+def test_branch_lt_rejected():
+    # x == t goes to the true child of BRANCH_LT, outside the (t[j-1], t[j]] intervals of the left
+    X = np.random.default_rng(1).normal(size=(500, 2)).astype(np.float32)
+    model = convert_sklearn(DecisionTreeRegressor(max_depth=4).fit(X, X[:, 0]), initial_types=[('input', FloatTensorType([None, 2]))])
+    modes = model_attributes(model).array('nodes_modes')
+    lt_model = replace_attributes(model, {'nodes_modes': np.where(modes == b'LEAF', modes, b'BRANCH_LT')})
+    with pytest.raises(ValueError, match='BRANCH_LT'):
+        derive_feature_intervals(lt_model, 0.0)
+    with pytest.raises(ValueError, match='BRANCH_LT'):
+        derive_boxes(lt_model, 0.0, 4)
+    with pytest.raises(ValueError, match='BRANCH_LT'):
+        prune_model(lt_model, {0: (0.5, float('-inf'))})
+
+@pytest.mark.parametrize('estimator, threshold', [
+    (DecisionTreeRegressor(max_depth=8, random_state=0), 1.05),
+    (DecisionTreeClassifier(max_depth=8, random_state=0), 1),
+])
+def test_predicate_pruning(estimator, threshold):
+    X = np.random.default_rng(2).normal(size=(3000, 3)).astype(np.float32)
+    y = X[:, 0] + X[:, 1] ** 2
+    classifier = isinstance(estimator, DecisionTreeClassifier)
+    y = (y > 1).astype(int) if classifier else y
+    tree = estimator.fit(X, y).tree_
+    model = convert_sklearn(estimator, initial_types=[('input', FloatTensorType([None, 3]))])
+
+    # the same collapse on sklearn's arrays
+    value = tree.value[:, 0].argmax(axis=1) if classifier else tree.value[:, 0, 0]
+    def walk(id, depth):
+        if tree.children_left[id] < 0:
+            holds = value[id] == threshold if classifier else value[id] > threshold
+            return holds, [depth], [depth]
+        left, right = walk(tree.children_left[id], depth + 1), walk(tree.children_right[id], depth + 1)
+        agreed = left[0] if left[0] is not None and left[0] == right[0] else None
+        return agreed, left[1] + right[1], [depth] if agreed is not None else left[2] + right[2]
+    _, depths, kept_depths = walk(0, 0)
+
+    stats = predicate_pruning(model, threshold)
+    assert stats['nodes'] == tree.node_count
+    assert stats['pruned_nodes'] == tree.node_count - (2 * len(kept_depths) - 1) > 0
+    assert stats['nodes_evaluated'] == pytest.approx(np.mean(depths))
+    assert stats['pruned_nodes_evaluated'] == pytest.approx(np.mean(kept_depths))
+
+def inside(X: np.ndarray, box) -> np.ndarray:
+    kept = np.ones(len(X), dtype=bool)
+    for feature_id, (lvalue, rvalue) in box.items():
+        kept &= (X[:, feature_id] > rvalue) & (X[:, feature_id] <= lvalue)
+    return kept
+
+@pytest.mark.parametrize('estimator, threshold', [
+    (DecisionTreeRegressor(max_depth=8, random_state=0), 1.5),
+    (DecisionTreeClassifier(max_depth=8, random_state=0), 1),
+])
+@pytest.mark.parametrize('k', [1, 2, 4, 8])
+@pytest.mark.parametrize('estimated', [False, True])
+def test_derive_boxes(estimator, threshold, k, estimated):
+    X = np.random.default_rng(3).normal(size=(5000, 3)).astype(np.float32)
+    y = np.abs(X[:, 0]) * 2 + X[:, 1]
+    classifier = isinstance(estimator, DecisionTreeClassifier)
+    y = (y > 2).astype(int) if classifier else y
+    model = convert_sklearn(estimator.fit(X, y), initial_types=[('input', FloatTensorType([None, 3]))],
+                            options={id(estimator): {'zipmap': False}} if classifier else None)
+    prediction = predict(model, X).reshape(-1)
+    kept = prediction == threshold if classifier else prediction > threshold
+    assert kept.any()
+
+    # a selectivity estimate in place of the leaf samples, as the histograms are
+    estimate = (lambda box: float(inside(X, box).mean())) if estimated else None
+    boxes = derive_boxes(model, threshold, k, estimate)
+    assert 1 <= len(boxes) <= k
+    union = np.zeros(len(X), dtype=bool)
+    for box in boxes:
+        union |= inside(X, box)
+    assert union[kept].all()
+    hull = inside(X, derive_feature_intervals(model, threshold))
+    assert not (union & ~hull).any()
+    if k == 8:
+        # the hull of |x0| spans both tails, enough boxes leave the middle out
+        assert union.sum() < hull.sum()
+
+    # the csv rows of the boxes keep the same inputs, >= and <= only widen them by the threshold points
+    names = [f'x{i}' for i in range(X.shape[1])]
+    row_union = np.zeros(len(X), dtype=bool)
+    for box in boxes:
+        row_kept = np.ones(len(X), dtype=bool)
+        for column, op, value in box_rows(box, names, {}):
+            values = X[:, names.index(column)]
+            row_kept &= values >= value if op == '>=' else values <= value
+        row_union |= row_kept
+    assert row_union[kept].all()
+    assert not (union & ~row_union).any()
+
+def test_derive_boxes_forest():
+    X = np.random.default_rng(4).normal(size=(500, 2)).astype(np.float32)
+    model = convert_sklearn(RandomForestRegressor(n_estimators=3, max_depth=3, random_state=0).fit(X, X[:, 0]),
+                            initial_types=[('input', FloatTensorType([None, 2]))])
+    assert derive_boxes(model, 0.0, 4) is None
@@ -1,165 +1,59 @@
+import os
+import sys
 import numpy as np
-from collections import Counter
-from matplotlib import pyplot as plt
-from sklearn.tree import DecisionTreeRegressor, DecisionTreeClassifier, plot_tree
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from typing import List, Tuple
+from typing import Callable, Dict, List, Tuple
 import onnx
 from onnx import helper
 import onnx.checker
 
-def get_attribute(onnx_model, attr_name):
-    i = 0
-    while 1:
-        attributes = onnx_model.graph.node[i].attribute
-        for attr in attributes:
-            if attr.name == attr_name:
-                return attr
-        i += 1
-
-class Node:
-    def __init__(
-            self,
-            id,  # 节点id
-            feature_id,  # 特征id
-            mode,  # 节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
-            value,  # 阈值，叶子节点的值为0
-            target_id,  # 叶子节点的taget id
-            target_weight,  # 叶子节点的权重，即预测值
-            samples  # 节点的样本数
-            ):
-        self.id: int = id
-        self.feature_id: int = feature_id
-        self.mode: bytes = mode
-        self.value: float = value
-        self.target_id: int | None = target_id
-        self.target_weight: float | None = target_weight
-        self.samples: int = samples
-        
-        self.parent: 'Node' | None = None
-        self.left: 'Node' | None = None
-        self.right: 'Node' | None  = None
-
-    def branch_samples(self) -> int:
-        samples = self.samples
-        
-        if self.left is not None:
-            samples += self.left.branch_samples()
-        if self.right is not None:
-            samples += self.right.branch_samples()
-        
-        return samples
-    
-    def cost(self, alpha: float) -> float:
-        if self.mode == b'LEAF':
-            return self.samples
-
-        return self.left.cost(alpha) + self.right.cost(alpha) + alpha * self.left.samples  + self.right.samples
-
-    def same_feature_branch_samples(self) -> int:
-        samples = self.samples
-        
-        if self.left is not None:
-            if self.left.mode == b'LEAF' or self.left.feature_id != self.feature_id:
-                samples += self.left.samples
-            else:
-                samples += self.left.same_feature_branch_samples()
-        if self.right is not None:
-            if self.right.mode == b'LEAF' or self.right.feature_id != self.feature_id:
-                samples += self.right.samples
-            else:
-                samples += self.right.same_feature_branch_samples()
-        
-        return samples
-
-    # 重置权重
-    def replace_samples(self) -> int:
-        if self.mode == b'LEAF':
-            self.samples = 1
-            return self.samples
-
-        self.samples = self.left.replace_samples() + self.right.replace_samples()
-        return self.samples
-    
-    def update_samples(self) -> int:
-        if self.mode == b'LEAF':
-            return self.samples
-
-        self.samples = self.left.update_samples() + self.right.update_samples()
-        return self.samples
-
-    def get_samples_list(self, samples_list: List[int]):
-        samples_list.append(self.samples)
-        if self.mode != b'LEAF':
-            self.left.get_samples_list(samples_list)
-            self.right.get_samples_list(samples_list)
-
-    def check_samples(self):
-        if self.mode != b'LEAF':
-            legal = (self.left.samples + self.right.samples == self.samples)
-            if not legal:
-                raise ValueError(f'samples not match: {self.left.samples} + {self.right.samples} != {self.samples}')
-            self.left.check_samples() 
-            self.right.check_samples()
-
-    def max_depth_to_leaf(self) -> int:
-        if self.mode == b'LEAF':
-            return 0
-
-        return 1 + max(self.left.max_depth_to_leaf(), self.right.max_depth_to_leaf())
-    
-    def tosql_v1(self, features: List[str]) -> str:
-        sql = ''
-        if self.mode == b'LEAF':
-            sql += f'{self.target_weight:.6f}'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../workloads")))
+from tree_model import (
+    TREE_ENSEMBLE_FIELDS, ModelAttributes, Node, array_attribute, bypass_branches, get_attribute, get_target_tree_intervals,
+    get_tree_ensemble_node, get_tree_intervals, model2tree, model2trees, model_attributes, treeids_intervals,
+)
+
+def get_onehot_categories(model, feature) -> 'List[str | int]':
+    producers = {output: node for node in model.graph.node for output in node.output}
+    categories = []
+    for node in model.graph.node:
+        if node.op_type != 'OneHotEncoder':
+            continue
+        # skl2onnx feeds the encoder through Gather/Cast/Reshape of the graph input
+        source = node.input[0]
+        while source in producers and producers[source].op_type in ('Gather', 'Cast', 'Identity', 'Reshape', 'Flatten', 'Squeeze', 'Unsqueeze'):
+            source = producers[source].input[0]
+        if source != feature:
+            continue
+        for attr in node.attribute:
+            if attr.name == "cats_strings":
+                categories.extend(item.decode('utf-8') for item in attr.strings)
+            elif attr.name == "cats_int64s":
+                categories.extend(attr.ints)
+    return categories
+
+def get_feature_names(model) -> List:
+    feature_names = []
+    for input in model.graph.input:
+        feature = input.name
+        categories = get_onehot_categories(model, feature)
+        if len(categories):
+            feature_names.extend(item if isinstance(item, str) else f"{feature}_{item}" for item in categories)
         else:
-            if self.left.samples > self.right.samples:
-                sql += f'CASE WHEN {features[self.feature_id]} <= {self.value:.6f} THEN {self.left.tosql_v1(features)} ELSE {self.right.tosql_v1(features)} END'
-            else:
-                sql += f'CASE WHEN {features[self.feature_id]} > {self.value:.6f} THEN {self.right.tosql_v1(features)} ELSE {self.left.tosql_v1(features)} END'
-        return sql
-
-    def tosql(self, features: List[str]) -> str:
-        if self.mode == b'LEAF':
-            return f'{self.target_weight}'
-
-        sql = ''
-        if self.mode != b'LEAF':
-            sql_l = self.left.tosql(features)
-            if sql_l == '1':
-                sql = f'{features[self.feature_id]} <= {self.value:.6f}'
-            elif sql_l not in ['', '0']:
-                sql = f'{features[self.feature_id]} <= {self.value:.6f} AND ({sql_l})'
-
-            sql_r = self.right.tosql(features)
-            if sql_r == '1':
-                if sql != '':
-                    sql = f'({sql}) OR {features[self.feature_id]} > {self.value:.6f}'
-                else:
-                    sql = f'{features[self.feature_id]} > {self.value:.6f}'
-            elif sql_r not in ['', '0']:
-                if sql != '':
-                    sql = f'({sql}) OR ({features[self.feature_id]} > {self.value:.6f} AND ({sql_r}))'
-                else:
-                    sql = f'{features[self.feature_id]} > {self.value:.6f} AND ({sql_r})'
-
-            return sql
-
-    def toEchartsJSON(self) -> dict:
-        if self.mode == b'LEAF':
-            return {
-                'name': f'{self.target_weight:.3f}',
-                'collapsed': False
-            }
-        
-        return {
-            'name': f'x{self.feature_id} <= {self.value:.3f}',
-            'collapsed': False,
-            'children': [
-                self.left.toEchartsJSON(),
-                self.right.toEchartsJSON()
-            ]
-        }
+            feature_names.append(feature)
+    return feature_names
+
+def get_onehot_features(model) -> 'Dict[int, Tuple[str, str | int]]':
+    # feature id (in get_feature_names order) -> (input, category) of every one-hot column
+    onehot_features = {}
+    feature_id = 0
+    for input in model.graph.input:
+        categories = get_onehot_categories(model, input.name)
+        for category in categories:
+            onehot_features[feature_id] = (input.name, category)
+            feature_id += 1
+        if not categories:
+            feature_id += 1
+    return onehot_features
 
 class TreeEnsembleRegressor:
     def __init__(self):
@@ -286,133 +180,292 @@ class TreeEnsembleRegressor:
             TreeEnsembleRegressor.from_tree_internal(regressor, node.left, tree_no)
             TreeEnsembleRegressor.from_tree_internal(regressor, node.right, tree_no)
 
-def get_target_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
-    target_tree_roots: List[int] = []
-    # target_treeids is ordered
-    target_treeids = get_attribute(onnx_model, 'target_treeids').ints
-    next_tree_id = 0
-    for i, tree_id in enumerate(target_treeids):
-        if tree_id == next_tree_id:
-            next_tree_id += 1
-            target_tree_roots.append(i)
-
-    target_tree_intervals: List[Tuple[int, int]] = []
-    for i, root in enumerate(target_tree_roots):
-        if i == len(target_tree_roots) - 1:
-            end = len(target_treeids)
-        else:
-            end = target_tree_roots[i + 1]
-        target_tree_intervals.append((root, end))
-    return target_tree_intervals
-
-def get_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
-    tree_roots: List[int] = []
-    # nodes_treeids is ordered
-    nodes_treeids = get_attribute(onnx_model, 'nodes_treeids').ints
-    next_tree_id = 0
-    for i, tree_id in enumerate(nodes_treeids):
-        if tree_id == next_tree_id:
-            next_tree_id += 1
-            tree_roots.append(i)
-
-    tree_intervals: List[Tuple[int, int]] = []
-    for i, root in enumerate(tree_roots):
-        if i == len(tree_roots) - 1:
-            end = len(nodes_treeids)
+def get_leaf_vectors(input_model) -> 'List[Dict[int, np.ndarray]]':
+    # per tree: leaf node id -> weight of every class (classifier) or target (regressor)
+    attributes = model_attributes(input_model)
+    prefix = 'class' if get_tree_ensemble_node(attributes).op_type == 'TreeEnsembleClassifier' else 'target'
+    treeids = attributes.array(f'{prefix}_treeids')
+    nodeids = attributes.array(f'{prefix}_nodeids')
+    ids = attributes.array(f'{prefix}_ids')
+    weights = attributes.array(f'{prefix}_weights').astype(float)
+    width = int(ids.max()) + 1
+
+    leaf_vectors: List[Dict[int, np.ndarray]] = [{} for _ in range(int(treeids.max()) + 1)]
+    for tree_id, node_id, id, weight in zip(treeids.tolist(), nodeids.tolist(), ids.tolist(), weights.tolist()):
+        vector = leaf_vectors[tree_id].setdefault(node_id, np.zeros(width))
+        vector[id] += weight
+    return leaf_vectors
+
+def get_feature_thresholds(input_model) -> Dict[int, np.ndarray]:
+    attributes = model_attributes(input_model)
+    branch = attributes.array('nodes_modes') != b'LEAF'
+    featureids = attributes.array('nodes_featureids')[branch]
+    values = attributes.array('nodes_values')[branch].astype(float)
+    return {int(feature_id): np.unique(values[featureids == feature_id]) for feature_id in np.unique(featureids)}
+
+def get_leaf_boxes(input_model, thresholds: Dict[int, np.ndarray]) -> 'List[Tuple[List[int], np.ndarray, np.ndarray]]':
+    # per tree: leaf ids and, per feature of thresholds, the range [lo, hi) of elementary
+    # intervals (t[j-1], t[j]] the leaf can be reached from
+    features = sorted(thresholds)
+    column = {feature_id: j for j, feature_id in enumerate(features)}
+    n_intervals = np.array([len(thresholds[feature_id]) + 1 for feature_id in features])
+
+    attributes = model_attributes(input_model)
+    modes = attributes.array('nodes_modes')
+    featureids = attributes.array('nodes_featureids').tolist()
+    values = attributes.array('nodes_values').astype(float)
+    truenodeids = attributes.array('nodes_truenodeids').tolist()
+    falsenodeids = attributes.array('nodes_falsenodeids').tolist()
+
+    boxes = []
+    for start, end in get_tree_intervals(attributes):
+        leaf_ids, los, his = [], [], []
+        stack = [(0, np.zeros(len(features), dtype=np.int64), n_intervals.copy())]
+        while stack:
+            id, lo, hi = stack.pop()
+            mode = modes[start + id]
+            if mode == b'LEAF':
+                leaf_ids.append(id)
+                los.append(lo)
+                his.append(hi)
+                continue
+            # x == t takes the true child of BRANCH_LT, the intervals put it on the left only under BRANCH_LEQ
+            if mode != b'BRANCH_LEQ':
+                raise ValueError(f'unsupported node mode {mode}')
+            feature_id = featureids[start + id]
+            j = column[feature_id]
+            k = int(np.searchsorted(thresholds[feature_id], values[start + id]))
+            left_hi, right_lo = hi.copy(), lo.copy()
+            left_hi[j] = min(hi[j], k + 1)
+            right_lo[j] = max(lo[j], k + 1)
+            stack.append((falsenodeids[start + id], right_lo, hi))
+            stack.append((truenodeids[start + id], lo, left_hi))
+        boxes.append((leaf_ids, np.array(los), np.array(his)))
+    return boxes
+
+def get_leaf_condition(input_model, threshold: float) -> Tuple[Callable[[np.ndarray], np.ndarray], np.ndarray]:
+    # predict(x) qualifies only if, for every component j, sum over trees of score(leaf)[j] >= bound[j]
+    attributes = model_attributes(input_model)
+    node = get_tree_ensemble_node(attributes)
+    if node.op_type == 'TreeEnsembleRegressor':
+        # predict > threshold
+        bound = threshold - (attributes['base_values'].floats[0] if 'base_values' in attributes else 0.0)
+        if 'aggregate_function' in attributes and attributes['aggregate_function'].s == b'AVERAGE':
+            bound *= len(get_tree_intervals(attributes))
+        return (lambda w: w[:1]), np.array([bound])
+    labels = attributes.array('classlabels_int64s').tolist()
+    label = labels.index(int(threshold))
+    if len(labels) == 2 and attributes.array('class_ids').max() == 0:
+        # binary models store the positive class only, label 1 iff its score > 0.5
+        if label == 1:
+            return (lambda w: w[:1]), np.array([0.5])
+        return (lambda w: -w[:1]), np.array([-0.5])
+    # predict = label: its score is at least the score of every other class
+    if len(get_tree_intervals(attributes)) == 1:
+        # a single tree predicts the argmax of the leaf it reaches
+        return (lambda w: np.min(w[label] - w, keepdims=True)), np.zeros(1)
+    return (lambda w: w[label] - w), np.zeros(len(labels))
+
+def derive_feature_intervals(input_model, threshold: float) -> 'Dict[int, Tuple[float, float]] | None':
+    # feature id -> (lvalue, rvalue) with rvalue < x[feature] <= lvalue for every x the
+    # predicate keeps; None when no x qualifies.
+    # The sum of the per-tree maximum over the leaves reachable from an elementary interval
+    # bounds the ensemble score there, intervals whose bound fails are cut.
+    attributes = model_attributes(input_model)
+    score, bound = get_leaf_condition(attributes, threshold)
+    thresholds = get_feature_thresholds(attributes)
+    features = sorted(thresholds)
+    leaf_vectors = get_leaf_vectors(attributes)
+    boxes = get_leaf_boxes(attributes, thresholds)
+
+    totals = [np.zeros((len(thresholds[feature_id]) + 1, len(bound))) for feature_id in features]
+    for tree_no, (leaf_ids, lo, hi) in enumerate(boxes):
+        scores = np.stack([score(leaf_vectors[tree_no][id]) for id in leaf_ids])
+        for j, total in enumerate(totals):
+            best = np.full(total.shape, -np.inf)
+            full = (lo[:, j] == 0) & (hi[:, j] == total.shape[0])
+            if full.any():
+                best[:] = scores[full].max(axis=0)
+            for i in np.flatnonzero(~full):
+                np.maximum(best[lo[i, j]:hi[i, j]], scores[i], out=best[lo[i, j]:hi[i, j]])
+            total += best
+
+    eps = 1e-6 * len(boxes)
+    intervals = {}
+    for feature_id, total in zip(features, totals):
+        allowed = np.flatnonzero(np.all(total >= bound - eps, axis=1))
+        if len(allowed) == 0:
+            return None
+        first, last = allowed[0], allowed[-1]
+        rvalue = float(thresholds[feature_id][first - 1]) if first > 0 else float('-inf')
+        lvalue = float(thresholds[feature_id][last]) if last < len(thresholds[feature_id]) else float('inf')
+        if rvalue != float('-inf') or lvalue != float('inf'):
+            intervals[feature_id] = (lvalue, rvalue)
+    return intervals
+
+def fold_onehot_interval(lvalue: float, rvalue: float) -> 'str | None':
+    # a one-hot column is 0 or 1: 'in' when only 1 is inside (rvalue, lvalue], 'not in' when only 0 is
+    zero = rvalue < 0 <= lvalue
+    one = rvalue < 1 <= lvalue
+    if one and not zero:
+        return 'in'
+    if zero and not one:
+        return 'not in'
+    return None
+
+def get_leaf_mass(input_model, leaf_ids: List[int]) -> np.ndarray:
+    # training samples per leaf when nodes_hitrates carries them, otherwise every leaf counts once
+    attributes = model_attributes(input_model)
+    if 'nodes_hitrates' in attributes:
+        mass = attributes.array('nodes_hitrates')[leaf_ids].astype(float)
+        if mass.sum() > len(mass):
+            return mass
+    return np.ones(len(leaf_ids))
+
+def derive_boxes(input_model, threshold: float, k: int,
+                 estimate: 'Callable[[Dict[int, Tuple[float, float]]], float] | None' = None) -> 'List[Dict[int, Tuple[float, float]]] | None':
+    # up to k boxes (feature id -> (lvalue, rvalue)) whose union holds every input a single
+    # tree keeps, largest estimated mass first; None for forests. The mass of a box is
+    # estimate(box) when given, e.g. a histogram selectivity, otherwise leaf samples.
+    # Starting from the root hull, the frontier node whose qualifying children cut the most
+    # estimated mass (ties: the most left to cut below it) is split until k boxes are reached.
+    attributes = model_attributes(input_model)
+    if len(get_tree_intervals(attributes)) != 1:
+        return None
+    score, bound = get_leaf_condition(attributes, threshold)
+    thresholds = get_feature_thresholds(attributes)
+    features = sorted(thresholds)
+    n_intervals = np.array([len(thresholds[feature_id]) + 1 for feature_id in features])
+    leaf_ids, lo, hi = get_leaf_boxes(attributes, thresholds)[0]
+    leaf_vectors = get_leaf_vectors(attributes)[0]
+    qualifying = np.array([np.all(score(leaf_vectors[id]) >= bound - 1e-6) for id in leaf_ids])
+    if not qualifying.any():
+        return []
+
+    modes = attributes.array('nodes_modes')
+    truenodeids = attributes.array('nodes_truenodeids').tolist()
+    falsenodeids = attributes.array('nodes_falsenodeids').tolist()
+    position = {id: i for i, id in enumerate(leaf_ids)}
+    below: Dict[int, List[int]] = {}
+
+    def leaves(id: int) -> List[int]:
+        if id not in below:
+            below[id] = [position[id]] if modes[id] == b'LEAF' else leaves(truenodeids[id]) + leaves(falsenodeids[id])
+        return below[id]
+
+    def hull(id: int) -> 'Tuple[np.ndarray, np.ndarray] | None':
+        kept = [i for i in leaves(id) if qualifying[i]]
+        return (lo[kept].min(axis=0), hi[kept].max(axis=0)) if kept else None
+
+    def bounds(box: Tuple[np.ndarray, np.ndarray]) -> Dict[int, Tuple[float, float]]:
+        box_lo, box_hi = box
+        box_bounds = {}
+        for j, feature_id in enumerate(features):
+            if box_lo[j] == 0 and box_hi[j] == n_intervals[j]:
+                continue
+            rvalue = float(thresholds[feature_id][box_lo[j] - 1]) if box_lo[j] > 0 else float('-inf')
+            lvalue = float(thresholds[feature_id][box_hi[j] - 1]) if box_hi[j] < n_intervals[j] else float('inf')
+            box_bounds[feature_id] = (lvalue, rvalue)
+        return box_bounds
+
+    if estimate is None:
+        mass = get_leaf_mass(attributes, leaf_ids)
+        box_mass = lambda box: float(mass[np.all((lo < box[1]) & (box[0] < hi), axis=1)].sum())
+    else:
+        box_mass = lambda box: estimate(bounds(box))
+        mass = np.array([box_mass((lo[i], hi[i])) for i in range(len(leaf_ids))])
+
+    def slack(id: int, box: Tuple[np.ndarray, np.ndarray]) -> float:
+        # what splitting below id can remove at best
+        return box_mass(box) - float(sum(mass[i] for i in leaves(id) if qualifying[i]))
+
+    frontier = {0: hull(0)}
+    while True:
+        best = None
+        for id, box in frontier.items():
+            if modes[id] == b'LEAF':
+                continue
+            children = {child: hull(child) for child in (truenodeids[id], falsenodeids[id]) if hull(child) is not None}
+            if len(frontier) - 1 + len(children) > k:
+                continue
+            gain = (box_mass(box) - sum(box_mass(child_box) for child_box in children.values()), slack(id, box))
+            if gain[0] > 0 or gain[1] > 0 or len(children) == 1:
+                if best is None or gain > best[0]:
+                    best = (gain, id, children)
+        if best is None:
+            break
+        del frontier[best[1]]
+        frontier.update(best[2])
+
+    boxes = [bounds(box) for box in sorted(frontier.values(), key=box_mass, reverse=True)]
+    return boxes
+
+def prune_model(input_model, intervals: Dict[int, Tuple[float, float]]) -> onnx.ModelProto:
+    # the model with every branch the intervals decide (rvalue < x[feature] <= lvalue) replaced
+    # by the child taken; it predicts as input_model for every x inside the intervals, so it
+    # only stands in for it behind the hull filter
+    attributes = model_attributes(input_model)
+    modes = attributes.array('nodes_modes')
+    unsupported = set(modes[modes != b'LEAF'].tolist()) - {b'BRANCH_LEQ'}
+    if unsupported:
+        raise ValueError(f'unsupported node mode {min(unsupported)}')
+    featureids = attributes.array('nodes_featureids')
+    values = attributes.array('nodes_values').astype(float)
+    truenodeids = attributes.array('nodes_truenodeids')
+    falsenodeids = attributes.array('nodes_falsenodeids')
+
+    def taken(start: int, id: int) -> int:
+        # the node reached from id through the decided branches
+        while modes[start + id] != b'LEAF':
+            lvalue, rvalue = intervals.get(int(featureids[start + id]), (float('inf'), float('-inf')))
+            if lvalue <= values[start + id]:
+                id = int(truenodeids[start + id])
+            elif rvalue >= values[start + id]:
+                id = int(falsenodeids[start + id])
+            else:
+                break
+        return id
+
+    return bypass_branches(attributes, taken)
+
+def predicate_pruning(input_model, threshold: float) -> Dict[str, float]:
+    # a decision tree under predict > threshold (= label for classifiers): every subtree whose
+    # leaves all agree on the predicate collapses into one leaf, as the prune rule does.
+    # nodes_evaluated is the mean number of comparisons from the root to a leaf, over leaves
+    # (the models carry no sample counts)
+    attributes = model_attributes(input_model)
+    if len(get_tree_intervals(attributes)) != 1:
+        raise ValueError('predicate pruning is defined for a single tree')
+    score, bound = get_leaf_condition(attributes, threshold)
+    holds = {id: bool(np.all(score(vector) >= bound)) for id, vector in get_leaf_vectors(attributes)[0].items()}
+    modes = attributes.array('nodes_modes')
+    truenodeids = attributes.array('nodes_truenodeids')
+    falsenodeids = attributes.array('nodes_falsenodeids')
+
+    agreed: Dict[int, 'bool | None'] = {}
+    def agree(id: int) -> 'bool | None':
+        if modes[id] == b'LEAF':
+            agreed[id] = holds[id]
         else:
-            end = tree_roots[i + 1]
-        tree_intervals.append((root, end))
-    return tree_intervals
-
-def model2trees(input_model, samples_list: 'List[int] | None') -> 'List[Node]':
-    tree_intervals = get_tree_intervals(input_model)
-    target_tree_intervals = get_target_tree_intervals(input_model)
-    trees = []
-    for tree_no, tree_interval in enumerate(tree_intervals):
-        root = model2tree(input_model, samples_list, 0, None, tree_interval, target_tree_intervals[tree_no])
-        trees.append(root)
-    return trees
-
-def model2tree(input_model, samples_list: 'List[int] | None', node_id, parent: 'Node | None', 
-               tree_interval: 'Tuple[int, int] | None' = None, target_tree_interval: 'Tuple[int, int] | None' = None) -> 'Node':
-    if tree_interval is None:
-        tree_interval = (0, len(get_attribute(input_model, 'nodes_treeids').ints))
-    tree_start, tree_end = tree_interval
-
-    if target_tree_interval is None:
-        target_tree_interval = (0, len(get_attribute(input_model, 'target_treeids').ints))
-    target_tree_start, target_tree_end = target_tree_interval
-
-    # input model attributes
-    # # n_targets
-    input_n_targets = get_attribute(input_model, 'n_targets').i
-    # # nodes_falsenodeids: 右侧分支
-    input_nodes_falsenodeids = get_attribute(input_model, 'nodes_falsenodeids').ints[tree_start:tree_end]
-    # # nodes_featureids: 特征id
-    input_nodes_featureids = get_attribute(input_model, 'nodes_featureids').ints[tree_start:tree_end]
-    # # nodes_hitrates
-    input_nodes_hitrates = get_attribute(input_model, 'nodes_hitrates').floats[tree_start:tree_end]
-    # # nodes_missing_value_tracks_true
-    input_nodes_missing_value_tracks_true = get_attribute(input_model, 'nodes_missing_value_tracks_true').ints[tree_start:tree_end]
-    # # nodes_modes：节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
-    input_node_modes = get_attribute(input_model, 'nodes_modes').strings[tree_start:tree_end]
-    # # nodes_nodeids
-    input_nodes_nodeids = get_attribute(input_model, 'nodes_nodeids').ints[tree_start:tree_end]
-    # # nodes_treeids
-    input_nodes_treeids = get_attribute(input_model, 'nodes_treeids').ints[tree_start:tree_end]
-    # # nodes_truenodeids: 左侧分支
-    input_nodes_truenodeids = get_attribute(input_model, 'nodes_truenodeids').ints[tree_start:tree_end]
-    # # nodes_values: 阈值，叶子节点的值为0
-    input_nodes_values = get_attribute(input_model, 'nodes_values').floats[tree_start:tree_end]
-    # # post_transform
-    input_post_transform = get_attribute(input_model, 'post_transform').s
-    # # target_ids
-    input_target_ids = get_attribute(input_model, 'target_ids').ints[target_tree_start:target_tree_end]
-    # # target_nodeids: 叶子节点的id
-    input_target_nodeids = get_attribute(input_model, 'target_nodeids').ints[target_tree_start:target_tree_end]
-    # # target_treeids
-    input_target_treeids = get_attribute(input_model, 'target_treeids').ints[target_tree_start:target_tree_end]
-    # # target_weights: 叶子节点的权重，即预测值
-    input_target_weights = get_attribute(input_model, 'target_weights').floats[target_tree_start:target_tree_end]
-
-    # node_id -> target_id
-    input_target_nodeid_map = {node_id: i for i, node_id in enumerate(input_target_nodeids)}
-
-    id = node_id
-    feature_id = input_nodes_featureids[id]
-    mode = input_node_modes[id]
-    value = input_nodes_values[id]
-    target_id = input_target_nodeid_map.get(id, None)
-    target_weight = input_target_weights[target_id] if target_id is not None else None
-    samples = int(input_nodes_hitrates[id])
-    
-    # only for debug
-    if samples_list is not None:
-        tree_samples_list = samples_list[tree_start:tree_end]
-        if samples != tree_samples_list[id]:
-            raise ValueError(f'samples not match: {samples} != {tree_samples_list[id]}')
-    
-    node = Node(
-        id=id,
-        feature_id=feature_id,
-        mode=mode,
-        value=value,
-        target_id=target_id,
-        target_weight=target_weight,
-        samples=samples
-    )
-    node.parent = parent
-    
-    if mode != b'LEAF':
-        left_node_id = input_nodes_truenodeids[id]
-        left_node = model2tree(input_model, samples_list, left_node_id, node, tree_interval, target_tree_interval)
-        node.left = left_node
-
-        right_node_id = input_nodes_falsenodeids[id]
-        right_node = model2tree(input_model, samples_list, right_node_id, node, tree_interval, target_tree_interval)
-        node.right = right_node
-
-    return node
+            left, right = agree(int(truenodeids[id])), agree(int(falsenodeids[id]))
+            agreed[id] = left if left == right else None
+        return agreed[id]
+
+    def leaf_depths(id: int, depth: int, collapse: bool) -> List[int]:
+        if modes[id] == b'LEAF' or (collapse and agreed[id] is not None):
+            return [depth]
+        return leaf_depths(int(truenodeids[id]), depth + 1, collapse) + leaf_depths(int(falsenodeids[id]), depth + 1, collapse)
+
+    agree(0)
+    depths, kept_depths = leaf_depths(0, 0, False), leaf_depths(0, 0, True)
+    nodes, kept = 2 * len(depths) - 1, 2 * len(kept_depths) - 1
+    return {
+        'nodes': nodes,
+        'pruned_nodes': nodes - kept,
+        'pruned_fraction': (nodes - kept) / nodes,
+        'nodes_evaluated': float(np.mean(depths)),
+        'pruned_nodes_evaluated': float(np.mean(kept_depths)),
+    }
 
 def clf2reg(input_model: onnx.ModelProto) -> onnx.ModelProto:
     # input model attributes
@@ -575,8 +628,5 @@ def clf2reg(input_model: onnx.ModelProto) -> onnx.ModelProto:
     output_model.ir_version = input_model.ir_version
 
     onnx.checker.check_model(output_model)
-    
-    input_model.graph.node.remove()
-    input_model.graph.node.append()
 
     return output_model
\ No newline at end of file
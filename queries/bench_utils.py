@@ -0,0 +1,130 @@
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+# Pinning and isolation checks shared by the benchmark drivers (run_python_udf.py,
+# orchestrate.py). run_retree pins itself with -c and records the same two columns.
+#
+#   python bench_utils.py --cpus 4-7        # check the cores before a run
+
+def parse_cpus(spec: 'str | None') -> List[int]:
+    # 0-3,8 -> [0, 1, 2, 3, 8]
+    cpus = []
+    for part in (spec or '').split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def format_cpus(cpus: List[int]) -> str:
+    # [0, 1, 2, 3, 8] -> 0-3,8
+    ranges: List[List[int]] = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{first}-{last}' if first != last else f'{first}' for first, last in ranges)
+
+def pin(cpus: 'List[int] | None') -> List[int]:
+    """Pin this process to cpus, before DuckDB or ORT start their threads, which inherit it."""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    return sorted(os.sched_getaffinity(0))
+
+def read_sys(path: str) -> 'str | None':
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def governor(cpus: List[int]) -> str:
+    # one name when the cores agree, e.g. performance; unknown without cpufreq (VMs, containers)
+    governors = sorted({read_sys(f'/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_governor') or 'unknown' for cpu in cpus})
+    return '|'.join(governors)
+
+def environment(cpus: 'List[int] | None' = None) -> Dict[str, str]:
+    """The CPU set and governor recorded with every result."""
+    cpus = cpus or sorted(os.sched_getaffinity(0))
+    return {'cpus': format_cpus(cpus), 'governor': governor(cpus)}
+
+def cpu_times() -> Dict[int, List[int]]:
+    times = {}
+    with open('/proc/stat', 'r', encoding='utf-8') as f:
+        for line in f:
+            name, *values = line.split()
+            if name.startswith('cpu') and name != 'cpu':
+                times[int(name[3:])] = [int(value) for value in values]
+    return times
+
+def cpu_busy(cpus: List[int], interval: float = 0.5) -> Dict[int, float]:
+    # busy fraction of each core over interval seconds; idle and iowait count as idle
+    before = cpu_times()
+    time.sleep(interval)
+    after = cpu_times()
+    busy = {}
+    for cpu in cpus:
+        delta = [a - b for a, b in zip(after.get(cpu, []), before.get(cpu, []))]
+        total = sum(delta)
+        busy[cpu] = 1 - (delta[3] + delta[4]) / total if total else 0.0
+    return busy
+
+def check_isolation(cpus: List[int], max_busy: float = 0.1, interval: float = 0.5) -> List[str]:
+    """Reasons the cores are not quiet enough to time on, empty when they are."""
+    warnings = []
+    busy = cpu_busy(cpus, interval)
+    loaded = {cpu: fraction for cpu, fraction in busy.items() if fraction > max_busy}
+    if loaded:
+        warnings.append('busy cores: ' + ', '.join(f'{cpu} {fraction:.0%}' for cpu, fraction in sorted(loaded.items())))
+
+    # an SMT sibling outside the set shares the core's execution units
+    siblings = set()
+    for cpu in cpus:
+        siblings.update(parse_cpus(read_sys(f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list')))
+    siblings -= set(cpus)
+    if siblings:
+        sibling_busy = cpu_busy(sorted(siblings), interval)
+        loaded = {cpu: fraction for cpu, fraction in sibling_busy.items() if fraction > max_busy}
+        if loaded:
+            warnings.append('busy SMT siblings: ' + ', '.join(f'{cpu} {fraction:.0%}' for cpu, fraction in sorted(loaded.items())))
+
+    # more runnable work than the cores left over, so the scheduler spills it onto ours
+    load = os.getloadavg()[0]
+    others = max((os.cpu_count() or 1) - len(cpus), 1)
+    if load > others:
+        warnings.append(f'load average {load:.2f} above the {others} cores outside the set')
+
+    governors = governor(cpus)
+    if governors not in ('performance', 'unknown'):
+        warnings.append(f'frequency governor {governors}, not performance')
+    if read_sys('/sys/devices/system/cpu/intel_pstate/no_turbo') == '0' or read_sys('/sys/devices/system/cpu/cpufreq/boost') == '1':
+        warnings.append('turbo boost enabled')
+    return warnings
+
+def setup(cpus_spec: 'str | None', strict: bool = False) -> Dict[str, str]:
+    """Pin to cpus_spec, warn (or exit when strict) if the cores are not quiet, and return the environment."""
+    cpus = pin(parse_cpus(cpus_spec))
+    warnings = check_isolation(cpus)
+    for warning in warnings:
+        print(f'warning: {warning}', file=sys.stderr)
+    if warnings and strict:
+        sys.exit(f'cores {format_cpus(cpus)} are not isolated')
+    return environment(cpus)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cpus', '-c', type=str, default=None, help='e.g. 4-7, default the current affinity')
+    parser.add_argument('--max_busy', type=float, default=0.1)
+    args = parser.parse_args()
+
+    cpus = parse_cpus(args.cpus) or sorted(os.sched_getaffinity(0))
+    warnings = check_isolation(cpus, args.max_busy)
+    print(','.join(f'{key}={value}' for key, value in environment(cpus).items()))
+    for warning in warnings:
+        print(f'warning: {warning}')
+    sys.exit(1 if warnings else 0)
@@ -0,0 +1,187 @@
+import argparse
+import csv
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from bench_utils import setup
+from scaling import FIELDS, run_driver, write_rows
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'Smart')))
+from onnx_mmap import MappedModel
+from utils import predicate_pruning
+
+# Tree-depth suite: train a decision tree per depth of a ladder with workloads/train.py,
+# derive its predicates from the prediction percentiles train.py wrote, run it through the
+# optimization levels with a run_retree sweep and report, per depth and level, the query
+# latency, the nodes evaluated per row and the fraction of nodes the prune rule removes.
+#
+# Predicates are the percentiles percentile_values puts in predicates.txt, taken from the
+# model's own model/{m}.txt (the labels for classifiers); each model gets its own, written to
+# predicates-dt.txt for its sweep and restored afterwards. Training leaves predicates.txt,
+# the forests' predicates, as it is. Nodes evaluated are the mean root-to-leaf comparisons over leaves,
+# after pruning on the levels that load the prune rule.
+#
+#   python depth_ladder.py run -w walmart_sales medical_charges -d 4 6 8 10 12 14 16 18 20 --cpus 4
+#   python depth_ladder.py analyze depth-results/raw.csv
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# percentile_values writes these percentiles to predicates.txt
+PERCENTILES = [1, 2, 3, 4, 5, 95, 96, 97, 98, 99]
+# levels without load_prune_rule.sql (see level_rules in run_retree.cpp)
+UNPRUNED_LEVELS = {'1', '8'}
+
+def model_path(workload: str, model: str) -> str:
+    return os.path.join(ROOT, 'workloads', workload, 'model', f'{model}.onnx')
+
+def model_depth(model: str) -> int:
+    # {workload}_d{depth}_l{leaves}_n{nodes}_{time}
+    return int(re.search(r'_d(\d+)_l\d+_n\d+_', model).group(1))
+
+def train_ladder(workload: str, depths: List[int], jobs: int) -> List[str]:
+    command = [sys.executable, os.path.join(ROOT, 'workloads', 'train.py'), '-w', workload, '-m', 'dt',
+               '-td'] + [str(depth) for depth in depths] + ['-j', str(jobs), '--no_predicates']
+    print('$ ' + ' '.join(command), flush=True)
+    # --no_predicates: the ladder's percentiles go to model/{m}.txt only, predicates.txt keeps the forests'
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    # train.py ends with the model names in grid order
+    return output.strip().splitlines()[-len(depths):]
+
+def model_predicates(workload: str, model: str) -> List[str]:
+    with open(os.path.join(ROOT, 'workloads', workload, 'model', f'{model}.txt'), 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if ':' in lines[0]:
+        # value_distribution: "label: share%"
+        return sorted(line.split(':')[0] for line in lines)
+    return [lines[p - 1] for p in PERCENTILES]
+
+def run_ladder(workload: str, models: List[str], levels: str, scale: str, threads: str, cpus: str,
+               retree_binary: str) -> List[dict]:
+    sql_path = os.path.join(ROOT, 'queries', 'Retree', 'workloads', workload)
+    predicates_path = os.path.join(sql_path, 'predicates-dt.txt')
+    with open(predicates_path, 'r', encoding='utf-8') as f:
+        original = f.read()
+    rows = []
+    try:
+        for model in models:
+            with open(predicates_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(model_predicates(workload, model)))
+            with tempfile.NamedTemporaryFile('w', suffix='.csv') as models_file:
+                models_file.write(f'{workload},{model}\n')
+                models_file.flush()
+                rows += run_driver([retree_binary, '-w', workload, '-s', scale, '-x', '1', '-t', threads, '-l', levels,
+                                    '-c', cpus, '-f', models_file.name],
+                                   os.path.dirname(retree_binary), os.path.join(sql_path, 'output.csv'), 'retree')
+    finally:
+        with open(predicates_path, 'w', encoding='utf-8') as f:
+            f.write(original)
+    return rows
+
+def depth_rows(rows: List[dict]) -> List[dict]:
+    """Every latency row with the depth of its model and the nodes its level evaluates and prunes."""
+    pruning: Dict[Tuple[str, str], Dict[str, float]] = {}
+    models: Dict[str, MappedModel] = {}
+    results = []
+    for row in rows:
+        workload, model, predicate = row['workload'], row['model'], row['predicate']
+        if (model, predicate) not in pruning:
+            if model not in models:
+                models[model] = MappedModel(model_path(workload, model))
+            pruning[(model, predicate)] = predicate_pruning(models[model], float(predicate))
+        stats = pruning[(model, predicate)]
+        pruned = row['level'] not in UNPRUNED_LEVELS
+        results.append({
+            'workload': workload, 'model': model, 'depth': model_depth(model), 'level': row['level'],
+            'predicate': predicate, 'scale': row['scale'], 'thread': row['thread'], 'time': float(row['time']),
+            'nodes': stats['nodes'],
+            'pruned_fraction': stats['pruned_fraction'] if pruned else 0.0,
+            'nodes_evaluated': stats['pruned_nodes_evaluated'] if pruned else stats['nodes_evaluated'],
+            'cpus': row.get('cpus', ''), 'governor': row.get('governor', ''),
+        })
+    return results
+
+def summarize(results: List[dict]) -> List[dict]:
+    # means over the predicates of a (workload, depth, level)
+    groups: Dict[tuple, List[dict]] = defaultdict(list)
+    for row in results:
+        groups[(row['workload'], row['depth'], row['level'])].append(row)
+    summary = []
+    for (workload, depth, level), group in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1], int(item[0][2]))):
+        summary.append({
+            'workload': workload, 'depth': depth, 'level': level, 'nodes': group[0]['nodes'],
+            **{field: sum(row[field] for row in group) / len(group) for field in ('time', 'pruned_fraction', 'nodes_evaluated')},
+        })
+    return summary
+
+def plot_summary(summary: List[dict], output_path: str):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    by_workload: Dict[str, Dict[str, List[dict]]] = defaultdict(lambda: defaultdict(list))
+    for row in summary:
+        by_workload[row['workload']][row['level']].append(row)
+    for workload, levels in by_workload.items():
+        fig, axes = plt.subplots(1, 3, figsize=(16, 5))
+        for level, points in sorted(levels.items(), key=lambda item: int(item[0])):
+            depths = [p['depth'] for p in points]
+            for ax, field in zip(axes, ('time', 'nodes_evaluated', 'pruned_fraction')):
+                ax.plot(depths, [p[field] for p in points], marker='o', label=f'level {level}')
+        for ax, ylabel in zip(axes, ('latency (ms)', 'nodes evaluated per row', 'pruned node fraction')):
+            ax.set_xlabel('tree depth')
+            ax.set_ylabel(ylabel)
+            ax.grid(True, alpha=0.3)
+        axes[0].set_yscale('log')
+        axes[0].legend(fontsize='small')
+        fig.suptitle(workload)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_path, f'depth-{workload}.png'), dpi=120)
+        plt.close(fig)
+
+def report(rows: List[dict], output_path: str, plot: bool = True):
+    os.makedirs(output_path, exist_ok=True)
+    results = depth_rows(rows)
+    write_rows(os.path.join(output_path, 'depth.csv'), results, list(results[0]) if results else [])
+    summary = summarize(results)
+    write_rows(os.path.join(output_path, 'depth-summary.csv'), summary, list(summary[0]) if summary else [])
+    for row in summary:
+        print(f"{row['workload']} depth {row['depth']} level {row['level']}: {row['time']:.3f} ms, "
+              f"{row['nodes_evaluated']:.1f} nodes evaluated, {row['pruned_fraction']:.1%} pruned")
+    if plot and summary:
+        plot_summary(summary, output_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['run', 'analyze'])
+    parser.add_argument('inputs', type=str, nargs='*', help='raw.csv files to analyze')
+    parser.add_argument('--workloads', '-w', type=str, nargs='+', default=[])
+    parser.add_argument('--depths', '-d', type=int, nargs='+', default=list(range(4, 21, 2)))
+    parser.add_argument('--models', '-m', type=str, nargs='+', default=None, help='trained ladder of one workload, skips training')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='depths trained at once')
+    parser.add_argument('--levels', '-l', type=str, default='1,2,3,4,5,6,7,8')
+    parser.add_argument('--scale', '-s', type=str, default='1G')
+    parser.add_argument('--threads', '-t', type=str, default='1')
+    parser.add_argument('--cpus', '-c', type=str, default=None)
+    parser.add_argument('--retree_binary', type=str, default=os.path.join(ROOT, 'queries', 'Retree', 'build', 'run_retree'))
+    parser.add_argument('--output', '-o', type=str, default='depth-results')
+    parser.add_argument('--no_plot', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        cpus = setup(args.cpus)['cpus']
+        rows = []
+        for w in args.workloads:
+            models = args.models or train_ladder(w, args.depths, args.jobs)
+            rows += run_ladder(w, models, args.levels, args.scale, args.threads, cpus, args.retree_binary)
+        os.makedirs(args.output, exist_ok=True)
+        write_rows(os.path.join(args.output, 'raw.csv'), rows, FIELDS)
+    else:
+        rows = []
+        for path in args.inputs:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                rows += list(csv.DictReader(f))
+    report(rows, args.output, not args.no_plot)
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from bench_utils import check_isolation, environment, format_cpus, parse_cpus
+
+# Run the experiment matrix as a DAG of stages instead of by hand:
+#
+#   expand:{w}              data/{w}_expand.py                    (background)
+#   train:{w}:{i}           workloads/train.py -w {w} <args>      (background)
+#   predicates:{w}:{m}      gen_dt_predicates.py per threshold    (background)
+#   rewrite:{w}:{m}:{t}     sql_rewrite.py -o query-{m}-{t}.sql   (background)
+#   retree:{w}:{s}          run_retree -x 1 sweep                 (timing)
+#   udf:{w}:{m}:{s}         run_python_udf.py                     (timing)
+#
+# Independent stages run concurrently within a CPU and memory budget. Timing stages run
+# one at a time on the cores given with --timing-cpus, background stages are pinned to the
+# other cores; without --timing-cpus a timing stage waits for the whole machine. The log
+# of a timing stage starts with its CPU set, governor and isolation warnings. A stage
+# whose outputs are newer than its inputs, and whose dependencies did not run, is skipped.
+# Stages without natural outputs (training, with timestamped model names) leave a stamp
+# file. Stage logs go to {root}/logs/orchestrate/{stage}.log.
+#
+# The matrix comes from a JSON file, e.g.
+#
+#   {"workloads": {
+#       "walmart_sales": {"expand": true, "scales": ["1G", "10G"],
+#                         "train": [["-m", "rf", "-tn", "100", "-td", "10", "--register"]],
+#                         "models": ["walmart_sales_t100_d10_l731_n1461_20250321151145"],
+#                         "thresholds": [25000, 30000], "udf": true, "retree": true,
+#                         "memory": {"expand": 8, "train": 16}}},
+#    "retree_threads": "1,4", "retree_levels": "1,2,3"}
+#
+#   python orchestrate.py matrix.json --cpus 16 --memory 64 --timing-cpus 12-15
+#   python orchestrate.py matrix.json --only 'predicates:*' --dry-run
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+class Stage:
+    def __init__(self, name: str, commands: List[List[str]], cwd: str, deps: List[str] = None,
+                 inputs: List[str] = None, outputs: List[str] = None, cpus: int = 1, memory: float = 0.0,
+                 timing: bool = False, stamp: bool = False):
+        self.name: str = name
+        self.commands: List[List[str]] = commands
+        self.cwd: str = cwd
+        self.deps: List[str] = deps or []
+        self.inputs: List[str] = inputs or []
+        self.outputs: List[str] = outputs or []
+        self.cpus: int = cpus
+        self.memory: float = memory
+        self.timing: bool = timing
+        if stamp:
+            self.outputs.append(os.path.join(ROOT, 'logs', 'orchestrate', f'{name.replace(":", "_")}.stamp'))
+
+    def up_to_date(self) -> bool:
+        # make's rule: every output exists and none is older than an existing input
+        if not self.outputs or not all(os.path.exists(path) for path in self.outputs):
+            return False
+        inputs = [os.path.getmtime(path) for path in self.inputs if os.path.exists(path)]
+        return not inputs or min(os.path.getmtime(path) for path in self.outputs) >= max(inputs)
+
+def build_stages(matrix: dict) -> Dict[str, Stage]:
+    python = sys.executable
+    stages: Dict[str, Stage] = {}
+
+    def add(stage: Stage):
+        stages[stage.name] = stage
+
+    # the scripts default to the paths of the experiment machine, point them at this checkout
+    models_root = ['--models', os.path.join(ROOT, 'workloads')]
+    for w, spec in matrix['workloads'].items():
+        workload_path = os.path.join(ROOT, 'workloads', w)
+        smart_path = os.path.join(ROOT, 'queries', 'Smart')
+        memory = spec.get('memory', {})
+        models = spec.get('models', [])
+        thresholds = spec.get('thresholds', [])
+        scales = spec.get('scales', ['1G'])
+
+        expand = []
+        if spec.get('expand'):
+            script = os.path.join(workload_path, 'data', f'{w}_expand.py')
+            add(Stage(f'expand:{w}', [[python, script]], os.path.dirname(script), inputs=[script],
+                      outputs=[os.path.join(workload_path, 'data-extension')], memory=memory.get('expand', 0.0)))
+            expand = [f'expand:{w}']
+
+        train = []
+        for i, train_args in enumerate(spec.get('train', [])):
+            script = os.path.join(ROOT, 'workloads', 'train.py')
+            jobs = int(train_args[train_args.index('-j') + 1]) if '-j' in train_args else 1
+            add(Stage(f'train:{w}:{i}', [[python, script, '-w', w, '--retree_workloads', os.path.join(ROOT, 'queries', 'Retree', 'workloads')] + train_args], os.path.dirname(script),
+                      inputs=[script, os.path.join(ROOT, 'workloads', 'utils.py')], stamp=True,
+                      cpus=spec.get('train_cpus', jobs), memory=memory.get('train', 0.0)))
+            train.append(f'train:{w}:{i}')
+
+        for m in models:
+            model = os.path.join(ROOT, 'workloads', w, 'model', f'{m}.onnx')
+            # every model has its own predicates files, gen_dt_predicates.py replaces the block of a threshold it rewrites
+            files = [f'predicates-{m}.csv', f'predicates-cat-{m}.csv', f'predicates-dnf-{m}.csv']
+            file_options = ['-p', files[0], '-c', files[1], '-b', files[2]]
+            predicates_csv = os.path.join(smart_path, 'workloads', w, files[0])
+            histograms = os.path.join(smart_path, 'workloads', w, 'histograms.json')
+            script = os.path.join(smart_path, 'gen_dt_predicates.py')
+            add(Stage(f'predicates:{w}:{m}', [[python, script, '-w', w, '-m', m, '-t', str(t)] + file_options + models_root
+                                              for t in thresholds], smart_path,
+                      deps=train, inputs=[script, model, histograms], outputs=[predicates_csv]))
+            for t in thresholds:
+                script = os.path.join(smart_path, 'sql_rewrite.py')
+                output = f'query-{m}-{t}.sql'
+                add(Stage(f'rewrite:{w}:{m}:{t}', [[python, script, '-w', w, '-m', m, '-t', str(t), '-o', output] + file_options + models_root],
+                          smart_path, deps=[f'predicates:{w}:{m}'], inputs=[script, predicates_csv, model],
+                          outputs=[os.path.join(smart_path, 'workloads', w, output)]))
+
+            if spec.get('udf'):
+                udf_path = os.path.join(ROOT, 'queries', 'PythonUDF', 'workloads', w)
+                for s in scales:
+                    add(Stage(f'udf:{w}:{m}:{s}', [[python, 'run_python_udf.py', '-w', w, '-m', m, '-s', s] + models_root], udf_path,
+                              deps=expand + train, timing=True))
+
+        if spec.get('retree'):
+            binary = matrix.get('retree_binary', os.path.join(ROOT, 'queries', 'Retree', 'build', 'run_retree'))
+            for s in scales:
+                add(Stage(f'retree:{w}:{s}', [[binary, '-w', w, '-s', s, '-x', '1', '-t', matrix.get('retree_threads', '4'),
+                                               '-l', matrix.get('retree_levels', '1,2,3,4,5,6,7')]],
+                          os.path.dirname(binary), deps=expand + train, timing=True))
+    return stages
+
+def select(stages: Dict[str, Stage], patterns: List[str]) -> Dict[str, Stage]:
+    # the stages matching a pattern and everything they depend on
+    selected = set()
+    todo = [name for name in stages if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(stages[name].deps)
+    return {name: stage for name, stage in stages.items() if name in selected}
+
+def check_acyclic(stages: Dict[str, Stage]):
+    state: Dict[str, int] = {}
+
+    def visit(name: str, path: Tuple[str, ...]):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f'dependency cycle: {" -> ".join(path + (name,))}')
+        if name not in stages:
+            raise KeyError(f'{path[-1]} depends on unknown stage {name}')
+        state[name] = 1
+        for dep in stages[name].deps:
+            visit(dep, path + (name,))
+        state[name] = 2
+
+    for name in stages:
+        visit(name, ())
+
+async def run_stages(stages: Dict[str, Stage], cpus: int, memory: float, timing_cpus: List[int],
+                     force: bool = False, dry_run: bool = False) -> Dict[str, str]:
+    """Run stages once their dependencies are done, within cpus and memory (GB).
+
+    Returns the outcome of every stage: ran, up-to-date, failed or skipped (a dependency failed).
+    """
+    check_acyclic(stages)
+    log_path = os.path.join(ROOT, 'logs', 'orchestrate')
+    os.makedirs(log_path, exist_ok=True)
+    all_cpus = sorted(os.sched_getaffinity(0))
+    background_cpus = [cpu for cpu in all_cpus if cpu not in timing_cpus] or all_cpus
+    if timing_cpus:
+        cpus = min(cpus, len(background_cpus))
+
+    outcome: Dict[str, str] = {}
+    done = {name: asyncio.Event() for name in stages}
+    budget = {'cpus': cpus, 'memory': memory}
+    available = asyncio.Condition()
+    timing_lock = asyncio.Lock()
+
+    async def reserve(need_cpus: int, need_memory: float):
+        async with available:
+            await available.wait_for(lambda: budget['cpus'] >= need_cpus and budget['memory'] >= need_memory)
+            budget['cpus'] -= need_cpus
+            budget['memory'] -= need_memory
+
+    async def release(need_cpus: int, need_memory: float):
+        async with available:
+            budget['cpus'] += need_cpus
+            budget['memory'] += need_memory
+            available.notify_all()
+
+    async def execute(stage: Stage, affinity: List[int]) -> bool:
+        if dry_run:
+            print(f'would run {stage.name}: ' + ' && '.join(' '.join(command) for command in stage.commands))
+            return True
+        with open(os.path.join(log_path, f'{stage.name.replace(":", "_")}.log'), 'w', encoding='utf-8') as log:
+            if stage.timing:
+                log.write(' '.join(f'{key}={value}' for key, value in environment(affinity).items()) + '\n')
+                # sampled off the loop, background stages keep starting meanwhile
+                for warning in await asyncio.get_running_loop().run_in_executor(None, check_isolation, affinity):
+                    log.write(f'warning: {warning}\n')
+                    print(f'{stage.name}: {warning}', file=sys.stderr)
+            for command in stage.commands:
+                log.write(f'$ {" ".join(command)}\n')
+                log.flush()
+                # taskset pins before exec, preexec_fn is unsafe with the loop's executor threads alive
+                process = await asyncio.create_subprocess_exec(
+                    'taskset', '-c', format_cpus(affinity), *command, cwd=stage.cwd, stdout=log, stderr=asyncio.subprocess.STDOUT)
+                if await process.wait() != 0:
+                    return False
+        for path in stage.outputs:
+            if path.endswith('.stamp'):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(f'{time.strftime("%Y-%m-%d %H:%M:%S")}\n')
+        return True
+
+    async def run(stage: Stage):
+        for dep in stage.deps:
+            await done[dep].wait()
+        try:
+            if any(outcome[dep] in ('failed', 'skipped') for dep in stage.deps):
+                outcome[stage.name] = 'skipped'
+                return
+            if not force and stage.up_to_date() and not any(outcome[dep] == 'ran' for dep in stage.deps):
+                outcome[stage.name] = 'up-to-date'
+                return
+            if stage.timing and timing_cpus:
+                async with timing_lock:
+                    ok = await execute(stage, timing_cpus)
+            else:
+                # a timing stage without isolated cores has the machine to itself
+                need_cpus = cpus if stage.timing else min(stage.cpus, cpus)
+                need_memory = memory if stage.timing else min(stage.memory, memory)
+                await reserve(need_cpus, need_memory)
+                try:
+                    ok = await execute(stage, all_cpus if stage.timing else background_cpus)
+                finally:
+                    await release(need_cpus, need_memory)
+            outcome[stage.name] = 'ran' if ok else 'failed'
+            print(f'{stage.name}: {outcome[stage.name]}', flush=True)
+        finally:
+            done[stage.name].set()
+
+    await asyncio.gather(*(run(stage) for stage in stages.values()))
+    return outcome
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('matrix', type=str, help='JSON file of the experiment matrix')
+    parser.add_argument('--cpus', type=int, default=len(os.sched_getaffinity(0)), help='CPU budget of background stages')
+    parser.add_argument('--memory', type=float, default=os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1 << 30),
+                        help='memory budget in GB')
+    parser.add_argument('--timing-cpus', type=str, default=None, help='cores reserved for timing stages, e.g. 12-15')
+    parser.add_argument('--only', type=str, nargs='+', default=None, help='stage name patterns, with their dependencies')
+    parser.add_argument('--force', action='store_true', help='run stages even when up to date')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    with open(args.matrix, 'r', encoding='utf-8') as f:
+        stages = build_stages(json.load(f))
+    if args.only:
+        stages = select(stages, args.only)
+    outcome = asyncio.run(run_stages(stages, args.cpus, args.memory, parse_cpus(args.timing_cpus), args.force, args.dry_run))
+    counts = {state: sum(1 for value in outcome.values() if value == state) for state in ('ran', 'up-to-date', 'failed', 'skipped')}
+    print(', '.join(f'{count} {state}' for state, count in counts.items()))
+    sys.exit(1 if counts['failed'] else 0)
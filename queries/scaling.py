@@ -0,0 +1,184 @@
+import argparse
+import csv
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from bench_utils import parse_cpus, setup
+
+# Thread-scaling suite: time predict for 1..N DuckDB threads per workload, model and
+# optimization level, then derive speedup and parallel efficiency against the fewest
+# threads measured and plot both.
+#
+#   retree  one run_retree -x 1 sweep per workload over the threads and levels
+#           (models from Retree/workloads/workload_models.csv)
+#   udf     run_python_udf.py once per model and thread count (level 0)
+#
+# Raw rows are the ones each driver appends to its output.csv during the run; they are
+# copied to {output}/raw.csv, curves go to {output}/scaling.csv and
+# {output}/scaling-{workload}.png. The knee of a curve is the most threads still at
+# --min_efficiency; beyond it adding cores stops paying off.
+#
+#   python scaling.py run -w flights walmart_sales --threads 1,2,4,8,16,32 -l 1,3,7 --cpus 0-31
+#   python scaling.py analyze raw.csv -o scaling-results
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FIELDS = ['system', 'workload', 'model', 'model_type', 'predicate', 'scale', 'thread', 'level', 'time', 'cpus', 'governor']
+KEY = ('system', 'workload', 'model', 'model_type', 'predicate', 'scale', 'level')
+
+def default_threads() -> str:
+    # powers of two up to the cores we may run on, and the core count itself
+    n = len(os.sched_getaffinity(0))
+    threads = [1 << i for i in range(n.bit_length()) if 1 << i <= n]
+    return ','.join(str(t) for t in sorted(set(threads + [n])))
+
+def workload_models(workload: str) -> List[str]:
+    path = os.path.join(ROOT, 'queries', 'Retree', 'workloads', 'workload_models.csv')
+    with open(path, 'r', encoding='utf-8') as f:
+        return [row[1] for row in csv.reader(f) if len(row) >= 2 and row[0] == workload]
+
+def appended_rows(path: str, offset: int, system: str) -> List[dict]:
+    # rows a driver appended to output.csv past offset:
+    # workload,model,model_type,predicate,scale,thread,level,time[,"cpus",governor]
+    with open(path, 'r', encoding='utf-8') as f:
+        f.seek(offset)
+        rows = []
+        for values in csv.reader(f):
+            if len(values) >= 8:
+                rows.append(dict(zip(FIELDS, [system] + values[:8] + (values[8:10] or ['', '']))))
+        return rows
+
+def run_driver(command: List[str], cwd: str, output: str, system: str) -> List[dict]:
+    offset = os.path.getsize(output) if os.path.exists(output) else 0
+    print('$ ' + ' '.join(command), flush=True)
+    subprocess.run(command, cwd=cwd, check=True)
+    return appended_rows(output, offset, system)
+
+def run_suite(workloads: List[str], systems: List[str], threads: str, levels: str, scale: str, cpus: str,
+              retree_binary: str) -> List[dict]:
+    rows = []
+    for w in workloads:
+        if 'retree' in systems:
+            rows += run_driver([retree_binary, '-w', w, '-s', scale, '-x', '1', '-t', threads, '-l', levels, '-c', cpus],
+                               os.path.dirname(retree_binary),
+                               os.path.join(ROOT, 'queries', 'Retree', 'workloads', w, 'output.csv'), 'retree')
+        if 'udf' in systems:
+            udf_path = os.path.join(ROOT, 'queries', 'PythonUDF', 'workloads', w)
+            for m in workload_models(w):
+                for t in threads.split(','):
+                    rows += run_driver([sys.executable, 'run_python_udf.py', '-w', w, '-m', m, '-s', scale, '-t', t, '--cpus', cpus],
+                                       udf_path, os.path.join(udf_path, 'output.csv'), 'udf')
+    return rows
+
+def scaling_curves(rows: List[dict], min_efficiency: float = 0.5) -> Tuple[List[dict], Dict[tuple, int]]:
+    """Speedup and efficiency of every row against the fewest threads of its curve, and the knee of each curve.
+
+    Repeated measurements of one curve and thread count are averaged.
+    """
+    samples: Dict[tuple, Dict[int, List[float]]] = defaultdict(lambda: defaultdict(list))
+    environments: Dict[tuple, Tuple[str, str]] = {}
+    for row in rows:
+        key = tuple(row[field] for field in KEY)
+        samples[key][int(row['thread'])].append(float(row['time']))
+        environments[key] = (row.get('cpus', ''), row.get('governor', ''))
+
+    curves, knees = [], {}
+    for key, by_thread in samples.items():
+        base_threads = min(by_thread)
+        base_time = sum(by_thread[base_threads]) / len(by_thread[base_threads])
+        knees[key] = base_threads
+        for threads in sorted(by_thread):
+            time = sum(by_thread[threads]) / len(by_thread[threads])
+            speedup = base_time / time if time > 0 else float('nan')
+            efficiency = speedup * base_threads / threads
+            if efficiency >= min_efficiency:
+                knees[key] = threads
+            curves.append(dict(zip(KEY, key), thread=threads, time=time, speedup=speedup, efficiency=efficiency,
+                               cpus=environments[key][0], governor=environments[key][1]))
+    return curves, knees
+
+def write_rows(path: str, rows: List[dict], fields: List[str]):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+def plot_curves(curves: List[dict], output_path: str):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    by_workload: Dict[str, Dict[tuple, List[dict]]] = defaultdict(lambda: defaultdict(list))
+    for row in curves:
+        # one line per system, model and level, the first predicate stands for the others
+        by_workload[row['workload']][(row['system'], row['model'], row['level'], row['predicate'])].append(row)
+
+    for workload, lines in by_workload.items():
+        fig, (ax_speedup, ax_efficiency) = plt.subplots(1, 2, figsize=(12, 5))
+        all_threads = set()
+        drawn = set()
+        for (system, model, level, predicate), points in sorted(lines.items()):
+            if (system, model, level) in drawn:
+                continue
+            drawn.add((system, model, level))
+            threads = [p['thread'] for p in points]
+            all_threads.update(threads)
+            label = f'{system} {model} level {level}'
+            ax_speedup.plot(threads, [p['speedup'] for p in points], marker='o', label=label)
+            ax_efficiency.plot(threads, [p['efficiency'] for p in points], marker='o', label=label)
+        ideal = sorted(all_threads)
+        ax_speedup.plot(ideal, [t / ideal[0] for t in ideal], linestyle='--', color='gray', label='ideal')
+        for ax, ylabel in ((ax_speedup, 'speedup'), (ax_efficiency, 'parallel efficiency')):
+            ax.set_xscale('log', base=2)
+            ax.set_xlabel('threads')
+            ax.set_ylabel(ylabel)
+            ax.grid(True, which='both', alpha=0.3)
+        ax_efficiency.set_ylim(0, 1.1)
+        ax_speedup.legend(fontsize='x-small')
+        fig.suptitle(workload)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_path, f'scaling-{workload}.png'), dpi=120)
+        plt.close(fig)
+
+def report(rows: List[dict], output_path: str, min_efficiency: float, plot: bool = True):
+    os.makedirs(output_path, exist_ok=True)
+    curves, knees = scaling_curves(rows, min_efficiency)
+    write_rows(os.path.join(output_path, 'scaling.csv'), curves,
+               list(KEY) + ['thread', 'time', 'speedup', 'efficiency', 'cpus', 'governor'])
+    for key, knee in sorted(knees.items()):
+        print(f"{','.join(str(value) for value in key)}: scales to {knee} threads")
+    if plot and curves:
+        plot_curves(curves, output_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['run', 'analyze'])
+    parser.add_argument('inputs', type=str, nargs='*', help='raw.csv files to analyze')
+    parser.add_argument('--workloads', '-w', type=str, nargs='+', default=[])
+    parser.add_argument('--systems', type=str, nargs='+', default=['retree', 'udf'], choices=['retree', 'udf'])
+    parser.add_argument('--threads', '-t', type=str, default=default_threads())
+    parser.add_argument('--levels', '-l', type=str, default='1,2,3,4,5,6,7,8')
+    parser.add_argument('--scale', '-s', type=str, default='1G')
+    parser.add_argument('--cpus', '-c', type=str, default=None, help='cores of the run, default the current affinity')
+    parser.add_argument('--retree_binary', type=str, default=os.path.join(ROOT, 'queries', 'Retree', 'build', 'run_retree'))
+    parser.add_argument('--min_efficiency', type=float, default=0.5)
+    parser.add_argument('--output', '-o', type=str, default='scaling-results')
+    parser.add_argument('--no_plot', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        # the drivers pin themselves to the same cores, this process only checks they are quiet
+        cpus = setup(args.cpus)['cpus']
+        if max(int(t) for t in args.threads.split(',')) > len(parse_cpus(cpus)):
+            print(f'warning: more threads than the cores {cpus}', file=sys.stderr)
+        rows = run_suite(args.workloads, args.systems, args.threads, args.levels, args.scale, cpus, args.retree_binary)
+        os.makedirs(args.output, exist_ok=True)
+        write_rows(os.path.join(args.output, 'raw.csv'), rows, FIELDS)
+    else:
+        rows = []
+        for path in args.inputs:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                rows += list(csv.DictReader(f))
+    report(rows, args.output, args.min_efficiency, not args.no_plot)
@@ -0,0 +1,217 @@
+import argparse
+import csv
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from bench_utils import parse_cpus, setup
+from scaling import workload_models, write_rows
+
+# Data-size suite: run every (workload, scale, level) in its own process on the expanded
+# data and record, besides the query time the driver averages, its load time, its peak
+# RSS and the most bytes DuckDB had spilled to its temp directory at once; then flag the
+# metrics that grow faster than the data.
+#
+#   retree  run_retree -x 1 sweep of one model and level
+#   smart   run_smart -m of each model on the rewritten query.sql of the workload (one level)
+#
+# Both drivers exit non-zero on a failed query, which fails the suite rather than
+# recording the failure's time.
+#
+# Spill is the size of a per-run temp directory (run_retree/run_smart -T) sampled every
+# --interval seconds, so spills shorter than that can be missed. --memory_limit (-M)
+# emulates a memory-limited node. A metric is flagged when it grows with an exponent above
+# 1 + --tolerance between two consecutive scales (m2 / m1 = (s2 / s1) ** exponent), or when
+# it starts spilling.
+#
+#   python size_scaling.py run -w walmart_sales -s 1G 10G 20G 50G -l 1,3,7 --memory_limit 16GB --cpus 0-7
+#   python size_scaling.py analyze size-results/size.csv
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FIELDS = ['system', 'workload', 'model', 'level', 'scale', 'thread', 'load_time', 'query_time', 'peak_rss', 'spill_bytes',
+          'cpus', 'governor']
+METRICS = ['load_time', 'query_time', 'peak_rss', 'spill_bytes']
+
+def scale_size(scale: str) -> float:
+    # 500M -> 0.5, 10G -> 10, 1T -> 1000
+    units = {'M': 1e-3, 'G': 1.0, 'T': 1e3}
+    return float(scale[:-1]) * units[scale[-1].upper()] if scale[-1].upper() in units else float(scale)
+
+def directory_size(path: str) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                # DuckDB removed it meanwhile
+                pass
+    return size
+
+def measure(command: List[str], cwd: str, cpus: List[int], temp_directory: str, interval: float) -> Tuple[str, str, int, int]:
+    """Run command on cpus, sampling temp_directory; its stdout, stderr, peak RSS in bytes and peak spill bytes."""
+    print('$ ' + ' '.join(command), flush=True)
+    with tempfile.TemporaryFile('w+') as stdout, tempfile.TemporaryFile('w+') as stderr:
+        process = subprocess.Popen(command, cwd=cwd, stdout=stdout, stderr=stderr, text=True,
+                                   preexec_fn=lambda: os.sched_setaffinity(0, cpus))
+        spill = 0
+        while True:
+            # wait4 rather than wait: the child's rusage carries its peak RSS
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            spill = max(spill, directory_size(temp_directory))
+            time.sleep(interval)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stdout.seek(0)
+        stderr.seek(0)
+        out, err = stdout.read(), stderr.read()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, out, err)
+    # ru_maxrss is in kilobytes on Linux
+    return out, err, rusage.ru_maxrss * 1024, spill
+
+def parse_run(out: str, err: str) -> Tuple[float, float]:
+    # load_time,<ms> on stderr; the result rows on stdout end with the averaged time
+    # (and the CPU set and governor of run_retree)
+    load_time = sum(float(line.split(',')[1]) for line in err.splitlines() if line.startswith('load_time,'))
+    times = []
+    for values in csv.reader(out.splitlines()):
+        if len(values) >= 8:
+            times.append(float(values[7]))
+    return load_time, sum(times) / len(times) if times else float('nan')
+
+def run_suite(workloads: List[str], systems: List[str], scales: List[str], levels: str, threads: str,
+              environment: Dict[str, str], memory_limit: 'str | None', interval: float, binaries: Dict[str, str]) -> List[dict]:
+    cpus = parse_cpus(environment['cpus'])
+    rows = []
+    for w in workloads:
+        for s in scales:
+            runs = []
+            for m in workload_models(w):
+                if 'retree' in systems:
+                    for level in levels.split(','):
+                        runs.append(('retree', m, level, ['-x', '1', '-l', level]))
+                if 'smart' in systems:
+                    runs.append(('smart', m, '3', ['-m', m]))
+            for system, model, level, options in runs:
+                temp_directory = tempfile.mkdtemp(prefix=f'{system}-{w}-{s}-')
+                command = [binaries[system], '-w', w, '-s', s, '-t', threads, '-T', temp_directory] + options
+                if memory_limit:
+                    command += ['-M', memory_limit]
+                with tempfile.NamedTemporaryFile('w', suffix='.csv') as models_file:
+                    if system == 'retree':
+                        models_file.write(f'{w},{model}\n')
+                        models_file.flush()
+                        command += ['-f', models_file.name]
+                    try:
+                        out, err, peak_rss, spill = measure(command, os.path.dirname(binaries[system]), cpus, temp_directory, interval)
+                    finally:
+                        shutil.rmtree(temp_directory, ignore_errors=True)
+                load_time, query_time = parse_run(out, err)
+                rows.append({'system': system, 'workload': w, 'model': model, 'level': level, 'scale': s, 'thread': threads,
+                             'load_time': load_time, 'query_time': query_time, 'peak_rss': peak_rss, 'spill_bytes': spill,
+                             **environment})
+    return rows
+
+def growth_flags(rows: List[dict], tolerance: float = 0.2) -> List[dict]:
+    """Metrics of a (system, workload, model, level) growing faster than the data between two consecutive scales."""
+    series: Dict[tuple, List[dict]] = defaultdict(list)
+    for row in rows:
+        series[(row['system'], row['workload'], row['model'], row['level'])].append(row)
+    flags = []
+    for key, points in series.items():
+        points = sorted(points, key=lambda row: scale_size(row['scale']))
+        if float(points[0]['spill_bytes']) > 0:
+            flags.append(dict(zip(('system', 'workload', 'model', 'level'), key), metric='spill_bytes',
+                              scale_from=points[0]['scale'], scale_to=points[0]['scale'], exponent=float('nan'),
+                              note='spills'))
+        for before, after in zip(points, points[1:]):
+            ratio = scale_size(after['scale']) / scale_size(before['scale'])
+            for metric in METRICS:
+                m1, m2 = float(before[metric]), float(after[metric])
+                if metric == 'spill_bytes' and m1 == 0 < m2:
+                    flags.append(dict(zip(('system', 'workload', 'model', 'level'), key), metric=metric,
+                                      scale_from=before['scale'], scale_to=after['scale'], exponent=float('inf'),
+                                      note='starts spilling'))
+                elif m1 > 0 and m2 > 0 and ratio > 1:
+                    exponent = math.log(m2 / m1) / math.log(ratio)
+                    if exponent > 1 + tolerance:
+                        flags.append(dict(zip(('system', 'workload', 'model', 'level'), key), metric=metric,
+                                          scale_from=before['scale'], scale_to=after['scale'], exponent=exponent,
+                                          note='super-linear'))
+    return flags
+
+def plot_rows(rows: List[dict], output_path: str):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    by_workload: Dict[str, Dict[tuple, List[dict]]] = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        by_workload[row['workload']][(row['system'], row['model'], row['level'])].append(row)
+    for workload, lines in by_workload.items():
+        fig, axes = plt.subplots(1, len(METRICS), figsize=(5 * len(METRICS), 5))
+        for (system, model, level), points in sorted(lines.items()):
+            points = sorted(points, key=lambda row: scale_size(row['scale']))
+            sizes = [scale_size(p['scale']) for p in points]
+            for ax, metric in zip(axes, METRICS):
+                ax.plot(sizes, [float(p[metric]) for p in points], marker='o', label=f'{system} {model} level {level}')
+        for ax, metric in zip(axes, METRICS):
+            ax.set_xscale('log')
+            ax.set_yscale('symlog' if metric == 'spill_bytes' else 'log')
+            ax.set_xlabel('scale (GB)')
+            ax.set_ylabel(metric)
+            ax.grid(True, which='both', alpha=0.3)
+        axes[0].legend(fontsize='x-small')
+        fig.suptitle(workload)
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_path, f'size-{workload}.png'), dpi=120)
+        plt.close(fig)
+
+def report(rows: List[dict], output_path: str, tolerance: float, plot: bool = True):
+    os.makedirs(output_path, exist_ok=True)
+    flags = growth_flags(rows, tolerance)
+    write_rows(os.path.join(output_path, 'size-flags.csv'), flags,
+               ['system', 'workload', 'model', 'level', 'metric', 'scale_from', 'scale_to', 'exponent', 'note'])
+    for flag in flags:
+        print(f"{flag['system']} {flag['workload']} {flag['model']} level {flag['level']}: {flag['metric']} "
+              f"{flag['note']} from {flag['scale_from']} to {flag['scale_to']} (exponent {flag['exponent']:.2f})")
+    if plot and rows:
+        plot_rows(rows, output_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['run', 'analyze'])
+    parser.add_argument('inputs', type=str, nargs='*', help='size.csv files to analyze')
+    parser.add_argument('--workloads', '-w', type=str, nargs='+', default=[])
+    parser.add_argument('--systems', type=str, nargs='+', default=['retree', 'smart'], choices=['retree', 'smart'])
+    parser.add_argument('--scales', '-s', type=str, nargs='+', default=['1G', '10G', '20G', '50G'])
+    parser.add_argument('--levels', '-l', type=str, default='1,3,7')
+    parser.add_argument('--threads', '-t', type=str, default='4')
+    parser.add_argument('--cpus', '-c', type=str, default=None)
+    parser.add_argument('--memory_limit', '-M', type=str, default=None, help='DuckDB memory_limit, e.g. 16GB')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between temp directory samples')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--retree_binary', type=str, default=os.path.join(ROOT, 'queries', 'Retree', 'build', 'run_retree'))
+    parser.add_argument('--smart_binary', type=str, default=os.path.join(ROOT, 'queries', 'Smart', 'build', 'run_smart'))
+    parser.add_argument('--output', '-o', type=str, default='size-results')
+    parser.add_argument('--no_plot', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        rows = run_suite(args.workloads, args.systems, args.scales, args.levels, args.threads, setup(args.cpus), args.memory_limit,
+                         args.interval, {'retree': args.retree_binary, 'smart': args.smart_binary})
+        os.makedirs(args.output, exist_ok=True)
+        write_rows(os.path.join(args.output, 'size.csv'), rows, FIELDS)
+    else:
+        rows = []
+        for path in args.inputs:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                rows += list(csv.DictReader(f))
+    report(rows, args.output, args.tolerance, not args.no_plot)
@@ -1,4 +1,5 @@
 import argparse
+from collections import Counter
 import datetime
 import numpy as np
 import onnxoptimizer
@@ -17,7 +18,8 @@ import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import plot_feature_importances, value_distribution
+from utils import value_distribution, predict_chunks
+from plotting import plot_feature_importances
 
 """ 
 flights:
@@ -121,7 +123,7 @@ model_name = f"{data_name}_d{depth}_l{leaves}_n{node_count}_{now}"
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X, Counter())
 value_distribution(pred, model_name)
 
 # convert and save model
@@ -1,4 +1,5 @@
 import argparse
+from collections import Counter
 import datetime
 import joblib
 import numpy as np
@@ -12,14 +13,14 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from skl2onnx import convert_sklearn
 from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
 
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import value_distribution, plot_feature_importances
+from utils import value_distribution, predict_chunks, export_pipeline
+from plotting import plot_feature_importances
 
 """ 
 flights:
@@ -132,7 +133,7 @@ model_name = f"{data_name}_t{tree_num}_d{sum(depth) // tree_num}_l{sum(leaves) /
 joblib.dump(pipeline, f"model/{model_name}.joblib")
 onnx_path = f"model/{model_name}.onnx"
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X, Counter())
 value_distribution(pred, model_name)
 # plot_feature_importances(model, X.shape[1], model_name)
 
@@ -144,7 +145,7 @@ type_map = {
     "object": StringTensorType([None, 1]),
 }
 init_types = [(elem, type_map[X[elem].dtype.name]) for elem in input_columns]
-model_onnx = convert_sklearn(pipeline, initial_types=init_types)
+model_onnx = export_pipeline(pipeline, init_types, n_jobs=50)
 # model_onnx = convert_sklearn(pipeline, initial_types=init_types,options={id(model): {'zipmap': False}})
 
 # optimize model
@@ -0,0 +1,176 @@
+import argparse
+import inspect
+import os
+import sys
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import onnx
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from tree_eval import evaluate, model_feeds, tree_input_function
+from tree_model import bypass_branches, get_tree_ensemble_node, model_attributes, replace_attributes
+
+"""
+Leaf-hit profiling of a tree ensemble on the rows a workload query feeds it, and the
+model compacted for them.
+
+The query is the PythonUDF one of the workload at a scale: predict is registered as a
+UDF that hands every batch DuckDB passes it to the profiler, so the rows profiled are the
+ones the query predicts on, after its joins and other filters. Hits of every node are
+written to nodes_hitrates, in place of the training samples Node.replace_samples and
+update_samples work from, so the Node trees built from the profiled model order and cost
+their branches by the production data.
+
+The compacted model replaces every branch all profiled rows leave through the same child
+by that child: subtrees no row reached are dropped and the hot paths lose the tests that
+never split them. It predicts as the model on every row the profile saw, not on rows
+taking a dropped branch; --min_hits above 0 also drops the children that few rows reach.
+
+python hit_profile.py -w walmart_sales -m <model> -s 10G -t 4
+"""
+
+class HitProfile:
+    """Node hits of a model accumulated over the batches of rows added, in node array order."""
+
+    def __init__(self, model: onnx.ModelProto, batch_rows: int = 1 << 16):
+        self.model: onnx.ModelProto = model
+        self.attributes = model_attributes(model)
+        self.inputs = tree_input_function(model)
+        self.batch_rows: int = batch_rows
+        self.rows: int = 0
+        self.node_hits: np.ndarray = np.zeros(len(self.attributes.array('nodes_modes')), dtype=np.int64)
+        # DuckDB calls UDFs from its worker threads
+        self.lock = threading.Lock()
+        self.pending: List[pd.DataFrame] = []
+        self.pending_rows: int = 0
+
+    def add(self, data: pd.DataFrame):
+        # buffer the small batches of the query up to batch_rows before evaluating them
+        with self.lock:
+            self.pending.append(data)
+            self.pending_rows += len(data)
+            if self.pending_rows < self.batch_rows:
+                return
+            batch = pd.concat(self.pending, ignore_index=True)
+            self.pending, self.pending_rows = [], 0
+        self.evaluate(batch)
+
+    def flush(self):
+        with self.lock:
+            batch = pd.concat(self.pending, ignore_index=True) if self.pending else None
+            self.pending, self.pending_rows = [], 0
+        if batch is not None:
+            self.evaluate(batch)
+
+    def evaluate(self, batch: pd.DataFrame):
+        _, counters = evaluate(self.attributes, self.inputs(model_feeds(self.model, batch)))
+        with self.lock:
+            self.rows += len(batch)
+            self.node_hits += counters.node_hits
+
+def profile(model: onnx.ModelProto, batches: Iterable[pd.DataFrame], batch_rows: int = 1 << 16) -> HitProfile:
+    hit_profile = HitProfile(model, batch_rows)
+    for batch in batches:
+        hit_profile.add(batch)
+    hit_profile.flush()
+    return hit_profile
+
+def workload_sql(workload: str, scale: str) -> Tuple[str, str]:
+    # load_data.sql and query.sql of the PythonUDF workload
+    sql_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "queries", "PythonUDF", "workloads", workload)
+    with open(os.path.join(sql_path, "load_data.sql"), "r", encoding="utf-8") as f:
+        load_data = f.read().replace("?", scale)
+    with open(os.path.join(sql_path, "query.sql"), "r", encoding="utf-8") as f:
+        # any predicate will do, the count profile_query runs makes DuckDB predict on every row either way
+        query = f.read().replace("EXPLAIN ANALYZE", "", 1).strip().rstrip(";").replace("?", "0")
+    return load_data, query
+
+def profile_query(model: onnx.ModelProto, load_data: str, query: str, threads: int, batch_rows: int = 1 << 16) -> HitProfile:
+    import duckdb
+
+    types = {onnx.TensorProto.FLOAT: 'FLOAT', onnx.TensorProto.DOUBLE: 'FLOAT', onnx.TensorProto.INT64: 'BIGINT',
+             onnx.TensorProto.STRING: 'VARCHAR'}
+    names = [input.name for input in model.graph.input]
+    classifier = get_tree_ensemble_node(model).op_type == 'TreeEnsembleClassifier'
+    hit_profile = HitProfile(model, batch_rows)
+
+    def predict(*columns):
+        hit_profile.add(pd.DataFrame({name: column.to_numpy(zero_copy_only=False) for name, column in zip(names, columns)}))
+        return np.zeros(len(columns[0]), dtype=np.int64 if classifier else np.float32)
+    # DuckDB takes the arity of a UDF from its signature
+    predict.__signature__ = inspect.Signature([inspect.Parameter(f"x{i}", inspect.Parameter.POSITIONAL_ONLY) for i in range(len(names))])
+
+    con = duckdb.connect()
+    con.sql(f"SET threads={threads};")
+    con.sql(load_data)
+    con.create_function("predict", predict, [con.type(types[input.type.tensor_type.elem_type]) for input in model.graph.input],
+                        con.type("BIGINT" if classifier else "FLOAT"), type="arrow")
+    con.sql(f"SELECT count(*) FROM ({query})").fetchall()
+    hit_profile.flush()
+    return hit_profile
+
+def with_hitrates(input_model, node_hits: np.ndarray) -> onnx.ModelProto:
+    return replace_attributes(input_model, {'nodes_hitrates': node_hits.astype(np.float32)})
+
+def compact_model(input_model, node_hits: np.ndarray, min_hits: int = 0) -> onnx.ModelProto:
+    # the model with every branch whose other child got at most min_hits replaced by the child
+    # hit, and the profiled hits as its nodes_hitrates
+    attributes = model_attributes(with_hitrates(input_model, node_hits))
+    modes = attributes.array('nodes_modes')
+    truenodeids = attributes.array('nodes_truenodeids')
+    falsenodeids = attributes.array('nodes_falsenodeids')
+
+    def taken(start: int, id: int) -> int:
+        while modes[start + id] != b'LEAF':
+            true_id, false_id = int(truenodeids[start + id]), int(falsenodeids[start + id])
+            if node_hits[start + false_id] <= min_hits < node_hits[start + true_id]:
+                id = true_id
+            elif node_hits[start + true_id] <= min_hits < node_hits[start + false_id]:
+                id = false_id
+            else:
+                break
+        return id
+
+    return bypass_branches(attributes, taken)
+
+def compaction_summary(input_model, compacted: onnx.ModelProto, hit_profile: HitProfile) -> Dict[str, float]:
+    # comparisons per row from the hits of the branches, the compacted model keeps the hits of its nodes
+    attributes, compacted_attributes = model_attributes(input_model), model_attributes(compacted)
+    is_branch = attributes.array('nodes_modes') != b'LEAF'
+    compacted_is_branch = compacted_attributes.array('nodes_modes') != b'LEAF'
+    rows = max(hit_profile.rows, 1)
+    return {
+        'rows': hit_profile.rows,
+        'nodes': len(is_branch),
+        'compacted_nodes': len(compacted_is_branch),
+        'leaves_hit': int((hit_profile.node_hits[~is_branch] > 0).sum()),
+        'leaves': int((~is_branch).sum()),
+        'comparisons': float(hit_profile.node_hits[is_branch].sum()) / rows,
+        'compacted_comparisons': float(compacted_attributes.array('nodes_hitrates')[compacted_is_branch].astype(np.float64).sum()) / rows,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", "-w", type=str, required=True)
+    parser.add_argument("--model", "-m", type=str, required=True)
+    parser.add_argument("--scale", "-s", type=str, default="1G", help="data-extension scale the query loads")
+    parser.add_argument("--threads", "-t", type=int, default=1, help="DuckDB threads")
+    parser.add_argument("--batch_rows", "-b", type=int, default=1 << 16, help="rows evaluated at once")
+    parser.add_argument("--min_hits", type=int, default=0, help="children hit at most this often are dropped")
+    args = parser.parse_args()
+
+    model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.workload, "model")
+    model = onnx.load(os.path.join(model_path, f"{args.model}.onnx"))
+    hit_profile = profile_query(model, *workload_sql(args.workload, args.scale), args.threads, args.batch_rows)
+
+    onnx.save(with_hitrates(model, hit_profile.node_hits), os.path.join(model_path, f"{args.model}-profiled-{args.scale}.onnx"))
+    compacted = compact_model(model, hit_profile.node_hits, args.min_hits)
+    onnx.checker.check_model(compacted)
+    onnx.save(compacted, os.path.join(model_path, f"{args.model}-compacted-{args.scale}.onnx"))
+    summary = compaction_summary(model, compacted, hit_profile)
+    print(f"{args.model}: {summary['rows']} rows, {summary['leaves_hit']}/{summary['leaves']} leaves hit, "
+          f"{summary['nodes']} -> {summary['compacted_nodes']} nodes, "
+          f"{summary['comparisons']:.2f} -> {summary['compacted_comparisons']:.2f} comparisons per row")
@@ -19,7 +19,8 @@ import os
 from sklearn.tree import DecisionTreeRegressor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import plot_value_distribution, percentile_values
+from utils import percentile_values, predict_chunks
+from plotting import plot_value_distribution
 
 """ 
 bike sharing demand:
@@ -87,7 +88,7 @@ model_name = f"{data_name}_d{depth}_l{leaves}_n{node_count}_{now}"
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X)
 plot_value_distribution(pred, model_name)
 percentile_values(pred, data_name, model_name)
 
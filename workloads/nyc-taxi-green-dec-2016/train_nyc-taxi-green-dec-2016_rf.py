@@ -9,7 +9,6 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_squared_log_error, r2_score
 import onnx
 import datetime
-from skl2onnx import convert_sklearn
 from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
 import argparse
 
@@ -17,7 +16,8 @@ import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import plot_feature_importances, plot_hist, plot_value_distribution, percentile_values
+from utils import percentile_values, predict_chunks, export_pipeline
+from plotting import plot_feature_importances, plot_hist, plot_value_distribution
 
 """ 
 nyc-taxi-green-dec-2016:
@@ -103,7 +103,7 @@ model_name = f"{data_name}_t{tree_num}_d{sum(depth) // tree_num}_l{sum(leaves) /
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X)
 plot_value_distribution(pred, model_name)
 percentile_values(pred, data_name, model_name)
 
@@ -116,7 +116,7 @@ type_map = {
     "object": StringTensorType([None, 1]),
 }
 init_types = [(elem, type_map[X[elem].dtype.name]) for elem in input_columns]
-model_onnx = convert_sklearn(pipeline, initial_types=init_types)
+model_onnx = export_pipeline(pipeline, init_types, n_jobs=50)
 
 # optimize model
 optimized_model = onnxoptimizer.optimize(model_onnx)
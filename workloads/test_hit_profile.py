@@ -0,0 +1,67 @@
+import numpy as np
+import onnx
+import onnxruntime as ort
+import pandas as pd
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeRegressor
+from hit_profile import compact_model, compaction_summary, profile, profile_query
+from tree_eval import evaluate, model_feeds, tree_inputs
+from tree_model import model_attributes
+
+# python -m pytest -q test_hit_profile.py
+
+def predict(model: onnx.ModelProto, data: pd.DataFrame) -> np.ndarray:
+    session = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider'])
+    return session.run(None, {name: data[[name]].to_numpy(np.float32) for name in data.columns})[0]
+
+def skewed_model(estimator):
+    # trained on the whole range, queried on x0 > 1 only
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({f'x{i}': rng.normal(size=4000).astype(np.float32) for i in range(3)})
+    y = data['x0'] * 3 + data['x1']
+    y = (y > 1).astype(int) if isinstance(estimator, RandomForestClassifier) else y
+    pipeline = Pipeline([('preprocessor', ColumnTransformer([('num', 'passthrough', list(data.columns))])), ('model', estimator)])
+    model = convert_sklearn(pipeline.fit(data, y), initial_types=[(name, FloatTensorType([None, 1])) for name in data.columns],
+                            options={id(estimator): {'zipmap': False}} if isinstance(estimator, RandomForestClassifier) else None)
+    return model, data[data['x0'] > 1].reset_index(drop=True)
+
+def node_hits(model: onnx.ModelProto, data: pd.DataFrame) -> np.ndarray:
+    return evaluate(model, tree_inputs(model, model_feeds(model, data)))[1].node_hits
+
+@pytest.mark.parametrize('estimator', [
+    DecisionTreeRegressor(max_depth=10, random_state=0),
+    RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0),
+    RandomForestClassifier(n_estimators=10, max_depth=8, random_state=0),
+])
+def test_compact_model_on_profiled_rows(estimator):
+    model, data = skewed_model(estimator)
+    hit_profile = profile(model, (data.iloc[start:start + 90] for start in range(0, len(data), 90)), batch_rows=200)
+    np.testing.assert_array_equal(hit_profile.node_hits, node_hits(model, data))
+    assert hit_profile.rows == len(data)
+
+    compacted = compact_model(model, hit_profile.node_hits)
+    onnx.checker.check_model(compacted)
+    np.testing.assert_array_equal(predict(compacted, data), predict(model, data))
+    summary = compaction_summary(model, compacted, hit_profile)
+    assert summary['compacted_nodes'] < summary['nodes']
+    assert summary['compacted_comparisons'] < summary['comparisons']
+    _, compacted_counters = evaluate(compacted, tree_inputs(compacted, model_feeds(compacted, data)))
+    assert compacted_counters.comparisons.mean() == pytest.approx(summary['compacted_comparisons'])
+    # every root keeps the rows of its tree
+    hitrates = model_attributes(compacted).array('nodes_hitrates')
+    assert (hitrates[model_attributes(compacted).array('nodes_nodeids') == 0] == len(data)).all()
+
+def test_profile_query(tmp_path):
+    model, data = skewed_model(RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0))
+    data.to_parquet(tmp_path / 'data.parquet')
+    load_data = f"CREATE TABLE t AS SELECT * FROM read_parquet('{tmp_path / 'data.parquet'}');"
+    # the rows predict sees are the ones the other filter keeps
+    hit_profile = profile_query(model, load_data, 'SELECT * FROM t WHERE x2 > 0 AND predict(x0, x1, x2) > 0', 2, batch_rows=64)
+    queried = data[data['x2'] > 0]
+    assert hit_profile.rows == len(queried)
+    np.testing.assert_array_equal(hit_profile.node_hits, node_hits(model, queried))
@@ -0,0 +1,61 @@
+import numpy as np
+import onnxruntime as ort
+import pandas as pd
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.tree import DecisionTreeRegressor
+from tree_eval import evaluate, model_feeds, tree_inputs
+
+# python -m pytest -q test_tree_eval.py
+
+@pytest.mark.parametrize('estimator', [
+    DecisionTreeRegressor(max_depth=8, random_state=0),
+    RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0),
+    RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0),
+])
+def test_evaluate_matches_ort_and_decision_path(estimator):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(3000, 4)).astype(np.float32)
+    X[rng.random(X.shape) < 0.01] = np.nan
+    y = np.nan_to_num(X[:, 0]) * 3 + np.nan_to_num(X[:, 1])
+    classifier = isinstance(estimator, RandomForestClassifier)
+    estimator.fit(np.nan_to_num(X), (y > 1).astype(int) if classifier else y)
+    model = convert_sklearn(estimator, initial_types=[('input', FloatTensorType([None, 4]))],
+                            options={id(estimator): {'zipmap': False}} if classifier else None)
+
+    scores, counters = evaluate(model, X)
+    session = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider'])
+    if classifier:
+        # binary models carry the weights of the positive class only
+        probabilities = session.run(None, {'input': X})[1]
+        np.testing.assert_allclose(scores[:, 0], probabilities[:, 1], rtol=1e-5, atol=1e-5)
+    else:
+        np.testing.assert_allclose(scores[:, 0], session.run(None, {'input': X})[0][:, 0], rtol=1e-5, atol=1e-5)
+
+    # sklearn visits the same nodes on rows without missing values
+    complete = ~np.isnan(X).any(axis=1)
+    n_trees = len(getattr(estimator, 'estimators_', [estimator]))
+    path = estimator.decision_path(X[complete])
+    path = path[0] if isinstance(path, tuple) else path
+    np.testing.assert_array_equal(counters.comparisons[complete], np.asarray(path.sum(axis=1)).ravel() - n_trees)
+    assert counters.feature_tests.sum() == counters.comparisons.sum()
+
+def test_tree_inputs_behind_encoder():
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame({'x': rng.normal(size=2000).astype(np.float32), 'c': rng.integers(0, 20, 2000).astype(str)})
+    y = data['x'] + (data['c'] < '5')
+    pipeline = Pipeline([
+        ('preprocessor', ColumnTransformer([('num', 'passthrough', ['x']), ('cat', OneHotEncoder(handle_unknown='ignore'), ['c'])])),
+        ('model', RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0)),
+    ]).fit(data, y)
+    model = convert_sklearn(pipeline, initial_types=[('x', FloatTensorType([None, 1])), ('c', StringTensorType([None, 1]))])
+    feeds = model_feeds(model, data)
+    scores, counters = evaluate(model, tree_inputs(model, feeds))
+    expected = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider']).run(None, feeds)[0]
+    np.testing.assert_allclose(scores[:, 0], expected[:, 0], rtol=1e-5, atol=1e-5)
+    assert counters.comparisons.min() >= 5
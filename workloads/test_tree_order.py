@@ -0,0 +1,49 @@
+import numpy as np
+import onnxruntime as ort
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from tree_eval import evaluate
+from tree_model import get_tree_intervals
+from tree_order import METADATA_KEY, early_exit, order_trees, remaining_bounds
+
+# python -m pytest -q test_tree_order.py
+
+@pytest.mark.parametrize('estimator', [
+    RandomForestRegressor(n_estimators=50, max_depth=6, random_state=0),
+    GradientBoostingRegressor(n_estimators=50, max_depth=3, random_state=0),
+])
+def test_early_exit_matches_full_evaluation(estimator):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(4000, 4)).astype(np.float32)
+    y = X[:, 0] * 3 + X[:, 1] + rng.normal(scale=0.5, size=len(X))
+    model = convert_sklearn(estimator.fit(X, y), initial_types=[('input', FloatTensorType([None, 4]))])
+    ordered = order_trees(model)
+    assert any(entry.key == METADATA_KEY for entry in ordered.metadata_props)
+
+    session = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider'])
+    ordered_session = ort.InferenceSession(ordered.SerializeToString(), providers=['CPUExecutionProvider'])
+    np.testing.assert_allclose(ordered_session.run(None, {'input': X})[0], session.run(None, {'input': X})[0], rtol=1e-4, atol=1e-4)
+
+    scores = evaluate(model, X)[0][:, 0]
+    n_trees = len(get_tree_intervals(model))
+    for percentile, operator in ((1, '>'), (99, '>'), (50, '<=')):
+        threshold = float(np.percentile(scores, percentile))
+        decisions, trees_evaluated = early_exit(ordered, X, threshold, operator)
+        expected = scores > threshold if operator == '>' else scores <= threshold
+        np.testing.assert_array_equal(decisions, expected)
+        assert trees_evaluated.max() <= n_trees
+        if percentile != 50:
+            assert trees_evaluated.mean() < n_trees / 2
+
+def test_remaining_bounds_without_metadata():
+    X = np.random.default_rng(1).normal(size=(500, 2)).astype(np.float32)
+    model = convert_sklearn(RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(X, X[:, 0]),
+                            initial_types=[('input', FloatTensorType([None, 2]))])
+    remaining_min, remaining_max = remaining_bounds(model)
+    assert len(remaining_min) == 6 and remaining_min[-1] == remaining_max[-1] == 0
+    assert (np.diff(remaining_max) <= 0).all() and (remaining_min <= remaining_max).all()
+    scores = evaluate(model, X)[0][:, 0]
+    decisions, trees_evaluated = early_exit(model, X, 0.0)
+    np.testing.assert_array_equal(decisions, scores > 0.0)
@@ -0,0 +1,83 @@
+import numpy as np
+import onnx
+import pytest
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from sklearn.base import is_classifier
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+from utils import QuantileSketch, export_pipeline
+
+# python -m pytest -q test_utils.py
+
+PERCENTILES = np.arange(1, 100)
+
+def rank_error(sketch: QuantileSketch, values: np.ndarray) -> float:
+    # worst distance, in percentile points, between the asked and the true rank of an answer
+    sorted_values = np.sort(values)
+    ranks = np.searchsorted(sorted_values, sketch.percentile(PERCENTILES), side='right') / len(values) * 100
+    return float(np.max(np.abs(ranks - PERCENTILES)))
+
+def test_sketch_exact_below_capacity():
+    values = np.random.default_rng(0).normal(size=1000)
+    sketch = QuantileSketch(capacity=1024).update(values)
+    assert len(sketch.levels) == 1
+    np.testing.assert_array_equal(sketch.percentile(PERCENTILES), np.percentile(values, PERCENTILES))
+
+def test_sketch_rank_error():
+    values = np.random.default_rng(1).lognormal(size=1_000_000)
+    sketch = QuantileSketch(capacity=1 << 12)
+    for chunk in np.array_split(values, 37):
+        sketch.update(chunk)
+    assert sketch.count == len(values)
+    assert sum(len(items) for items in sketch.levels) < len(values) // 10
+    assert rank_error(sketch, values) < 0.5
+    assert sketch.min == values.min() and sketch.max == values.max()
+
+def test_sketch_merge():
+    rng = np.random.default_rng(2)
+    left, right = rng.normal(size=300_000), rng.normal(2, 1, size=200_000)
+    merged = QuantileSketch(capacity=1 << 12, seed=1).update(left).merge(QuantileSketch(capacity=1 << 12, seed=2).update(right))
+    assert merged.count == len(left) + len(right)
+    assert rank_error(merged, np.concatenate([left, right])) < 0.5
+
+def test_sketch_cdf_and_histogram():
+    values = np.random.default_rng(3).uniform(size=200_000)
+    sketch = QuantileSketch(capacity=1 << 12).update(values)
+    assert sketch.cdf(0.25) == pytest.approx(0.25, abs=0.01)
+    counts, edges = sketch.histogram(bins=10)
+    assert counts.sum() == pytest.approx(len(values))
+    np.testing.assert_allclose(counts, np.histogram(values, edges)[0], rtol=0.05)
+
+def ensemble_attributes(model_onnx) -> dict:
+    node = next(node for node in model_onnx.graph.node if node.op_type.startswith('TreeEnsemble'))
+    return {attribute.name: onnx.helper.get_attribute_value(attribute) for attribute in node.attribute}
+
+@pytest.mark.parametrize('estimator', [
+    DecisionTreeRegressor(max_depth=6, random_state=0),
+    RandomForestRegressor(n_estimators=3, max_depth=5, random_state=0),
+    RandomForestClassifier(n_estimators=3, max_depth=5, random_state=0),
+    DecisionTreeClassifier(max_depth=5, random_state=0),
+])
+def test_export_pipeline_matches_convert_sklearn(estimator):
+    # neighbouring float32 values, midpoints between them are not float32 and round down in skl2onnx
+    rng = np.random.default_rng(4)
+    grid = np.float32(1.0) + np.arange(8, dtype=np.float32) * np.finfo(np.float32).eps
+    X = np.column_stack([rng.choice(grid, 2000), rng.choice(grid * 3, 2000), rng.normal(size=2000)])
+    y = (X[:, 0] > grid[3]).astype(int) + (X[:, 1] > grid[5] * 3) + (X[:, 2] > 0) if is_classifier(estimator) else X[:, 0] * 10 + X[:, 2]
+    pipeline = Pipeline([('preprocessor', ColumnTransformer([('num', 'passthrough', [0, 1, 2])])), ('model', estimator)]).fit(X, y)
+    initial_types = [('input', FloatTensorType([None, 3]))]
+
+    exported = ensemble_attributes(export_pipeline(pipeline, initial_types))
+    expected = ensemble_attributes(convert_sklearn(pipeline, initial_types=initial_types))
+    assert exported.keys() == expected.keys()
+    for name in expected:
+        if name == 'nodes_hitrates':
+            # training samples per node instead of skl2onnx's constant 1.0
+            continue
+        if name.endswith(('_values', '_weights')) or name == 'base_values':
+            np.testing.assert_array_equal(np.float32(exported[name]), np.float32(expected[name]), err_msg=name)
+        else:
+            assert exported[name] == expected[name], name
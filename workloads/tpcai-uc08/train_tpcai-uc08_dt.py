@@ -11,6 +11,7 @@ import datetime
 from skl2onnx import convert_sklearn
 from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
 import argparse
+from collections import Counter
 
 import sys
 import os
@@ -18,7 +19,7 @@ import os
 from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import value_distribution
+from utils import value_distribution, predict_chunks
 
 """ 
 tpcai-uc08:
@@ -89,7 +90,7 @@ model_name = f"{data_name}_d{depth}_l{leaves}_n{node_count}_{now}"
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X, Counter())
 value_distribution(pred, model_name)
 
 # convert and save model
@@ -8,15 +8,15 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 import onnx
 import datetime
-from skl2onnx import convert_sklearn
 from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
 import argparse
+from collections import Counter
 
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import value_distribution
+from utils import value_distribution, predict_chunks, export_pipeline
 
 """ 
 tpcai-uc08:
@@ -94,7 +94,7 @@ model_name = f"{data_name}_t{tree_num}_d{sum(depth) // tree_num}_l{sum(leaves) /
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X, Counter())
 value_distribution(pred, model_name)
 
 # convert and save model
@@ -105,7 +105,7 @@ type_map = {
     "object": StringTensorType([None, 1]),
 }
 init_types = [(elem, type_map[X[elem].dtype.name]) for elem in input_columns]
-model_onnx = convert_sklearn(pipeline, initial_types=init_types)
+model_onnx = export_pipeline(pipeline, init_types, n_jobs=50)
 
 # optimize model
 optimized_model = onnxoptimizer.optimize(model_onnx)
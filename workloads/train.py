@@ -0,0 +1,241 @@
+import argparse
+import datetime
+import itertools
+import multiprocessing
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import onnx
+import onnxoptimizer
+import pandas as pd
+from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from utils import RETREE_WORKLOADS, export_pipeline, percentile_values, predict_chunks, value_distribution
+
+"""
+Train a grid of models for one workload from a cached feature matrix, the same
+preprocessing, split, naming and ONNX export as train_{workload}_{dt,rf}.py.
+
+The preprocessed inputs and label are written once to data/{workload}-features.parquet
+and read back by every later run (--refresh rebuilds it).
+
+python train.py -w walmart_sales -m dt -td 4 6 8 10 12 -j 5
+python train.py -w flights -m rf -tn 50 100 -td 8 10 -j 2
+"""
+
+def load_bike_sharing_demand():
+    data = pd.read_csv("data/bike_sharing_demand.csv")
+    data["hour"] = data.datetime.apply(lambda x: x.split()[1].split(":")[0]).astype("int")
+    return data
+
+def load_flights():
+    data = pd.merge(
+        pd.merge(pd.merge(pd.read_csv("data/S_routes.csv"), pd.read_csv("data/R1_airlines.csv"), how="inner"),
+                 pd.read_csv("data/R2_sairports.csv"), how="inner"),
+        pd.read_csv("data/R3_dairports.csv"),
+        how="inner",
+    )
+    data.dropna(inplace=True)
+    data["codeshare"] = data["codeshare"].replace({"f": 0, "t": 1}).astype("int")
+    return data
+
+def load_csv(path):
+    return lambda: pd.read_csv(path)
+
+def load_tpcai_uc08():
+    data = pd.read_csv("data/tpcai-uc08-train.csv")
+    for old, new in [(' ', '_'), ('/', '_'), (',', ''), ('-', ''), ('&', ''), ('1HR', 'HR')]:
+        data.columns = data.columns.str.replace(old, new)
+    return data
+
+def load_walmart_sales():
+    data = pd.merge(
+        pd.merge(pd.read_csv("data/train.csv"), pd.read_csv("data/features.csv"), on=["Store", "Date", "IsHoliday"], how="inner"),
+        pd.read_csv("data/stores.csv"),
+        on="Store",
+        how="inner",
+    )
+    data.dropna(inplace=True)
+    holidays = {
+        "Super_Bowl": ["2010-02-12", "2011-02-11", "2012-02-10"],
+        "Labor_Day": ["2010-09-10", "2011-09-09", "2012-09-07"],
+        "Thanksgiving": ["2010-11-26", "2011-11-25"],
+        "Christmas": ["2010-12-31", "2011-12-30"],
+    }
+    for holiday, dates in holidays.items():
+        data[holiday] = data["Date"].isin(dates).astype(int)
+
+    data["Date"] = pd.to_datetime(data["Date"])
+    data["week"] = data["Date"].dt.isocalendar().week
+    data["month"] = data["Date"].dt.month
+    data["year"] = data["Date"].dt.year
+    data["Type"] = data["Type"].replace({"A": 1, "B": 2, "C": 3})
+    data["IsHoliday"] = data["IsHoliday"].astype(bool).astype(int)
+    return data
+
+# label, numerical and categorical inputs, task, tensor type of int64 columns, inputs forced to float
+WORKLOADS = {
+    "bike_sharing_demand": dict(
+        load=load_bike_sharing_demand, label="count",
+        numerical=["hour", "atemp", "humidity", "windspeed"],
+        categorical=["season", "holiday", "workingday", "weather"],
+        task="reg", int64=Int64TensorType, float_inputs=["humidity"]),
+    "flights": dict(
+        load=load_flights, label="codeshare",
+        numerical=["slatitude", "slongitude", "dlatitude", "dlongitude"],
+        categorical=["active", "sdst", "ddst"],
+        task="clf", int64=Int64TensorType),
+    "medical_charges": dict(
+        load=load_csv("data/medical_charges.csv"), label="AverageTotalPayments",
+        numerical=["Total_Discharges", "Average_Covered_Charges", "Average_Medicare_Payments"],
+        task="reg", int64=FloatTensorType),
+    "nyc-taxi-green-dec-2016": dict(
+        load=load_csv("data/nyc-taxi-green-dec-2016.csv"), label="tipamount",
+        numerical=["passenger_count", "tolls_amount", "total_amount",
+                   "lpep_pickup_datetime_day", "lpep_pickup_datetime_hour", "lpep_pickup_datetime_minute",
+                   "lpep_dropoff_datetime_day", "lpep_dropoff_datetime_hour", "lpep_dropoff_datetime_minute"],
+        task="reg", int64=FloatTensorType),
+    # every column but the label is an input
+    "tpcai-uc08": dict(
+        load=load_tpcai_uc08, label="trip_type", numerical=None,
+        task="clf", int64=Int64TensorType),
+    "tpch-q9": dict(
+        load=load_csv("data/tpch-q9.csv"), label="amount",
+        numerical=["l_extendedprice", "l_discount", "ps_supplycost", "l_quantity"],
+        task="reg", int64=Int64TensorType),
+    "walmart_sales": dict(
+        load=load_walmart_sales, label="Weekly_Sales",
+        numerical=["Store", "Dept", "IsHoliday", "Fuel_Price", "MarkDown1", "MarkDown2", "MarkDown3", "Type", "Size",
+                   "Super_Bowl", "Labor_Day", "Thanksgiving", "Christmas", "week", "month", "year"],
+        task="reg", int64=FloatTensorType),
+}
+
+def load_features(workload, refresh=False):
+    # the inputs and label of a workload, preprocessed once and cached as parquet
+    spec = WORKLOADS[workload]
+    cache_path = f"data/{workload}-features.parquet"
+    if refresh or not os.path.exists(cache_path):
+        data = spec["load"]()
+        numerical = spec["numerical"] if spec["numerical"] is not None else [c for c in data.columns if c != spec["label"]]
+        columns = numerical + spec.get("categorical", []) + [spec["label"]]
+        data.loc[:, columns].to_parquet(cache_path, index=False)
+    data = pd.read_parquet(cache_path)
+    # parquet keeps pandas' nullable UInt32 of isocalendar().week, the scripts saw the same dtype
+    X = data.drop(columns=[spec["label"]])
+    y = np.array(data[spec["label"]].values)
+    return X, y
+
+def init_types(workload, X):
+    spec = WORKLOADS[workload]
+    int_type = spec["int64"]
+    type_map = {
+        "int64": int_type([None, 1]),
+        "int32": FloatTensorType([None, 1]),
+        "UInt32": FloatTensorType([None, 1]),
+        "float32": FloatTensorType([None, 1]),
+        "float64": FloatTensorType([None, 1]),
+        "object": StringTensorType([None, 1]),
+    }
+    float_inputs = spec.get("float_inputs", [])
+    return [(name, FloatTensorType([None, 1]) if name in float_inputs else type_map[X[name].dtype.name]) for name in X.columns]
+
+def build_pipeline(workload, X, model_type, tree_num, tree_depth, n_jobs):
+    spec = WORKLOADS[workload]
+    categorical = spec.get("categorical", [])
+    numerical = [c for c in X.columns if c not in categorical]
+    transformers = [("num", "passthrough", numerical)]
+    if categorical:
+        transformers.append(("cat", OneHotEncoder(handle_unknown="ignore"), categorical))
+    if spec["task"] == "reg":
+        step = "Regressor"
+        model = (DecisionTreeRegressor(max_depth=tree_depth) if model_type == "dt"
+                 else RandomForestRegressor(n_estimators=tree_num, max_depth=tree_depth, n_jobs=n_jobs))
+    else:
+        step = "Classifier"
+        model = (DecisionTreeClassifier(max_depth=tree_depth) if model_type == "dt"
+                 else RandomForestClassifier(n_estimators=tree_num, max_depth=tree_depth, n_jobs=n_jobs))
+    return Pipeline(steps=[("preprocessor", ColumnTransformer(transformers=transformers)), (step, model)])
+
+def model_name_of(workload, model, model_type, tree_num, now):
+    if model_type == "dt":
+        return f"{workload}_d{model.get_depth()}_l{model.get_n_leaves()}_n{model.tree_.node_count}_{now}"
+    depth = sum(tree.get_depth() for tree in model.estimators_) // tree_num
+    leaves = sum(tree.get_n_leaves() for tree in model.estimators_) // tree_num
+    node_count = sum(tree.tree_.node_count for tree in model.estimators_) // tree_num
+    return f"{workload}_t{tree_num}_d{depth}_l{leaves}_n{node_count}_{now}"
+
+_X = None
+_y = None
+
+def train_one(workload, model_type, tree_num, tree_depth, n_jobs, register, retree_workloads=RETREE_WORKLOADS):
+    # returns the model name and its prediction sketch (or label counts), written by the caller
+    spec = WORKLOADS[workload]
+    X_train, X_test, y_train, y_test = train_test_split(_X, _y, test_size=0.01, random_state=42)
+    pipeline = build_pipeline(workload, _X, model_type, tree_num, tree_depth, n_jobs)
+    pipeline.fit(X_train, y_train)
+    print(f"{workload} t{tree_num} d{tree_depth} score: {pipeline.score(X_test, y_test)}")
+
+    model = pipeline.steps[-1][1]
+    now = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    model_name = model_name_of(workload, model, model_type, tree_num, now)
+
+    predictions = predict_chunks(pipeline, _X, None if spec["task"] == "reg" else Counter(), n_jobs=1)
+
+    model_onnx = export_pipeline(pipeline, init_types(workload, _X), n_jobs)
+    onnx.save_model(onnxoptimizer.optimize(model_onnx), f"model/{model_name}.onnx")
+    if register:
+        with open(os.path.join(retree_workloads, "workload_models.csv"), "a", encoding="utf-8") as f:
+            f.write(f"{workload},{model_name}\n")
+    return model_name, predictions
+
+def save_predictions(workload, model_name, predictions, retree_workloads=RETREE_WORKLOADS):
+    # one process writes them all, percentile_values rewrites the workload's shared predicates.txt
+    # unless retree_workloads is None
+    if WORKLOADS[workload]["task"] == "reg":
+        percentile_values(predictions, workload, model_name, retree_workloads)
+    else:
+        value_distribution(predictions, model_name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", "-w", type=str, choices=sorted(WORKLOADS))
+    parser.add_argument("--model", "-m", type=str, choices=["dt", "rf"], default="dt")
+    parser.add_argument("--tree_num", "-tn", type=int, nargs="+", default=[100])
+    parser.add_argument("--tree_depth", "-td", type=int, nargs="+", default=[10])
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="grid configs trained at once")
+    parser.add_argument("--refresh", action="store_true", help="rebuild the cached feature matrix")
+    parser.add_argument("--register", action="store_true", help="append the models to workload_models.csv")
+    parser.add_argument("--retree_workloads", type=str, default=RETREE_WORKLOADS, help="root of workload_models.csv and {w}/predicates.txt")
+    parser.add_argument("--no_predicates", action="store_true", help="keep the workload's predicates.txt, model/{m}.txt is still written")
+    args = parser.parse_args()
+
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), args.workload))
+    os.makedirs("model", exist_ok=True)
+    _X, _y = load_features(args.workload, args.refresh)
+
+    tree_nums = args.tree_num if args.model == "rf" else [1]
+    grid = list(itertools.product(tree_nums, args.tree_depth))
+    # forest fits share the cores left over by the concurrent configs
+    n_jobs = max(1, (os.cpu_count() or 1) // args.jobs)
+    if args.jobs == 1:
+        results = [train_one(args.workload, args.model, tn, td, n_jobs, args.register, args.retree_workloads) for tn, td in grid]
+    else:
+        # forked workers see the feature matrix loaded above without copying it
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(args.jobs, mp_context=context) as pool:
+            futures = [pool.submit(train_one, args.workload, args.model, tn, td, n_jobs, args.register, args.retree_workloads) for tn, td in grid]
+            results = [future.result() for future in futures]
+    # in grid order, predicates.txt ends up with the last config's percentiles as with -j 1
+    for model_name, predictions in results:
+        save_predictions(args.workload, model_name, predictions, None if args.no_predicates else args.retree_workloads)
+    print("\n".join(model_name for model_name, _ in results))
@@ -0,0 +1,194 @@
+import argparse
+import os
+import sys
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import onnx
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from tree_model import ModelAttributes, get_tree_ensemble_node, get_tree_intervals, model_attributes
+
+"""
+Instrumented evaluation of a tree ensemble over its node arrays: the scores ORT would
+compute, plus how much work every row took, so speedups can be put down to the feature
+tests a pruned or merged model no longer does.
+
+Counters per model, appended next to the latency results in the workload's directory:
+  counters.csv           comparisons per row (mean, p50, p99, max), leaves and leaves hit
+  counters-features.csv  tests of each tree input feature per row
+  counters-leaves.csv    hits of every leaf
+
+python tree_eval.py -w walmart_sales -m <model> <model>-pruned-25000 -n 100000
+"""
+
+MODE_CODES = {b'LEAF': 0, b'BRANCH_LEQ': 1, b'BRANCH_LT': 2, b'BRANCH_GTE': 3, b'BRANCH_GT': 4, b'BRANCH_EQ': 5, b'BRANCH_NEQ': 6}
+
+class Counters:
+    def __init__(self, n_rows: int, n_nodes: int, n_features: int):
+        # comparisons made for every row, over all trees
+        self.comparisons: np.ndarray = np.zeros(n_rows, dtype=np.int64)
+        # tests of every feature, over all rows and trees
+        self.feature_tests: np.ndarray = np.zeros(n_features, dtype=np.int64)
+        # visits of every node (leaves included), in node array order
+        self.node_hits: np.ndarray = np.zeros(n_nodes, dtype=np.int64)
+
+    def summary(self, is_leaf: np.ndarray) -> Dict[str, float]:
+        return {
+            'rows': len(self.comparisons),
+            'comparisons_mean': float(self.comparisons.mean()) if len(self.comparisons) else 0.0,
+            'comparisons_p50': float(np.percentile(self.comparisons, 50)) if len(self.comparisons) else 0.0,
+            'comparisons_p99': float(np.percentile(self.comparisons, 99)) if len(self.comparisons) else 0.0,
+            'comparisons_max': int(self.comparisons.max()) if len(self.comparisons) else 0,
+            'leaves': int(is_leaf.sum()),
+            'leaves_hit': int((self.node_hits[is_leaf] > 0).sum()),
+        }
+
+def leaf_weights(attributes: ModelAttributes) -> np.ndarray:
+    # node array position -> weight of every target (class) of the leaf there
+    prefix = 'class' if 'class_ids' in attributes else 'target'
+    starts = {tree_no: start for tree_no, (start, _) in enumerate(get_tree_intervals(attributes))}
+    positions = np.array([starts[int(tree_id)] for tree_id in attributes.array(f'{prefix}_treeids')]) \
+        + attributes.array(f'{prefix}_nodeids')
+    ids = attributes.array(f'{prefix}_ids')
+    weights = np.zeros((len(attributes.array('nodes_modes')), int(ids.max()) + 1))
+    np.add.at(weights, (positions, ids), attributes.array(f'{prefix}_weights').astype(np.float64))
+    return weights
+
+class NodeArrays:
+    """The node arrays of a model's trees as evaluation reads them."""
+
+    def __init__(self, input_model):
+        self.attributes = model_attributes(input_model)
+        attributes = self.attributes
+        self.codes = np.array([MODE_CODES[mode] for mode in attributes.array('nodes_modes')], dtype=np.int8)
+        self.featureids = attributes.array('nodes_featureids')
+        self.values = attributes.array('nodes_values').astype(np.float32)
+        self.truenodeids = attributes.array('nodes_truenodeids')
+        self.falsenodeids = attributes.array('nodes_falsenodeids')
+        self.tracks_true = (attributes.array('nodes_missing_value_tracks_true') if 'nodes_missing_value_tracks_true' in attributes
+                            else np.zeros(len(self.codes), dtype=np.int64)) == 1
+        self.weights = leaf_weights(attributes)
+        self.tree_intervals = get_tree_intervals(attributes)
+
+    def leaves(self, X: np.ndarray, rows: np.ndarray, start: int, counters: 'Counters | None' = None) -> np.ndarray:
+        # node array positions of the leaves the rows of X reach in the tree rooted at start;
+        # every row descends one level per step, rows reaching a leaf drop out
+        leaves = np.empty(len(rows), dtype=np.int64)
+        indices = np.arange(len(rows))
+        positions = np.full(len(rows), start, dtype=np.int64)
+        while indices.size:
+            if counters is not None:
+                counters.node_hits += np.bincount(positions, minlength=len(self.codes))
+            branch = self.codes[positions] != 0
+            leaves[indices[~branch]] = positions[~branch]
+            indices, positions = indices[branch], positions[branch]
+            if not indices.size:
+                break
+            features = self.featureids[positions]
+            x, value, code = X[rows[indices], features], self.values[positions], self.codes[positions]
+            if counters is not None:
+                counters.comparisons[rows[indices]] += 1
+                counters.feature_tests += np.bincount(features, minlength=X.shape[1])
+            taken = np.select([code == 1, code == 2, code == 3, code == 4, code == 5],
+                              [x <= value, x < value, x >= value, x > value, x == value], x != value)
+            taken = np.where(np.isnan(x), self.tracks_true[positions], taken)
+            positions = start + np.where(taken, self.truenodeids[positions], self.falsenodeids[positions])
+        return leaves
+
+def evaluate(input_model, X: np.ndarray) -> Tuple[np.ndarray, Counters]:
+    """Scores of every row of X (the tree ensemble's input) before any post transform, and the work done.
+
+    Regressors get their prediction (aggregate_function and base_values applied),
+    classifiers the summed class weights.
+    """
+    arrays = NodeArrays(input_model)
+    attributes = arrays.attributes
+    X = np.asarray(X, dtype=np.float32)
+
+    n_rows = X.shape[0]
+    counters = Counters(n_rows, len(arrays.codes), X.shape[1])
+    scores = np.zeros((n_rows, arrays.weights.shape[1]))
+    rows = np.arange(n_rows)
+    for start, _ in arrays.tree_intervals:
+        scores += arrays.weights[arrays.leaves(X, rows, start, counters)]
+
+    node = get_tree_ensemble_node(attributes)
+    if node.op_type == 'TreeEnsembleRegressor':
+        if 'aggregate_function' in attributes and attributes['aggregate_function'].s == b'AVERAGE':
+            scores /= len(arrays.tree_intervals)
+        if 'base_values' in attributes:
+            scores += np.asarray(attributes['base_values'].floats)
+    return scores, counters
+
+def tree_input_function(model: onnx.ModelProto) -> Callable[[Dict[str, np.ndarray]], np.ndarray]:
+    # feeds -> the tensor the tree ensemble sees (after scalers, one-hot encoders, concat), from
+    # one ORT session for every batch
+    import onnxruntime as ort
+    name = get_tree_ensemble_node(model).input[0]
+    if name in [input.name for input in model.graph.input]:
+        return lambda feeds: feeds[name]
+    exposed = onnx.ModelProto()
+    exposed.CopyFrom(model)
+    exposed.graph.output.append(onnx.helper.make_empty_tensor_value_info(name))
+    session = ort.InferenceSession(exposed.SerializeToString(), providers=['CPUExecutionProvider'])
+    return lambda feeds: session.run([name], feeds)[0]
+
+def tree_inputs(model: onnx.ModelProto, feeds: Dict[str, np.ndarray]) -> np.ndarray:
+    return tree_input_function(model)(feeds)
+
+def model_feeds(model: onnx.ModelProto, data: pd.DataFrame) -> Dict[str, np.ndarray]:
+    # one [N, 1] column per graph input, typed as the input, as the UDF scripts feed ORT
+    dtypes = {onnx.TensorProto.FLOAT: np.float32, onnx.TensorProto.DOUBLE: np.float64,
+              onnx.TensorProto.INT64: np.int64, onnx.TensorProto.STRING: str}
+    feeds = {}
+    for input in model.graph.input:
+        dtype = dtypes[input.type.tensor_type.elem_type]
+        feeds[input.name] = data[input.name].to_numpy().astype(dtype).reshape((-1, 1))
+    return feeds
+
+def append_rows(path: str, header: List[str], rows: List[list]):
+    new = not os.path.exists(path)
+    with open(path, "a", encoding="utf-8") as f:
+        if new:
+            f.write(",".join(header) + "\n")
+        for row in rows:
+            f.write(",".join(str(value) for value in row) + "\n")
+
+def write_counters(output_path: str, workload: str, model_name: str, attributes: ModelAttributes, counters: Counters):
+    is_leaf = attributes.array('nodes_modes') == b'LEAF'
+    summary = counters.summary(is_leaf)
+    append_rows(os.path.join(output_path, "counters.csv"), ["workload", "model"] + list(summary),
+                [[workload, model_name] + list(summary.values())])
+    append_rows(os.path.join(output_path, "counters-features.csv"), ["workload", "model", "feature_id", "tests_per_row"],
+                [[workload, model_name, feature_id, tests / summary['rows']]
+                 for feature_id, tests in enumerate(counters.feature_tests.tolist()) if tests])
+    treeids, nodeids = attributes.array('nodes_treeids'), attributes.array('nodes_nodeids')
+    append_rows(os.path.join(output_path, "counters-leaves.csv"), ["workload", "model", "tree", "node", "hits"],
+                [[workload, model_name, int(treeids[i]), int(nodeids[i]), int(counters.node_hits[i])]
+                 for i in np.flatnonzero(is_leaf)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", "-w", type=str, required=True)
+    parser.add_argument("--models", "-m", type=str, nargs="+", required=True, help="models evaluated on the same sample")
+    parser.add_argument("--rows", "-n", type=int, default=100000, help="sampled rows of the workload data")
+    parser.add_argument("--data", type=str, default=None, help="default the feature cache of train.py")
+    parser.add_argument("--output", "-o", type=str, default=None, help="default next to the Retree latency results")
+    args = parser.parse_args()
+
+    workload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.workload)
+    data = pd.read_parquet(args.data or os.path.join(workload_path, "data", f"{args.workload}-features.parquet"))
+    data = data.sample(n=min(args.rows, len(data)), random_state=0)
+    output_path = args.output or f"/volumn/Retree_exp/queries/Retree/workloads/{args.workload}"
+    os.makedirs(output_path, exist_ok=True)
+
+    for model_name in args.models:
+        model = onnx.load(os.path.join(workload_path, "model", f"{model_name}.onnx"))
+        attributes = model_attributes(model)
+        _, counters = evaluate(attributes, tree_inputs(model, model_feeds(model, data)))
+        write_counters(output_path, args.workload, model_name, attributes, counters)
+        summary = counters.summary(attributes.array('nodes_modes') == b'LEAF')
+        print(f"{model_name}: {summary['comparisons_mean']:.2f} comparisons per row (p99 {summary['comparisons_p99']:.0f}), "
+              f"{summary['leaves_hit']}/{summary['leaves']} leaves hit")
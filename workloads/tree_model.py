@@ -0,0 +1,382 @@
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+import onnx
+from onnx import numpy_helper
+
+"""
+ONNX tree ensemble attributes and the Node trees built from them, shared by the
+training utils and the query-side analysis (queries/Smart).
+"""
+
+# per-node and per-leaf attributes of TreeEnsembleRegressor / TreeEnsembleClassifier
+TREE_ENSEMBLE_FIELDS = [
+    'nodes_falsenodeids', 'nodes_featureids', 'nodes_hitrates', 'nodes_missing_value_tracks_true', 'nodes_modes',
+    'nodes_nodeids', 'nodes_treeids', 'nodes_truenodeids', 'nodes_values',
+    'target_ids', 'target_nodeids', 'target_treeids', 'target_weights',
+    'class_ids', 'class_nodeids', 'class_treeids', 'class_weights',
+]
+
+def array_attribute(name: str, values: np.ndarray) -> onnx.AttributeProto:
+    # fill the repeated field from one tolist() instead of make_attribute's per-item checks
+    attribute = onnx.AttributeProto(name=name)
+    if values.dtype.kind in 'SO':
+        attribute.type = onnx.AttributeProto.STRINGS
+        attribute.strings.extend(values.tolist())
+    elif values.dtype.kind == 'f':
+        attribute.type = onnx.AttributeProto.FLOATS
+        attribute.floats.extend(values.tolist())
+    else:
+        attribute.type = onnx.AttributeProto.INTS
+        attribute.ints.extend(values.tolist())
+    return attribute
+
+def get_attribute(onnx_model, attr_name):
+    for node in onnx_model.graph.node:
+        for attr in node.attribute:
+            if attr.name == attr_name:
+                return attr
+    raise KeyError(f'no node of the model has attribute {attr_name}')
+
+class ModelAttributes:
+    """The attributes of every node of a model, indexed by name once.
+
+    Repeated fields are read into NumPy arrays on first use and cached, so slicing a
+    tree out of them is a view rather than a copy of the protobuf container.
+    """
+
+    def __init__(self, onnx_model: onnx.ModelProto):
+        self.model: onnx.ModelProto = onnx_model
+        self.attributes: Dict[str, onnx.AttributeProto] = {}
+        for node in onnx_model.graph.node:
+            for attr in node.attribute:
+                # the first node carrying a name wins, as with get_attribute
+                self.attributes.setdefault(attr.name, attr)
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def __contains__(self, attr_name: str) -> bool:
+        return attr_name in self.attributes
+
+    def __getitem__(self, attr_name: str) -> onnx.AttributeProto:
+        if attr_name not in self.attributes:
+            raise KeyError(f'no node of the model has attribute {attr_name}')
+        return self.attributes[attr_name]
+
+    def array(self, attr_name: str) -> np.ndarray:
+        if attr_name not in self.arrays:
+            attr = self[attr_name]
+            if attr.type == onnx.AttributeProto.INTS:
+                values = np.fromiter(attr.ints, dtype=np.int64, count=len(attr.ints))
+            elif attr.type == onnx.AttributeProto.FLOATS:
+                values = np.fromiter(attr.floats, dtype=np.float32, count=len(attr.floats))
+            elif attr.type == onnx.AttributeProto.STRINGS:
+                values = np.array(list(attr.strings), dtype=object)
+            elif attr.type == onnx.AttributeProto.TENSOR:
+                values = numpy_helper.to_array(attr.t)
+            else:
+                raise TypeError(f'attribute {attr_name} is not a repeated field')
+            self.arrays[attr_name] = values
+        return self.arrays[attr_name]
+
+def model_attributes(input_model: 'onnx.ModelProto | ModelAttributes') -> ModelAttributes:
+    return input_model if isinstance(input_model, ModelAttributes) else ModelAttributes(input_model)
+
+
+def get_tree_ensemble_node(input_model) -> onnx.NodeProto:
+    for node in model_attributes(input_model).model.graph.node:
+        if node.op_type in ('TreeEnsembleClassifier', 'TreeEnsembleRegressor'):
+            return node
+    raise ValueError('model has no TreeEnsemble node')
+
+def replace_attributes(input_model, arrays: Dict[str, np.ndarray]) -> onnx.ModelProto:
+    # a copy of the model with the named attributes of its tree ensemble set to arrays
+    output_model = onnx.ModelProto()
+    output_model.CopyFrom(model_attributes(input_model).model)
+    node = get_tree_ensemble_node(output_model)
+    kept = [attribute for attribute in node.attribute if attribute.name not in arrays]
+    del node.attribute[:]
+    node.attribute.extend(kept)
+    node.attribute.extend(array_attribute(field, values) for field, values in arrays.items())
+    return output_model
+
+def bypass_branches(input_model, taken: Callable[[int, int], int]) -> onnx.ModelProto:
+    """The model with every branch replaced by the node taken(start, id) returns for it.
+
+    taken gets the node array position of a tree's root and a node id of that tree and
+    returns the id of the node evaluation may skip to (id itself to keep the branch).
+    Nodes no longer reachable are dropped and the rest renumbered in depth-first order.
+    """
+    attributes = model_attributes(input_model)
+    prefix = 'class' if get_tree_ensemble_node(attributes).op_type == 'TreeEnsembleClassifier' else 'target'
+    modes = attributes.array('nodes_modes')
+    truenodeids = attributes.array('nodes_truenodeids')
+    falsenodeids = attributes.array('nodes_falsenodeids')
+    leaf_treeids = attributes.array(f'{prefix}_treeids')
+    leaf_nodeids = attributes.array(f'{prefix}_nodeids')
+
+    kept_nodes, kept_leaves, true_ids, false_ids = [], [], [], []
+    for tree_no, (start, end) in enumerate(get_tree_intervals(attributes)):
+        order, children = [], {}
+        stack = [taken(start, 0)]
+        while stack:
+            id = stack.pop()
+            order.append(id)
+            if modes[start + id] != b'LEAF':
+                children[id] = (taken(start, int(truenodeids[start + id])), taken(start, int(falsenodeids[start + id])))
+                stack.extend(reversed(children[id]))
+        new_ids = np.full(end - start, -1)
+        new_ids[order] = np.arange(len(order))
+        kept_nodes.append(start + np.array(order))
+        true_ids.append(np.array([new_ids[children[id][0]] if id in children else 0 for id in order]))
+        false_ids.append(np.array([new_ids[children[id][1]] if id in children else 0 for id in order]))
+        leaves = np.flatnonzero(leaf_treeids == tree_no)
+        kept_leaves.append(leaves[new_ids[leaf_nodeids[leaves]] >= 0])
+    kept_nodes, kept_leaves = np.concatenate(kept_nodes), np.concatenate(kept_leaves)
+
+    arrays = {field: attributes.array(field)[kept_nodes] for field in TREE_ENSEMBLE_FIELDS
+              if field.startswith('nodes_') and field in attributes}
+    arrays['nodes_nodeids'] = np.concatenate([np.arange(len(ids)) for ids in true_ids])
+    arrays['nodes_truenodeids'] = np.concatenate(true_ids)
+    arrays['nodes_falsenodeids'] = np.concatenate(false_ids)
+    for field in TREE_ENSEMBLE_FIELDS:
+        if field.startswith(f'{prefix}_'):
+            arrays[field] = attributes.array(field)[kept_leaves]
+    # leaf node ids of the new trees, kept_nodes lists every tree in order
+    new_ids = {(int(tree_id), int(node_id)): i for tree_id, node_id, i in
+               zip(arrays['nodes_treeids'], attributes.array('nodes_nodeids')[kept_nodes], arrays['nodes_nodeids'])}
+    arrays[f'{prefix}_nodeids'] = np.array([new_ids[(int(tree_id), int(node_id))] for tree_id, node_id in
+                                            zip(arrays[f'{prefix}_treeids'], leaf_nodeids[kept_leaves])], dtype=np.int64)
+    return replace_attributes(attributes, arrays)
+
+
+class Node:
+    def __init__(
+            self,
+            id,  # 节点id
+            feature_id,  # 特征id
+            mode,  # 节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
+            value,  # 阈值，叶子节点的值为0
+            target_id,  # 叶子节点的taget id
+            target_weight,  # 叶子节点的权重，即预测值
+            samples  # 节点的样本数
+            ):
+        self.id: int = id
+        self.feature_id: int = feature_id
+        self.mode: bytes = mode
+        self.value: float = value
+        self.target_id: int | None = target_id
+        self.target_weight: float | None = target_weight
+        self.samples: int = samples
+        
+        self.parent: 'Node' | None = None
+        self.left: 'Node' | None = None
+        self.right: 'Node' | None  = None
+
+    def branch_samples(self) -> int:
+        samples = self.samples
+        
+        if self.left is not None:
+            samples += self.left.branch_samples()
+        if self.right is not None:
+            samples += self.right.branch_samples()
+        
+        return samples
+    
+    def cost(self, alpha: float) -> float:
+        if self.mode == b'LEAF':
+            return self.samples
+
+        return self.left.cost(alpha) + self.right.cost(alpha) + alpha * self.left.samples  + self.right.samples
+
+    def same_feature_branch_samples(self) -> int:
+        samples = self.samples
+        
+        if self.left is not None:
+            if self.left.mode == b'LEAF' or self.left.feature_id != self.feature_id:
+                samples += self.left.samples
+            else:
+                samples += self.left.same_feature_branch_samples()
+        if self.right is not None:
+            if self.right.mode == b'LEAF' or self.right.feature_id != self.feature_id:
+                samples += self.right.samples
+            else:
+                samples += self.right.same_feature_branch_samples()
+        
+        return samples
+
+    # 重置权重
+    def replace_samples(self) -> int:
+        if self.mode == b'LEAF':
+            self.samples = 1
+            return self.samples
+
+        self.samples = self.left.replace_samples() + self.right.replace_samples()
+        return self.samples
+    
+    def update_samples(self) -> int:
+        if self.mode == b'LEAF':
+            return self.samples
+
+        self.samples = self.left.update_samples() + self.right.update_samples()
+        return self.samples
+
+    def get_samples_list(self, samples_list: List[int]):
+        samples_list.append(self.samples)
+        if self.mode != b'LEAF':
+            self.left.get_samples_list(samples_list)
+            self.right.get_samples_list(samples_list)
+
+    def check_samples(self):
+        if self.mode != b'LEAF':
+            legal = (self.left.samples + self.right.samples == self.samples)
+            if not legal:
+                raise ValueError(f'samples not match: {self.left.samples} + {self.right.samples} != {self.samples}')
+            self.left.check_samples() 
+            self.right.check_samples()
+
+    def max_depth_to_leaf(self) -> int:
+        if self.mode == b'LEAF':
+            return 0
+
+        return 1 + max(self.left.max_depth_to_leaf(), self.right.max_depth_to_leaf())
+    
+    def tosql_v1(self, features: List[str]) -> str:
+        sql = ''
+        if self.mode == b'LEAF':
+            sql += f'{self.target_weight:.6f}'
+        else:
+            if self.left.samples > self.right.samples:
+                sql += f'CASE WHEN {features[self.feature_id]} <= {self.value:.6f} THEN {self.left.tosql_v1(features)} ELSE {self.right.tosql_v1(features)} END'
+            else:
+                sql += f'CASE WHEN {features[self.feature_id]} > {self.value:.6f} THEN {self.right.tosql_v1(features)} ELSE {self.left.tosql_v1(features)} END'
+        return sql
+
+    def tosql(self, features: List[str]) -> str:
+        if self.mode == b'LEAF':
+            return f'{self.target_weight}'
+
+        sql = ''
+        if self.mode != b'LEAF':
+            sql_l = self.left.tosql(features)
+            if sql_l == '1':
+                sql = f'{features[self.feature_id]} <= {self.value:.6f}'
+            elif sql_l not in ['', '0']:
+                sql = f'{features[self.feature_id]} <= {self.value:.6f} AND ({sql_l})'
+
+            sql_r = self.right.tosql(features)
+            if sql_r == '1':
+                if sql != '':
+                    sql = f'({sql}) OR {features[self.feature_id]} > {self.value:.6f}'
+                else:
+                    sql = f'{features[self.feature_id]} > {self.value:.6f}'
+            elif sql_r not in ['', '0']:
+                if sql != '':
+                    sql = f'({sql}) OR ({features[self.feature_id]} > {self.value:.6f} AND ({sql_r}))'
+                else:
+                    sql = f'{features[self.feature_id]} > {self.value:.6f} AND ({sql_r})'
+
+            return sql
+
+    def toEchartsJSON(self) -> dict:
+        if self.mode == b'LEAF':
+            return {
+                'name': f'{self.target_weight:.3f}',
+                'collapsed': False
+            }
+        
+        return {
+            'name': f'x{self.feature_id} <= {self.value:.3f}',
+            'collapsed': False,
+            'children': [
+                self.left.toEchartsJSON(),
+                self.right.toEchartsJSON()
+            ]
+        }
+
+
+def get_target_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
+    # target_treeids is ordered
+    target_treeids = model_attributes(onnx_model).array('target_treeids')
+    return treeids_intervals(target_treeids)
+
+def get_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
+    # nodes_treeids is ordered
+    nodes_treeids = model_attributes(onnx_model).array('nodes_treeids')
+    return treeids_intervals(nodes_treeids)
+
+def treeids_intervals(treeids: np.ndarray) -> List[Tuple[int, int]]:
+    roots = np.flatnonzero(np.diff(treeids, prepend=-1) != 0)
+    ends = np.append(roots[1:], len(treeids))
+    return [(int(root), int(end)) for root, end in zip(roots, ends)]
+
+def model2trees(input_model, samples_list: 'List[int] | None') -> 'List[Node]':
+    attributes = model_attributes(input_model)
+    tree_intervals = get_tree_intervals(attributes)
+    target_tree_intervals = get_target_tree_intervals(attributes)
+    trees = []
+    for tree_no, tree_interval in enumerate(tree_intervals):
+        root = model2tree(attributes, samples_list, 0, None, tree_interval, target_tree_intervals[tree_no])
+        trees.append(root)
+    return trees
+
+def model2tree(input_model, samples_list: 'List[int] | None', node_id, parent: 'Node | None', 
+               tree_interval: 'Tuple[int, int] | None' = None, target_tree_interval: 'Tuple[int, int] | None' = None) -> 'Node':
+    attributes = model_attributes(input_model)
+    if tree_interval is None:
+        tree_interval = (0, len(attributes.array('nodes_treeids')))
+    tree_start, tree_end = tree_interval
+
+    if target_tree_interval is None:
+        target_tree_interval = (0, len(attributes.array('target_treeids')))
+    target_tree_start, target_tree_end = target_tree_interval
+
+    # input model attributes, views of the tree
+    # # nodes_falsenodeids: 右侧分支
+    input_nodes_falsenodeids = attributes.array('nodes_falsenodeids')[tree_start:tree_end]
+    # # nodes_featureids: 特征id
+    input_nodes_featureids = attributes.array('nodes_featureids')[tree_start:tree_end]
+    # # nodes_hitrates
+    input_nodes_hitrates = attributes.array('nodes_hitrates')[tree_start:tree_end]
+    # # nodes_modes：节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
+    input_node_modes = attributes.array('nodes_modes')[tree_start:tree_end]
+    # # nodes_truenodeids: 左侧分支
+    input_nodes_truenodeids = attributes.array('nodes_truenodeids')[tree_start:tree_end]
+    # # nodes_values: 阈值，叶子节点的值为0
+    input_nodes_values = attributes.array('nodes_values')[tree_start:tree_end]
+    # # target_nodeids: 叶子节点的id
+    input_target_nodeids = attributes.array('target_nodeids')[target_tree_start:target_tree_end]
+    # # target_weights: 叶子节点的权重，即预测值
+    input_target_weights = attributes.array('target_weights')[target_tree_start:target_tree_end]
+
+    # node_id -> target_id
+    input_target_nodeid_map = {int(node_id): i for i, node_id in enumerate(input_target_nodeids)}
+
+    # only for debug
+    tree_samples_list = samples_list[tree_start:tree_end] if samples_list is not None else None
+
+    def build(id: int, parent: 'Node | None') -> 'Node':
+        mode = input_node_modes[id]
+        target_id = input_target_nodeid_map.get(id, None)
+        target_weight = float(input_target_weights[target_id]) if target_id is not None else None
+        samples = int(input_nodes_hitrates[id])
+
+        if tree_samples_list is not None and samples != tree_samples_list[id]:
+            raise ValueError(f'samples not match: {samples} != {tree_samples_list[id]}')
+
+        node = Node(
+            id=id,
+            feature_id=int(input_nodes_featureids[id]),
+            mode=mode,
+            value=float(input_nodes_values[id]),
+            target_id=target_id,
+            target_weight=target_weight,
+            samples=samples
+        )
+        node.parent = parent
+
+        if mode != b'LEAF':
+            node.left = build(int(input_nodes_truenodeids[id]), node)
+            node.right = build(int(input_nodes_falsenodeids[id]), node)
+
+        return node
+
+    return build(node_id, parent)
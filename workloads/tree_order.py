@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+from typing import Tuple
+
+import numpy as np
+import onnx
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from tree_eval import NodeArrays, append_rows, leaf_weights, model_feeds, tree_inputs
+from tree_model import get_target_tree_intervals, get_tree_ensemble_node, get_tree_intervals, model_attributes, replace_attributes
+
+"""
+Tree order of a TreeEnsembleRegressor for early termination of the `predict(...) > t`
+predicates: the trees are sorted by the variance of their contribution, highest first,
+and the model carries, after every prefix of them, the least and most the trees left can
+still add. A row is decided once the predicate holds, or fails, at both bounds of its
+partial sum, so on thresholds far in the tails (the 1% and 99% of predicates.txt) most
+rows stop after a few trees.
+
+The variance of a tree is that of its leaf weights over nodes_hitrates, the training
+samples, or the production hits of a hit_profile.py profiled model. The bounds are in
+the model metadata (early_exit_bounds, JSON); early_exit evaluates with them in NumPy.
+
+python tree_order.py -w walmart_sales -m <model> -n 100000
+"""
+
+METADATA_KEY = 'early_exit_bounds'
+OPERATORS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal}
+
+def tree_leaf_ranges(input_model) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # per tree: variance of its contribution over the hits of its leaves, least and most leaf weight
+    attributes = model_attributes(input_model)
+    node = get_tree_ensemble_node(attributes)
+    if node.op_type != 'TreeEnsembleRegressor' or ('n_targets' in attributes and attributes['n_targets'].i != 1):
+        raise ValueError('tree order needs a single-target TreeEnsembleRegressor')
+    weights = leaf_weights(attributes)[:, 0]
+    is_leaf = attributes.array('nodes_modes') == b'LEAF'
+    hitrates = attributes.array('nodes_hitrates').astype(np.float64) if 'nodes_hitrates' in attributes else np.ones(len(is_leaf))
+    variances, minimums, maximums = [], [], []
+    for start, end in get_tree_intervals(attributes):
+        leaves = start + np.flatnonzero(is_leaf[start:end])
+        hits = hitrates[leaves] if hitrates[leaves].sum() > 0 else np.ones(len(leaves))
+        mean = np.average(weights[leaves], weights=hits)
+        variances.append(np.average((weights[leaves] - mean) ** 2, weights=hits))
+        minimums.append(weights[leaves].min())
+        maximums.append(weights[leaves].max())
+    return np.array(variances), np.array(minimums), np.array(maximums)
+
+def remaining_bounds(input_model) -> Tuple[np.ndarray, np.ndarray]:
+    """Least and most the trees after each prefix of the model can add, from its metadata if ordered.
+
+    Entry k is the bound of trees k.. in model order, the last one (all trees done) is 0.
+    """
+    attributes = model_attributes(input_model)
+    for entry in attributes.model.metadata_props:
+        if entry.key == METADATA_KEY:
+            bounds = json.loads(entry.value)
+            return np.array(bounds['remaining_min']), np.array(bounds['remaining_max'])
+    _, minimums, maximums = tree_leaf_ranges(attributes)
+    return np.append(np.cumsum(minimums[::-1])[::-1], 0.0), np.append(np.cumsum(maximums[::-1])[::-1], 0.0)
+
+def order_trees(input_model) -> onnx.ModelProto:
+    """The model with its trees sorted by contribution variance and the remaining-sum bounds as metadata."""
+    attributes = model_attributes(input_model)
+    variances, minimums, maximums = tree_leaf_ranges(attributes)
+    order = np.argsort(-variances, kind='stable')
+
+    arrays = {}
+    for prefix, intervals in (('nodes', get_tree_intervals(attributes)), ('target', get_target_tree_intervals(attributes))):
+        positions = np.concatenate([np.arange(*intervals[tree_no]) for tree_no in order])
+        for attr in get_tree_ensemble_node(attributes).attribute:
+            if attr.name.startswith(f'{prefix}_'):
+                arrays[attr.name] = attributes.array(attr.name)[positions]
+        # tree ids follow the new order
+        arrays[f'{prefix}_treeids'] = np.repeat(np.arange(len(order)), [intervals[tree_no][1] - intervals[tree_no][0] for tree_no in order])
+
+    output_model = replace_attributes(attributes, arrays)
+    bounds = {
+        'tree_order': order.tolist(),
+        'variance': variances[order].tolist(),
+        'remaining_min': np.append(np.cumsum(minimums[order][::-1])[::-1], 0.0).tolist(),
+        'remaining_max': np.append(np.cumsum(maximums[order][::-1])[::-1], 0.0).tolist(),
+    }
+    kept = [entry for entry in output_model.metadata_props if entry.key != METADATA_KEY]
+    del output_model.metadata_props[:]
+    output_model.metadata_props.extend(kept)
+    output_model.metadata_props.add(key=METADATA_KEY, value=json.dumps(bounds))
+    return output_model
+
+def early_exit(input_model, X: np.ndarray, threshold: float, operator: str = '>') -> Tuple[np.ndarray, np.ndarray]:
+    """Whether the prediction of every row of X (the tree ensemble's input) satisfies `operator threshold`,
+    and the trees evaluated for it, stopping once the remaining-sum bounds decide the row.
+    """
+    arrays = NodeArrays(input_model)
+    attributes = arrays.attributes
+    remaining_min, remaining_max = remaining_bounds(attributes)
+    compare = OPERATORS[operator]
+    n_trees = len(arrays.tree_intervals)
+    scale = 1.0 / n_trees if 'aggregate_function' in attributes and attributes['aggregate_function'].s == b'AVERAGE' else 1.0
+    base = float(attributes['base_values'].floats[0]) if 'base_values' in attributes else 0.0
+    X = np.asarray(X, dtype=np.float32)
+
+    partial = np.zeros(X.shape[0])
+    decisions = np.zeros(X.shape[0], dtype=bool)
+    trees_evaluated = np.zeros(X.shape[0], dtype=np.int64)
+    rows = np.arange(X.shape[0])
+    for k, (start, _) in enumerate(arrays.tree_intervals):
+        if not rows.size:
+            break
+        partial[rows] += arrays.weights[arrays.leaves(X, rows, start), 0]
+        trees_evaluated[rows] += 1
+        # the predicate is monotone in the prediction, so it is decided once both bounds agree
+        low = compare((partial[rows] + remaining_min[k + 1]) * scale + base, threshold)
+        high = compare((partial[rows] + remaining_max[k + 1]) * scale + base, threshold)
+        decided = low == high
+        decisions[rows[decided]] = low[decided]
+        rows = rows[~decided]
+    return decisions, trees_evaluated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", "-w", type=str, required=True)
+    parser.add_argument("--model", "-m", type=str, required=True)
+    parser.add_argument("--rows", "-n", type=int, default=100000, help="sampled rows of the workload data")
+    parser.add_argument("--data", type=str, default=None, help="default the feature cache of train.py")
+    parser.add_argument("--output", "-o", type=str, default=None, help="default next to the Retree latency results")
+    args = parser.parse_args()
+
+    workload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.workload)
+    model = onnx.load(os.path.join(workload_path, "model", f"{args.model}.onnx"))
+    ordered = order_trees(model)
+    onnx.save(ordered, os.path.join(workload_path, "model", f"{args.model}-ordered.onnx"))
+
+    data = pd.read_parquet(args.data or os.path.join(workload_path, "data", f"{args.workload}-features.parquet"))
+    data = data.sample(n=min(args.rows, len(data)), random_state=0)
+    X = tree_inputs(model, model_feeds(model, data))
+    predicates_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "queries", "PythonUDF", "workloads",
+                                   args.workload, "predicates.txt")
+    with open(predicates_path, "r", encoding="utf-8") as f:
+        predicates = [line.strip() for line in f if line.strip()]
+    output_path = args.output or f"/volumn/Retree_exp/queries/Retree/workloads/{args.workload}"
+    os.makedirs(output_path, exist_ok=True)
+
+    rows = []
+    n_trees = len(get_tree_intervals(model))
+    for predicate in predicates:
+        _, unordered_trees = early_exit(model, X, float(predicate))
+        decisions, ordered_trees = early_exit(ordered, X, float(predicate))
+        rows.append([args.workload, args.model, predicate, n_trees, unordered_trees.mean(), ordered_trees.mean(),
+                     np.percentile(ordered_trees, 99), decisions.mean()])
+        print(f"{args.model} > {predicate}: {ordered_trees.mean():.1f} of {n_trees} trees per row "
+              f"({unordered_trees.mean():.1f} unordered), selectivity {decisions.mean():.2%}")
+    append_rows(os.path.join(output_path, "early-exit.csv"),
+                ["workload", "model", "predicate", "trees", "trees_mean_unordered", "trees_mean", "trees_p99", "selectivity"], rows)
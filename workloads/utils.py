@@ -1,298 +1,272 @@
+import contextlib
+import itertools
+import multiprocessing
+import os
+import sys
 import numpy as np
-from collections import Counter
-from matplotlib import pyplot as plt
-from sklearn.tree import DecisionTreeRegressor, DecisionTreeClassifier, plot_tree
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from pyecharts import options as opts
-from pyecharts.charts import Tree
-from typing import List, Tuple
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
 import onnx
 from onnx import helper
 import onnx.checker
-
-def get_attribute(onnx_model, attr_name):
-    i = 0
-    while 1:
-        attributes = onnx_model.graph.node[i].attribute
-        for attr in attributes:
-            if attr.name == attr_name:
-                return attr
-        i += 1
-
-def plot_value_distribution(data, filename):
-    sorted_data = np.sort(data)
-
-    x = np.arange(len(sorted_data))
-    plt.scatter(x, sorted_data, marker="o")
-
-    plt.title("Value Distribution")
-    plt.ylabel("value")
-
-    plt.savefig(f"model/{filename}.png")
-    plt.close()
-
-def plot_hist(data, filename):
-    plt.hist(data, bins=20, edgecolor="black")
-
-    plt.title("Histogram of Random Data")
-    plt.xlabel("Value")
-    plt.ylabel("Frequency")
-
-    plt.savefig(f"model/{filename}_hist.png")
-    plt.close()
-
-def percentile_values(data, workload, filename):
-    sorted_data = np.sort(data)
+from tree_model import (
+    TREE_ENSEMBLE_FIELDS, ModelAttributes, Node, array_attribute, get_attribute, get_target_tree_intervals,
+    get_tree_intervals, model2tree, model2trees, model_attributes, treeids_intervals,
+)
+
+class QuantileSketch:
+    """Streaming quantiles of predictions fed chunk by chunk.
+
+    Level h holds items of weight 2**h. A level over capacity is sorted and every
+    other item (random offset) moves up one level, so memory stays around
+    capacity * log2(count / capacity) values. Up to capacity values the sketch is exact.
+    """
+
+    def __init__(self, capacity: int = 1 << 14, seed: int = 0):
+        self.capacity: int = capacity
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.count: int = 0
+        self.min: float = float('inf')
+        self.max: float = float('-inf')
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values) -> 'QuantileSketch':
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity:
+                items = np.sort(items)
+                # an odd item stays behind so no weight is lost
+                rest = items[len(items) - len(items) % 2:]
+                promoted = items[self.rng.integers(2):len(items) - len(rest):2]
+                self.levels[level] = rest
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        # sorted items and their cumulative weights
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def percentile(self, percentiles) -> np.ndarray:
+        if len(self.levels) == 1:
+            return np.percentile(self.levels[0], percentiles)
+        values, cumulative = self.weighted()
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1]
+        return values[np.searchsorted(cumulative, ranks, side="left").clip(0, len(values) - 1)]
+
+    def cdf(self, x) -> np.ndarray:
+        # fraction of values <= x
+        values, cumulative = self.weighted()
+        i = np.searchsorted(values, x, side="right")
+        return np.where(i > 0, cumulative[np.maximum(i - 1, 0)], 0.0) / cumulative[-1]
+
+    def histogram(self, bins: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        edges = np.linspace(self.min, self.max, bins + 1)
+        below = self.cdf(edges[1:])
+        below[-1] = 1.0
+        return np.diff(np.concatenate([[0.0], below])) * self.count, edges
+
+def as_sketch(data) -> QuantileSketch:
+    return data if isinstance(data, QuantileSketch) else QuantileSketch().update(data)
+
+# where the Retree driver reads workload_models.csv and {workload}/predicates.txt
+RETREE_WORKLOADS = "/volumn/Retree_exp/queries/Retree/workloads"
+
+def percentile_values(data, workload, filename, retree_workloads: 'str | None' = RETREE_WORKLOADS):
+    # data is the prediction vector or a QuantileSketch fed while predicting; without
+    # retree_workloads the shared predicates.txt of the workload is left alone
+    sketch = as_sketch(data)
     percentiles_1 = np.arange(1, 101)
     percentiles_10 = [1, 2, 3, 4, 5, 95, 96, 97, 98, 99]
 
     with open(f"model/{filename}.txt", "w", encoding="utf-8") as f:
-        values = [f"{round(np.percentile(sorted_data, p), 3)}" for p in percentiles_1]
-        f.write("\n".join(values))
-    with open(f"/volumn/Retree_exp/queries/Retree/workloads/{workload}/predicates.txt", "w", encoding="utf-8") as f:
-        values = [f"{round(np.percentile(sorted_data, p), 3)}" for p in percentiles_10]
+        values = [f"{round(value, 3)}" for value in sketch.percentile(percentiles_1)]
         f.write("\n".join(values))
+    if retree_workloads is not None:
+        with open(os.path.join(retree_workloads, workload, "predicates.txt"), "w", encoding="utf-8") as f:
+            values = [f"{round(value, 3)}" for value in sketch.percentile(percentiles_10)]
+            f.write("\n".join(values))
 
 def value_distribution(data, filename):
-    counter = Counter(data)
+    # data is the predicted labels or a Counter fed while predicting
+    counter = data if isinstance(data, Counter) else Counter(data)
+    total = sum(counter.values())
     with open(f"model/{filename}.txt", "w", encoding="utf-8") as f:
         for item, count in counter.items():
-            f.write(f"{item}: {(count/data.shape[0])*100}%\n")
-
-def plot_feature_importances_v1(model, shape, filename):
-    importances = model.feature_importances_
-    std = np.std([tree.feature_importances_ for tree in model.estimators_], axis=0)
-    indices = np.argsort(importances)[::-1]
-
-    # Plotting the feature importances of the forest
-    plt.figure()
-    plt.title("Feature importances")
-    plt.bar(
-        range(shape), importances[indices], color="r", yerr=std[indices], align="center"
-    )
-    plt.xticks(range(shape), indices)
-    plt.xlim([-1, shape])
-
-    plt.savefig(f"model/{filename}_feature_importances.png")
-    plt.close()
-
-def plot_feature_importances(model, shape, filename):
-    n_features = 0
-    features = []
-    
-    if type(model) is DecisionTreeClassifier or type(model) is DecisionTreeRegressor:
-        n_features = model.tree_.n_features
-        features = list(model.tree_.feature)
-    
-    elif type(model) is RandomForestClassifier or type(model) is RandomForestRegressor:
-        for tree in model.estimators_:
-            n_features = tree.tree_.n_features
-            features += list(tree.tree_.feature)
+            f.write(f"{item}: {(count/total)*100}%\n")
+
+# worker processes of predict_chunks, each on its own cores
+PREDICT_JOBS = 4
+
+_chunk_pipeline = None
+
+def _init_chunk_worker(pipeline):
+    global _chunk_pipeline
+    # the pool already spreads chunks over the cores, a forest's own n_jobs would oversubscribe them
+    pipeline.set_params(**{name: 1 for name in pipeline.get_params() if name.endswith("n_jobs")})
+    _chunk_pipeline = pipeline
+
+def _predict_chunk(chunk):
+    return _chunk_pipeline.predict(chunk)
+
+@contextlib.contextmanager
+def _main_not_reimported():
+    # spawned workers re-run the calling script as __mp_main__ unless it has no path to
+    # import from, and the train_*.py scripts have no __main__ guard
+    main = sys.modules["__main__"]
+    saved = {name: main.__dict__.pop(name) for name in ("__file__",) if name in main.__dict__}
+    try:
+        yield
+    finally:
+        main.__dict__.update(saved)
+
+def predict_chunks(pipeline, X, sink=None, chunk_size: int = 1 << 18, n_jobs: 'int | None' = None):
+    """Predict X chunk by chunk and stream the predictions into sink.
+
+    sink is a QuantileSketch (default) for regressors or a Counter for class
+    labels, so the full prediction vector is never materialized. Chunks run in a
+    pool of n_jobs (default PREDICT_JOBS) single-threaded processes holding one
+    copy of the pipeline each, at most 2 * n_jobs chunks in flight.
+    """
+    sink = QuantileSketch() if sink is None else sink
+    n_jobs = n_jobs or min(PREDICT_JOBS, os.cpu_count() or 1)
+    chunks = (X.iloc[start:start + chunk_size] if hasattr(X, "iloc") else X[start:start + chunk_size]
+              for start in range(0, len(X), chunk_size))
+
+    def consume(pred):
+        if isinstance(sink, Counter):
+            sink.update(np.asarray(pred).reshape(-1).tolist())
+        else:
+            sink.update(pred)
+
+    if n_jobs == 1 or len(X) <= chunk_size:
+        for chunk in chunks:
+            consume(pipeline.predict(chunk))
+        return sink
+
+    # the caller has started joblib/OpenMP threads by now, forking it could deadlock a
+    # worker, so workers come from a fork server that preloads this module only
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    with _main_not_reimported(), \
+            ProcessPoolExecutor(n_jobs, mp_context=context, initializer=_init_chunk_worker, initargs=(pipeline,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_predict_chunk, chunk))
+            if len(pending) >= 2 * n_jobs:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+    return sink
+
+def tree_arrays(tree, tree_no: int, n_trees: int, classifier: bool) -> Dict[str, np.ndarray]:
+    # TreeEnsemble attributes of one fitted sklearn tree_, node ids are sklearn's
+    n_nodes = tree.node_count
+    is_leaf = tree.children_left == -1
+    leaves = np.flatnonzero(is_leaf)
+    # skl2onnx stores thresholds as the largest float32 not above the float64 one, so
+    # a float input equal to the threshold takes the same branch as in sklearn
+    thresholds = tree.threshold.astype(np.float32)
+    thresholds = np.where(thresholds > tree.threshold, np.nextafter(thresholds, np.float32(-np.inf)), thresholds)
+    arrays = {
+        'nodes_falsenodeids': np.where(is_leaf, 0, tree.children_right),
+        'nodes_featureids': np.where(is_leaf, 0, tree.feature),
+        # hitrates carry the training samples per node, as from_tree writes them
+        'nodes_hitrates': tree.n_node_samples.astype(np.float64),
+        'nodes_missing_value_tracks_true': np.zeros(n_nodes, dtype=np.int64),
+        'nodes_modes': np.where(is_leaf, b'LEAF', b'BRANCH_LEQ'),
+        'nodes_nodeids': np.arange(n_nodes),
+        'nodes_treeids': np.full(n_nodes, tree_no),
+        'nodes_truenodeids': np.where(is_leaf, 0, tree.children_left),
+        'nodes_values': np.where(is_leaf, np.float32(0), thresholds),
+    }
+    if not classifier:
+        arrays.update({
+            'target_ids': np.zeros(len(leaves), dtype=np.int64),
+            'target_nodeids': leaves,
+            'target_treeids': np.full(len(leaves), tree_no),
+            'target_weights': tree.value[leaves, 0, 0] / n_trees,
+        })
+        return arrays
+    value = tree.value[leaves, 0, :]
+    value = value / value.sum(axis=1, keepdims=True)
+    # a binary classifier only keeps the weight of the positive class
+    if value.shape[1] == 2:
+        value = value[:, 1:]
+    n_classes = value.shape[1]
+    arrays.update({
+        'class_ids': np.tile(np.arange(n_classes), len(leaves)),
+        'class_nodeids': np.repeat(leaves, n_classes),
+        'class_treeids': np.full(len(leaves) * n_classes, tree_no),
+        'class_weights': value.reshape(-1) / n_trees,
+    })
+    return arrays
+
+def export_pipeline(pipeline, initial_types, n_jobs: int = 1) -> onnx.ModelProto:
+    """convert_sklearn for a fitted tree / forest pipeline without converting the trees.
+
+    The preprocessing is converted with a one-leaf stand-in for the final
+    estimator, whose TreeEnsemble attributes are then replaced by the ones read
+    from the tree_ arrays (per tree in a thread pool with n_jobs > 1).
+    """
+    # sklearn and skl2onnx take seconds to import, only exporting needs them
+    from sklearn.base import is_classifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+    from skl2onnx import convert_sklearn
+
+    name, model = pipeline.steps[-1]
+    classifier = is_classifier(model)
+    trees = [estimator.tree_ for estimator in model.estimators_] if hasattr(model, 'estimators_') else [model.tree_]
+
+    stand_in = (DecisionTreeClassifier() if classifier else DecisionTreeRegressor())
+    labels = model.classes_ if classifier else np.array([0.0, 1.0])
+    stand_in.fit(np.zeros((len(labels), model.n_features_in_)), labels)
+    stand_in_onnx = convert_sklearn(Pipeline(pipeline.steps[:-1] + [(name, stand_in)]), initial_types=initial_types)
+
+    build = lambda tree_no: tree_arrays(trees[tree_no], tree_no, len(trees), classifier)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(n_jobs) as pool:
+            per_tree = list(pool.map(build, range(len(trees))))
     else:
-        raise Exception("???")
-    
-    xy = dict(Counter(features))
-    del xy[-2]
-
-    # Plotting the feature importances of the forest
-    plt.figure()
-    plt.title("Feature frequency")
-    plt.bar(
-        xy.keys(), xy.values(), color="r", align="center"
-    )
-    # plt.xticks(range(shape), indices)
-    # plt.xlim([-1, shape])
-
-    plt.savefig(f"model/{filename}_feature_frequency.png")
-    plt.close()
-
-def plot_sklearn_tree(model, model_name, input_columns, y_test):
-    plt.figure(figsize=(30, 20))
-    # plt.figure()
-    plot_tree(model, filled=True, feature_names=input_columns, class_names=list(map(str, list(set(y_test)))), rounded=True)
-    plt.savefig(f"model/{model_name}.pdf", dpi=1000)
-    plt.close()
-
-def plot_tree_charts(model, model_name):
-    trees = model2trees(model, None)
-
-    data = trees[0].toEchartsJSON()
-
-    c = (
-        Tree(
-            init_opts=opts.InitOpts(
-                width="100%",
-                height="2000px",
-            ),
-        )
-        .add(
-            f"{model_name}",
-            [data],
-            pos_top="10%",
-            pos_left="10%",
-            pos_bottom="10%",
-            pos_right="10%",
-            is_roam=True,
-            collapse_interval=0,
-            orient="LR",
-            label_opts=opts.LabelOpts(
-                position="top",
-                horizontal_align="right",
-                vertical_align="middle",
-                rotate=0,
-            ),
-        )
-        .set_global_opts(
-            title_opts=opts.TitleOpts(title="Tree"),
-            datazoom_opts=opts.DataZoomOpts(is_zoom_on_mouse_wheel="alt"),
-        )
-        .render(f"{model_name}.html")
-    )
-
-
-class Node:
-    def __init__(
-            self,
-            id,  # 节点id
-            feature_id,  # 特征id
-            mode,  # 节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
-            value,  # 阈值，叶子节点的值为0
-            target_id,  # 叶子节点的taget id
-            target_weight,  # 叶子节点的权重，即预测值
-            samples  # 节点的样本数
-            ):
-        self.id: int = id
-        self.feature_id: int = feature_id
-        self.mode: bytes = mode
-        self.value: float = value
-        self.target_id: int | None = target_id
-        self.target_weight: float | None = target_weight
-        self.samples: int = samples
-        
-        self.parent: 'Node' | None = None
-        self.left: 'Node' | None = None
-        self.right: 'Node' | None  = None
+        per_tree = [build(tree_no) for tree_no in range(len(trees))]
 
-    def branch_samples(self) -> int:
-        samples = self.samples
-        
-        if self.left is not None:
-            samples += self.left.branch_samples()
-        if self.right is not None:
-            samples += self.right.branch_samples()
-        
-        return samples
-    
-    def cost(self, alpha: float) -> float:
-        if self.mode == b'LEAF':
-            return self.samples
-
-        return self.left.cost(alpha) + self.right.cost(alpha) + alpha * self.left.samples  + self.right.samples
-
-    def same_feature_branch_samples(self) -> int:
-        samples = self.samples
-        
-        if self.left is not None:
-            if self.left.mode == b'LEAF' or self.left.feature_id != self.feature_id:
-                samples += self.left.samples
-            else:
-                samples += self.left.same_feature_branch_samples()
-        if self.right is not None:
-            if self.right.mode == b'LEAF' or self.right.feature_id != self.feature_id:
-                samples += self.right.samples
-            else:
-                samples += self.right.same_feature_branch_samples()
-        
-        return samples
-
-    # 重置权重
-    def replace_samples(self) -> int:
-        if self.mode == b'LEAF':
-            self.samples = 1
-            return self.samples
-
-        self.samples = self.left.replace_samples() + self.right.replace_samples()
-        return self.samples
-    
-    def update_samples(self) -> int:
-        if self.mode == b'LEAF':
-            return self.samples
-
-        self.samples = self.left.update_samples() + self.right.update_samples()
-        return self.samples
-
-    def get_samples_list(self, samples_list: List[int]):
-        samples_list.append(self.samples)
-        if self.mode != b'LEAF':
-            self.left.get_samples_list(samples_list)
-            self.right.get_samples_list(samples_list)
-
-    def check_samples(self):
-        if self.mode != b'LEAF':
-            legal = (self.left.samples + self.right.samples == self.samples)
-            if not legal:
-                raise ValueError(f'samples not match: {self.left.samples} + {self.right.samples} != {self.samples}')
-            self.left.check_samples() 
-            self.right.check_samples()
-
-    def max_depth_to_leaf(self) -> int:
-        if self.mode == b'LEAF':
-            return 0
-
-        return 1 + max(self.left.max_depth_to_leaf(), self.right.max_depth_to_leaf())
-    
-    def tosql_v1(self, features: List[str]) -> str:
-        sql = ''
-        if self.mode == b'LEAF':
-            sql += f'{self.target_weight:.6f}'
-        else:
-            if self.left.samples > self.right.samples:
-                sql += f'CASE WHEN {features[self.feature_id]} <= {self.value:.6f} THEN {self.left.tosql_v1(features)} ELSE {self.right.tosql_v1(features)} END'
-            else:
-                sql += f'CASE WHEN {features[self.feature_id]} > {self.value:.6f} THEN {self.right.tosql_v1(features)} ELSE {self.left.tosql_v1(features)} END'
-        return sql
-
-    def tosql(self, features: List[str]) -> str:
-        if self.mode == b'LEAF':
-            return f'{self.target_weight}'
-
-        sql = ''
-        if self.mode != b'LEAF':
-            sql_l = self.left.tosql(features)
-            if sql_l == '1':
-                sql = f'{features[self.feature_id]} <= {self.value:.6f}'
-            elif sql_l not in ['', '0']:
-                sql = f'{features[self.feature_id]} <= {self.value:.6f} AND ({sql_l})'
-
-            sql_r = self.right.tosql(features)
-            if sql_r == '1':
-                if sql != '':
-                    sql = f'({sql}) OR {features[self.feature_id]} > {self.value:.6f}'
-                else:
-                    sql = f'{features[self.feature_id]} > {self.value:.6f}'
-            elif sql_r not in ['', '0']:
-                if sql != '':
-                    sql = f'({sql}) OR ({features[self.feature_id]} > {self.value:.6f} AND ({sql_r}))'
-                else:
-                    sql = f'{features[self.feature_id]} > {self.value:.6f} AND ({sql_r})'
-
-            return sql
-
-    def toEchartsJSON(self) -> dict:
-        if self.mode == b'LEAF':
-            return {
-                'name': f'{self.target_weight:.3f}',
-                'collapsed': False
-            }
-        
-        return {
-            'name': f'x{self.feature_id} <= {self.value:.3f}',
-            'collapsed': False,
-            'children': [
-                self.left.toEchartsJSON(),
-                self.right.toEchartsJSON()
-            ]
-        }
+    for node in stand_in_onnx.graph.node:
+        if node.op_type in ('TreeEnsembleRegressor', 'TreeEnsembleClassifier'):
+            kept = [attribute for attribute in node.attribute if attribute.name not in TREE_ENSEMBLE_FIELDS]
+            del node.attribute[:]
+            node.attribute.extend(kept)
+            node.attribute.extend(array_attribute(field, np.concatenate([arrays[field] for arrays in per_tree]))
+                                  for field in per_tree[0])
+    return stand_in_onnx
 
 class TreeEnsembleRegressor:
     def __init__(self):
@@ -363,20 +337,9 @@ class TreeEnsembleRegressor:
         regressors = [TreeEnsembleRegressor.from_tree(root, tree_no) for tree_no, root in enumerate(roots)]
         regressor = TreeEnsembleRegressor()
 
-        for r in regressors:
-            regressor.nodes_falsenodeids.extend(r.nodes_falsenodeids)
-            regressor.nodes_featureids.extend(r.nodes_featureids)
-            regressor.nodes_hitrates.extend(r.nodes_hitrates)
-            regressor.nodes_missing_value_tracks_true.extend(r.nodes_missing_value_tracks_true)
-            regressor.nodes_modes.extend(r.nodes_modes)
-            regressor.nodes_nodeids.extend(r.nodes_nodeids)
-            regressor.nodes_treeids.extend(r.nodes_treeids)
-            regressor.nodes_truenodeids.extend(r.nodes_truenodeids)
-            regressor.nodes_values.extend(r.nodes_values)
-            regressor.target_ids.extend(r.target_ids)
-            regressor.target_nodeids.extend(r.target_nodeids)
-            regressor.target_treeids.extend(r.target_treeids)
-            regressor.target_weights.extend(r.target_weights)
+        for field in TREE_ENSEMBLE_FIELDS:
+            if hasattr(regressor, field):
+                setattr(regressor, field, list(itertools.chain.from_iterable(getattr(r, field) for r in regressors)))
 
         return regressor
 
@@ -418,131 +381,3 @@ class TreeEnsembleRegressor:
         if not is_leaf:
             TreeEnsembleRegressor.from_tree_internal(regressor, node.left, tree_no)
             TreeEnsembleRegressor.from_tree_internal(regressor, node.right, tree_no)
-
-def get_target_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
-    target_tree_roots: List[int] = []
-    # target_treeids is ordered
-    target_treeids = get_attribute(onnx_model, 'target_treeids').ints
-    next_tree_id = 0
-    for i, tree_id in enumerate(target_treeids):
-        if tree_id == next_tree_id:
-            next_tree_id += 1
-            target_tree_roots.append(i)
-
-    target_tree_intervals: List[Tuple[int, int]] = []
-    for i, root in enumerate(target_tree_roots):
-        if i == len(target_tree_roots) - 1:
-            end = len(target_treeids)
-        else:
-            end = target_tree_roots[i + 1]
-        target_tree_intervals.append((root, end))
-    return target_tree_intervals
-
-def get_tree_intervals(onnx_model) -> List[Tuple[int, int]]:
-    tree_roots: List[int] = []
-    # nodes_treeids is ordered
-    nodes_treeids = get_attribute(onnx_model, 'nodes_treeids').ints
-    next_tree_id = 0
-    for i, tree_id in enumerate(nodes_treeids):
-        if tree_id == next_tree_id:
-            next_tree_id += 1
-            tree_roots.append(i)
-
-    tree_intervals: List[Tuple[int, int]] = []
-    for i, root in enumerate(tree_roots):
-        if i == len(tree_roots) - 1:
-            end = len(nodes_treeids)
-        else:
-            end = tree_roots[i + 1]
-        tree_intervals.append((root, end))
-    return tree_intervals
-
-def model2trees(input_model, samples_list: 'List[int] | None') -> 'List[Node]':
-    tree_intervals = get_tree_intervals(input_model)
-    target_tree_intervals = get_target_tree_intervals(input_model)
-    trees = []
-    for tree_no, tree_interval in enumerate(tree_intervals):
-        root = model2tree(input_model, samples_list, 0, None, tree_interval, target_tree_intervals[tree_no])
-        trees.append(root)
-    return trees
-
-def model2tree(input_model, samples_list: 'List[int] | None', node_id, parent: 'Node | None', 
-               tree_interval: 'Tuple[int, int] | None' = None, target_tree_interval: 'Tuple[int, int] | None' = None) -> 'Node':
-    if tree_interval is None:
-        tree_interval = (0, len(get_attribute(input_model, 'nodes_treeids').ints))
-    tree_start, tree_end = tree_interval
-
-    if target_tree_interval is None:
-        target_tree_interval = (0, len(get_attribute(input_model, 'target_treeids').ints))
-    target_tree_start, target_tree_end = target_tree_interval
-
-    # input model attributes
-    # # n_targets
-    input_n_targets = get_attribute(input_model, 'n_targets').i
-    # # nodes_falsenodeids: 右侧分支
-    input_nodes_falsenodeids = get_attribute(input_model, 'nodes_falsenodeids').ints[tree_start:tree_end]
-    # # nodes_featureids: 特征id
-    input_nodes_featureids = get_attribute(input_model, 'nodes_featureids').ints[tree_start:tree_end]
-    # # nodes_hitrates
-    input_nodes_hitrates = get_attribute(input_model, 'nodes_hitrates').floats[tree_start:tree_end]
-    # # nodes_missing_value_tracks_true
-    input_nodes_missing_value_tracks_true = get_attribute(input_model, 'nodes_missing_value_tracks_true').ints[tree_start:tree_end]
-    # # nodes_modes：节点类型，LEAF表示叶子节点，BRANCH_LEQ表示非叶子节点
-    input_node_modes = get_attribute(input_model, 'nodes_modes').strings[tree_start:tree_end]
-    # # nodes_nodeids
-    input_nodes_nodeids = get_attribute(input_model, 'nodes_nodeids').ints[tree_start:tree_end]
-    # # nodes_treeids
-    input_nodes_treeids = get_attribute(input_model, 'nodes_treeids').ints[tree_start:tree_end]
-    # # nodes_truenodeids: 左侧分支
-    input_nodes_truenodeids = get_attribute(input_model, 'nodes_truenodeids').ints[tree_start:tree_end]
-    # # nodes_values: 阈值，叶子节点的值为0
-    input_nodes_values = get_attribute(input_model, 'nodes_values').floats[tree_start:tree_end]
-    # # post_transform
-    input_post_transform = get_attribute(input_model, 'post_transform').s
-    # # target_ids
-    input_target_ids = get_attribute(input_model, 'target_ids').ints[target_tree_start:target_tree_end]
-    # # target_nodeids: 叶子节点的id
-    input_target_nodeids = get_attribute(input_model, 'target_nodeids').ints[target_tree_start:target_tree_end]
-    # # target_treeids
-    input_target_treeids = get_attribute(input_model, 'target_treeids').ints[target_tree_start:target_tree_end]
-    # # target_weights: 叶子节点的权重，即预测值
-    input_target_weights = get_attribute(input_model, 'target_weights').floats[target_tree_start:target_tree_end]
-
-    # node_id -> target_id
-    input_target_nodeid_map = {node_id: i for i, node_id in enumerate(input_target_nodeids)}
-
-    id = node_id
-    feature_id = input_nodes_featureids[id]
-    mode = input_node_modes[id]
-    value = input_nodes_values[id]
-    target_id = input_target_nodeid_map.get(id, None)
-    target_weight = input_target_weights[target_id] if target_id is not None else None
-    samples = int(input_nodes_hitrates[id])
-    
-    # only for debug
-    if samples_list is not None:
-        tree_samples_list = samples_list[tree_start:tree_end]
-        if samples != tree_samples_list[id]:
-            raise ValueError(f'samples not match: {samples} != {tree_samples_list[id]}')
-    
-    node = Node(
-        id=id,
-        feature_id=feature_id,
-        mode=mode,
-        value=value,
-        target_id=target_id,
-        target_weight=target_weight,
-        samples=samples
-    )
-    node.parent = parent
-    
-    if mode != b'LEAF':
-        left_node_id = input_nodes_truenodeids[id]
-        left_node = model2tree(input_model, samples_list, left_node_id, node, tree_interval, target_tree_interval)
-        node.left = left_node
-
-        right_node_id = input_nodes_falsenodeids[id]
-        right_node = model2tree(input_model, samples_list, right_node_id, node, tree_interval, target_tree_interval)
-        node.right = right_node
-
-    return node
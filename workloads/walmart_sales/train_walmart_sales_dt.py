@@ -17,7 +17,8 @@ import os
 from sklearn.tree import DecisionTreeRegressor
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import percentile_values, plot_sklearn_tree, plot_tree_charts, plot_feature_importances, plot_value_distribution, value_distribution
+from utils import percentile_values, value_distribution, predict_chunks
+from plotting import plot_sklearn_tree, plot_tree_charts, plot_feature_importances, plot_value_distribution
 
 def wmae_test(test, pred): # WMAE for test 
     weights = X_test['IsHoliday'].apply(lambda is_holiday:5 if is_holiday else 1)
@@ -186,7 +187,7 @@ model_name = f"{data_name}_d{depth}_l{leaves}_n{node_count}_{now}"
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X)
 # plot_sklearn_tree(model, model_name, input_columns, y_test)
 # plot_value_distribution(pred, model_name)
 percentile_values(pred, data_name, model_name)
@@ -9,7 +9,6 @@ from sklearn.preprocessing import OneHotEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from skl2onnx import convert_sklearn
 from onnxconverter_common import FloatTensorType, Int64TensorType, StringTensorType
 import joblib
 
@@ -17,7 +16,8 @@ import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from utils import percentile_values, plot_feature_importances, plot_value_distribution, value_distribution
+from utils import percentile_values, value_distribution, predict_chunks, export_pipeline
+from plotting import plot_feature_importances, plot_value_distribution
 
 def wmae_test(test, pred): # WMAE for test 
     weights = X_test['IsHoliday'].apply(lambda is_holiday:5 if is_holiday else 1)
@@ -208,7 +208,7 @@ joblib.dump(pipeline, f"model/{model_name}.joblib")
 onnx_path = f"model/{model_name}.onnx"
 
 # save model pred distribution
-pred = pipeline.predict(X)
+pred = predict_chunks(pipeline, X)
 plot_value_distribution(pred, model_name)
 percentile_values(pred, data_name, model_name)
 
@@ -223,7 +223,7 @@ type_map = {
     "object": StringTensorType([None, 1]),
 }
 init_types = [(elem, type_map[X[elem].dtype.name]) for elem in input_columns]
-model_onnx = convert_sklearn(pipeline, initial_types=init_types)
+model_onnx = export_pipeline(pipeline, init_types, n_jobs=50)
 
 # optimize model
 optimized_model = onnxoptimizer.optimize(model_onnx)